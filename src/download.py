@@ -1,5 +1,8 @@
+import multiprocessing
 import os
+from lib.ftp import compression
 from lib.ftp.args_client import args_client
+from lib.ftp.partial_file import PART_SUFFIX, PartialFile
 from lib.selective_repeat.sr_socket import SRSocket
 from lib.stop_and_wait.saw_socket import SAWSocket
 from lib.rdt_listener.rdt_listener import SELECTIVE_REPEAT, STOP_AND_WAIT
@@ -10,9 +13,26 @@ ENDIANESS = "little"
 BYTES_READ = 60000
 CONFIRM_DOWNLOAD_HEADER = 2
 ERROR_HEADER = 4
+# Respuesta a la descarga de un rango: tamaño del archivo, su versión (ver
+# file_version()), largo del rango y codec con el que se manda
+CONFIRM_RANGE_HEADER = 8
 UNKNOWN_TYPE_ERROR = 0
 FILE_NOT_FOUND_ERROR = 1
-TYPE = b"\x01"
+INVALID_RANGE_ERROR = 2
+# Descarga de un rango: desde lo que ya se tiene hasta el final
+TYPE = b"\x06"
+# Veces que se intenta la descarga. Si se corta se reconecta y se sigue
+# desde lo que ya se bajó (ver PartialFile)
+ATTEMPTS = 3
+# Con --parallel, primer rango que se pide (por una sola conexión) para
+# saber el tamaño del archivo. Si el archivo entra, no se abren más
+PROBE_SIZE = 1024 * 1024
+
+
+# El servidor rechazó el rango pedido: el archivo es más chico que el
+# offset (por ejemplo se achicó desde la descarga anterior)
+class InvalidRange(Exception):
+    pass
 
 
 def download(
@@ -23,6 +43,9 @@ def download(
     endianess,
     bytes_read,
     method=SELECTIVE_REPEAT,
+    parallel=1,
+    codec="none",
+    level=compression.DEFAULT_LEVEL,
 ):
 
     FILENAME_BYTES = filename.encode()
@@ -31,7 +54,91 @@ def download(
     logger.debug(f"filename length: {str(len(FILENAME_BYTES))}")
 
     ADDR = (host, int(port))
+    CODEC = compression.select(codec, filename)
+    logger.debug(f"requested codec: {CODEC}")
+    # En el header el codec y su nivel van antes del nombre
+    NAME = bytes((CODEC, level)) + FILENAME_LEN + FILENAME_BYTES
+
+    if not os.path.exists(filepath):
+        os.makedirs(filepath)
+
+    if parallel > 1:
+        parallel_download(
+            ADDR,
+            os.path.join(filepath, filename),
+            NAME,
+            endianess,
+            bytes_read,
+            method,
+            parallel,
+        )
+        return
+
+    for attempt in range(ATTEMPTS):
+        try:
+            if download_from_offset(
+                ADDR,
+                os.path.join(filepath, filename),
+                NAME,
+                endianess,
+                bytes_read,
+                method,
+            ):
+                return
+        except Exception as e:
+            logger.warning(f"download interrupted (attempt {attempt}): {e}")
+    logger.error("download failed")
+
+
+# Pide el archivo desde lo que quedó de una descarga anterior. Devuelve
+# False si hay que volver a intentar
+def download_from_offset(addr, path, name, endianess, bytes_read, method):
+    offset = PartialFile.saved_offset(path)
+
+    client = connect(addr, method)
+
+    try:
+        # length 0: hasta el final del archivo
+        try:
+            response = request_range(client, name, offset, 0, endianess)
+        except InvalidRange as e:
+            if not offset:
+                raise
+            # Lo que había ya no sirve, y si se deja se vuelve a pedir
+            # el mismo rango en cada intento
+            logger.warning(f"{e}, restarting download")
+            PartialFile.discard(path)
+            return False
+        if response is None:
+            return True
+        file_size, version, length, codec = response
+
+        partial = PartialFile(path, file_size, version)
+        if partial.open() != offset:
+            # El archivo cambió en el servidor desde la descarga anterior:
+            # la parte que había se descartó y se pide de nuevo entero
+            logger.warning("file changed in the server, restarting download")
+            partial.close()
+            return False
+        if offset:
+            logger.info(f"resuming download from byte {offset}")
 
+        logger.debug("downloading body")
+        try:
+            receive_body(client, codec, length, partial.write, bytes_read)
+            partial.finish()
+        finally:
+            # Si se cortó, lo bajado queda para retomarla
+            partial.close()
+        logger.debug("body download finished")
+        return True
+    finally:
+        logger.info("closing socket")
+        client.close()
+        logger.debug("socket closed")
+
+
+def connect(addr, method):
     logger.info("creating socket")
     if method == SELECTIVE_REPEAT:
         client = SRSocket()
@@ -41,54 +148,245 @@ def download(
         raise Exception("Invalid transport method")
 
     logger.info("conecting to server")
-    client.connect(ADDR)
+    client.connect(addr)
+    return client
 
+
+# Pide length bytes desde offset (name lleva el codec pedido y el nombre
+# del archivo). Devuelve el tamaño y la versión del archivo, el largo del
+# rango que va a mandar el servidor y el codec con que lo manda, o None si
+# el servidor respondió con un error. Si el error es el rango, levanta
+# InvalidRange
+def request_range(client, name, offset, length, endianess):
     logger.info("sending message")
     logger.debug("sending header")
-    # send header
-    client.send(TYPE + FILENAME_LEN + FILENAME_BYTES)
+    client.send(
+        TYPE
+        + offset.to_bytes(8, byteorder=endianess)
+        + length.to_bytes(8, byteorder=endianess)
+        + name
+    )
 
-    type_byte = client.recv(1)
+    type_byte = client.recv_exact(1)
     type = int.from_bytes(type_byte, byteorder=ENDIANESS)
 
     if type == ERROR_HEADER:
-        error_byte = client.recv(1)
+        error_byte = client.recv_exact(1)
         error = int.from_bytes(error_byte, byteorder=ENDIANESS)
         if error == FILE_NOT_FOUND_ERROR:
-            logger.error(f"the file {filename} was not found in the server")
+            logger.error("the file was not found in the server")
+        elif error == INVALID_RANGE_ERROR:
+            raise InvalidRange(
+                f"invalid range: offset {offset}, length {length}"
+            )
         else:
             logger.error("unknown error")
-        logger.debug("closing socket")
-        client.close()
         logger.error("exiting")
-        return
+        return None
 
-    if type != CONFIRM_DOWNLOAD_HEADER:
+    if type != CONFIRM_RANGE_HEADER:
         logger.error("wrong packet type")
-        return
+        return None
 
     logger.debug("reading file length")
-    file_size_bytes = client.recv(8)
+    file_size = int.from_bytes(client.recv_exact(8), byteorder=endianess)
+    version = int.from_bytes(client.recv_exact(8), byteorder=endianess)
+    length = int.from_bytes(client.recv_exact(8), byteorder=endianess)
+    codec = client.recv_exact(1)[0]
+    logger.debug(
+        f"file size: {str(file_size)}, range: {str(length)}, codec: {codec}"
+    )
+    return file_size, version, length, codec
 
-    file_size = int.from_bytes(file_size_bytes, byteorder=endianess)
-    logger.debug(f"file size: {str(file_size)}")
 
-    logger.debug("downloading body")
+# Recibe los length bytes del cuerpo (comprimidos con codec) y se los
+# pasa a write
+def receive_body(client, codec, length, write, bytes_read):
+    if codec == compression.NONE:
+        while length > 0:
+            data = client.recv(min(bytes_read, length))
+            write(data)
+            length -= len(data)
+        return
 
-    if not os.path.exists(filepath):
-        os.makedirs(filepath)
+    received = 0
+
+    def count(data):
+        nonlocal received
+        write(data)
+        received += len(data)
+
+    compression.receive_compressed(client, codec, count, length)
+    if received != length:
+        raise EOFError(f"expected {length} bytes, received {received}")
+
+
+# Baja el archivo partido en rangos, cada uno por su propia conexión y
+# desde su propio proceso (un SRSocket no pasa de lo que da su packet
+# handler, y entre threads se repartirían el GIL). Cada proceso escribe
+# su rango con pwrite() en path + PART_SUFFIX, que se reserva entero
+# antes de empezar. Un rango que se corta se retoma desde lo que llegó,
+# pero si la descarga falla no queda nada para retomarla en otra
+# ejecución
+def parallel_download(
+    addr, path, name, endianess, bytes_read, method, parallel
+):
+    part_path = path + PART_SUFFIX
+    # Lo que pudiera haber de una descarga secuencial anterior no sirve:
+    # el .part se va a llenar en otro orden
+    PartialFile.discard(path)
+
+    client = connect(addr, method)
+    try:
+        response = request_range(client, name, 0, PROBE_SIZE, endianess)
+        if response is None:
+            return
+        file_size, version, length, codec = response
+        with open(part_path, "wb") as file:
+            allocate(file.fileno(), file_size)
+            receive_body(client, codec, length, file.write, bytes_read)
+    except Exception as e:
+        logger.error(f"download failed: {e}")
+        return
+    finally:
+        client.close()
+
+    ranges = split_ranges(length, file_size, parallel)
+    logger.info(f"downloading {file_size} bytes in {len(ranges)} ranges")
+
+    # Los procesos se crean recién con el tamaño del archivo. fork, así
+    # heredan la configuración de loguru
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=range_worker,
+            args=(
+                addr,
+                name,
+                part_path,
+                offset,
+                size,
+                file_size,
+                version,
+                endianess,
+                bytes_read,
+                method,
+            ),
+            name=f"range-{i}",
+        )
+        for i, (offset, size) in enumerate(ranges)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    if any(process.exitcode != 0 for process in processes):
+        logger.error("download failed")
+        return
+    with open(part_path, "rb+") as file:
+        os.fsync(file.fileno())
+    os.replace(part_path, path)
+    logger.info("parallel download finished")
+
+
+# Divide [start, end) en hasta parts rangos contiguos (offset, largo)
+def split_ranges(start, end, parts):
+    total = end - start
+    if total <= 0:
+        return []
+    parts = min(parts, total)
+    ranges = []
+    for i in range(parts):
+        offset = start + total * i // parts
+        ranges.append((offset, start + total * (i + 1) // parts - offset))
+    return ranges
+
+
+# Reserva size bytes para el archivo, así los rangos se escriben en su
+# lugar sin que el archivo crezca de a pedazos
+def allocate(fd, size):
+    if hasattr(os, "posix_fallocate") and size:
+        os.posix_fallocate(fd, 0, size)
+    else:
+        os.ftruncate(fd, size)
+
+
+# Proceso de parallel_download(): termina con 0 si bajó su rango entero
+def range_worker(*args):
+    sys.exit(0 if fetch_range(*args) else 1)
+
+
+# Baja [offset, offset + length) en part_path. Si la conexión se corta,
+# vuelve a pedir lo que falta del rango
+def fetch_range(
+    addr,
+    name,
+    part_path,
+    offset,
+    length,
+    file_size,
+    version,
+    endianess,
+    bytes_read,
+    method,
+):
+    fd = os.open(part_path, os.O_WRONLY)
+    received = 0
 
-    counter = 0
-    with open(os.path.join(filepath, filename), "wb") as file:
-        while counter < file_size:
-            data = client.recv(bytes_read)
-            file.write(data)
-            counter += len(data)
-    logger.debug("body download finished")
+    # Con compresión la llama el thread que descomprime
+    def write(data):
+        nonlocal received
+        os.pwrite(fd, data, offset + received)
+        received += len(data)
 
-    logger.info("closing socket")
-    client.close()
-    logger.debug("socket closed")
+    try:
+        for attempt in range(ATTEMPTS):
+            # Si llegó todo y se cortó después (antes del frame vacío o
+            # al cerrar), no hay que pedir nada más: un largo 0 sería
+            # hasta el final del archivo
+            if received == length:
+                return True
+            try:
+                client = connect(addr, method)
+                try:
+                    response = request_range(
+                        client,
+                        name,
+                        offset + received,
+                        length - received,
+                        endianess,
+                    )
+                    if response is None:
+                        return False
+                    if response[:3] != (
+                        file_size,
+                        version,
+                        length - received,
+                    ):
+                        logger.error("file changed in the server")
+                        return False
+                    receive_body(
+                        client,
+                        response[3],
+                        length - received,
+                        write,
+                        bytes_read,
+                    )
+                    return True
+                finally:
+                    client.close()
+            except InvalidRange:
+                logger.error("file changed in the server")
+                return False
+            except Exception as e:
+                logger.warning(
+                    f"range [{offset}, {offset + length}) interrupted"
+                    f" (attempt {attempt}): {e}"
+                )
+        return False
+    finally:
+        os.close(fd)
 
 
 if __name__ == "__main__":
@@ -117,4 +415,7 @@ if __name__ == "__main__":
         ENDIANESS,
         BYTES_READ,
         method=SELECTIVE_REPEAT,
+        parallel=args.parallel,
+        codec=args.compression,
+        level=args.level,
     )
@@ -0,0 +1,20 @@
+# --- CONSTANTES ---
+
+# Bytes pendientes de enviar en una conexión a partir de los cuales se le
+# pide a la aplicación que deje de escribir (pause_writing), y debajo de
+# los cuales se le avisa que puede seguir (resume_writing)
+WRITE_HIGH_WATER = 4 * 1024 * 1024
+WRITE_LOW_WATER = 1024 * 1024
+
+# Segundos sin recibir nada del otro extremo a partir de los cuales se da
+# la conexión por muerta (desapareció sin cerrar) y se termina, igual que
+# hace el reaper de MuxDemuxListener con las conexiones con threads
+IDLE_TIMEOUT = 60
+
+# --- CONSTANTES DE ESTADOS ---
+# Además de los de selective_repeat/constants.py
+
+# Se mandó el FIN y se espera el FINACK
+FIN_SENT = "FIN_SENT"
+# La conexión terminó (se avisó connection_lost)
+FINISHED = "FINISHED"
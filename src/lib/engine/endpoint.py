@@ -0,0 +1,200 @@
+from loguru import logger
+
+from lib.mux_demux.batch_receiver import BatchReceiver
+from lib.mux_demux.buggy_udp import BuggyUDPSocket
+from lib.mux_demux.cookie import CookieClient, CookieIssuer, strip_cookie
+from lib.mux_demux.header import (
+    encode_header,
+    extract_packet,
+    new_connection_id,
+)
+from lib.mux_demux.mux_demux_stream import PACKET_SIZE
+from lib.selective_repeat.packet import CONNECT, Packet
+from .sr_connection import SRConnection
+
+
+# Un socket UDP registrado en el loop, con las conexiones que pasan por
+# él indexadas por connection ID. Reemplaza a MuxDemuxListener/Stream (y a sus
+# threads de envío y recepción) cuando se usa el Engine
+class Endpoint:
+    def __init__(self, engine, udp_socket, protocol_factory=None):
+        self.engine = engine
+        self.socket = udp_socket
+        self.receiver = BatchReceiver(udp_socket, PACKET_SIZE)
+        # Si no es None se aceptan conexiones nuevas (CONNECT con un
+        # connection ID desconocido y una cookie válida) y se les da un
+        # protocolo nuevo
+        self.protocol_factory = protocol_factory
+        # Por connection ID: la conexión y la dirección a la que se envía
+        # (la del último paquete que la hizo avanzar, ver PeerPath)
+        self.connections = {}
+        self.addresses = {}
+        # Handshake con cookie (ver cookie.py): del lado que acepta se
+        # responde sin estado, del cliente hay un CookieClient por conexión
+        self.cookies = CookieIssuer() if protocol_factory else None
+        self.cookie_clients = {}
+        self.closed = False
+        engine.loop.add_reader(self.receiver.socket, self.__read)
+
+    def sender(self, connection_id):
+        if self.protocol_factory is None:
+            cookie = CookieClient(connection_id)
+            self.cookie_clients[connection_id] = cookie
+
+            def send(parts):
+                for datagram in cookie.wrap(parts):
+                    self.__send(datagram, self.addresses[connection_id])
+
+            return send
+
+        header = encode_header(connection_id)
+
+        def send(parts):
+            self.__send((header, *parts), self.addresses[connection_id])
+
+        return send
+
+    def __send(self, buffers, addr):
+        try:
+            self.socket.sendmsg(buffers, addr)
+        except BlockingIOError:
+            # El buffer de envío del kernel está lleno. Se pierde como
+            # cualquier otro datagrama y se reenvía por timeout
+            logger.warning(f"Send buffer full, dropping packet to {addr}")
+
+    def new_connection(self, connection_id, addr, protocol, is_client):
+        self.addresses[connection_id] = addr
+        connection = self.engine.new_connection(
+            self, connection_id, protocol, is_client
+        )
+        self.connections[connection_id] = connection
+        return connection
+
+    def connection_finished(self, connection):
+        for connection_id, other in list(self.connections.items()):
+            if other is connection:
+                del self.connections[connection_id]
+                del self.addresses[connection_id]
+                self.cookie_clients.pop(connection_id, None)
+        # Un endpoint de cliente tiene una sola conexión
+        if not self.connections and self.protocol_factory is None:
+            self.engine.close_endpoint(self)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.engine.loop.remove_reader(self.receiver.socket)
+        self.receiver.close()
+        self.socket.close()
+
+    # Sin logs por datagrama, igual que en MuxDemuxListener
+    def __read(self):
+        for data, addr in self.receiver.drain():
+            try:
+                kind, connection_id, packet = extract_packet(data)
+            except ValueError:
+                continue
+            connection = self.connections.get(connection_id)
+            if connection is None:
+                if self.protocol_factory:
+                    self.__accept_unknown(kind, connection_id, packet, addr)
+                continue
+            cookie = self.cookie_clients.get(connection_id)
+            if cookie is None:
+                packet = strip_cookie(kind, packet)
+            else:
+                packet, pending = cookie.received(kind, packet)
+                for datagram in pending:
+                    self.__send(datagram, self.addresses[connection_id])
+            # Solo un paquete que hace avanzar la conexión la pasa a la
+            # dirección de la que llegó (ver SRConnection.datagram_received).
+            # La conexión pudo terminar con ese mismo paquete
+            if (
+                packet is not None
+                and connection.datagram_received(packet)
+                and connection_id in self.addresses
+            ):
+                self.addresses[connection_id] = addr
+
+    # Solo se crea la conexión con una cookie válida y un CONNECT
+    def __accept_unknown(self, kind, connection_id, packet, addr):
+        reply, packet = self.cookies.handle_unknown(
+            kind, connection_id, packet, addr
+        )
+        if reply is not None:
+            self.__send((reply,), addr)
+        if packet is not None and bytes(packet[:1]) == CONNECT:
+            try:
+                connect = Packet.from_datagram(packet)
+            except ValueError as e:
+                logger.warning(f"Dropping invalid CONNECT: {e}")
+                return
+            self.__accept(connection_id, connect, addr)
+
+    def __accept(self, connection_id, connect, addr):
+        logger.debug(f"New connection from {addr}")
+        connection = self.new_connection(
+            connection_id, addr, self.protocol_factory(), is_client=False
+        )
+        connection.accept(connect)
+
+
+# Corre conexiones de selective repeat en un solo thread con un
+# EventLoop: todos los sockets UDP se esperan en el mismo selector y los
+# timers de todas las conexiones van al heap del loop, sin ningún thread
+# por conexión (ver SRConnection). Es compatible con SRSocket del otro
+# lado de la conexión
+# Solo soporta selective repeat, stop and wait sigue siendo con threads
+class Engine:
+    def __init__(self, loop, buggyness_factor=0.0, **connection_args):
+        self.loop = loop
+        self.buggyness_factor = buggyness_factor
+        # Argumentos para cada SRConnection (window_size, max_size, etc.)
+        self.connection_args = connection_args
+        self.endpoints = []
+
+    # Acepta conexiones en addr. Cada una recibe un protocolo nuevo de
+    # protocol_factory() (ver SRProtocol)
+    def listen(self, addr, protocol_factory, reuse_port=False):
+        udp_socket = BuggyUDPSocket(self.buggyness_factor)
+        if reuse_port:
+            udp_socket.set_reuse_port()
+        udp_socket.bind(addr)
+        udp_socket.setblocking(False)
+        endpoint = Endpoint(self, udp_socket, protocol_factory)
+        self.endpoints.append(endpoint)
+        logger.info(f"Listening on {addr}")
+        return endpoint
+
+    # Conecta a addr con un socket UDP propio y devuelve la SRConnection
+    # (se avisa protocol.connection_made() cuando se establece)
+    def connect(self, addr, protocol):
+        udp_socket = BuggyUDPSocket(self.buggyness_factor)
+        udp_socket.setblocking(False)
+        endpoint = Endpoint(self, udp_socket)
+        self.endpoints.append(endpoint)
+        connection = endpoint.new_connection(
+            new_connection_id(), addr, protocol, is_client=True
+        )
+        connection.connect()
+        return connection
+
+    def new_connection(self, endpoint, connection_id, protocol, is_client):
+        return SRConnection(
+            self.loop,
+            endpoint.sender(connection_id),
+            protocol,
+            is_client,
+            on_finished=endpoint.connection_finished,
+            **self.connection_args,
+        )
+
+    def close_endpoint(self, endpoint):
+        endpoint.close()
+        self.endpoints.remove(endpoint)
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.close()
+        self.endpoints.clear()
@@ -0,0 +1,134 @@
+from collections import deque
+import heapq
+import itertools
+import selectors
+import socket
+import threading
+import time
+
+from loguru import logger
+
+from lib.scheduler import TimerHandle
+
+
+# Loop de eventos de un solo thread: espera en un selector a que los
+# sockets registrados se puedan leer y ejecuta los timers vencidos.
+# Todo lo que se registra (callbacks de lectura y timers) corre en el
+# thread del loop, así que no debe bloquear. Desde otros threads solo se
+# puede usar call_soon_threadsafe() y stop()
+class EventLoop:
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.heap = []
+        self.counter = itertools.count()
+        self.ready = deque()
+        self.running = False
+        self.thread = None
+        # Para despertar al selector desde otros threads
+        self.threadsafe_lock = threading.Lock()
+        self.threadsafe = deque()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.add_reader(self.wakeup_recv, self.__drain_wakeup)
+
+    def time(self):
+        return time.monotonic()
+
+    # Misma interfaz que TimerScheduler (y que asyncio): devuelven un
+    # TimerHandle que se puede cancelar
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(when, callback, args)
+        heapq.heappush(self.heap, (when, next(self.counter), handle))
+        return handle
+
+    def call_soon(self, callback, *args):
+        handle = TimerHandle(None, callback, args)
+        self.ready.append(handle)
+        return handle
+
+    def call_soon_threadsafe(self, callback, *args):
+        handle = TimerHandle(None, callback, args)
+        with self.threadsafe_lock:
+            self.threadsafe.append(handle)
+        try:
+            self.wakeup_send.send(b"\0")
+        except BlockingIOError:
+            # Ya hay bytes sin leer, el loop se va a despertar igual
+            pass
+        return handle
+
+    def add_reader(self, fileobj, callback, *args):
+        self.selector.register(fileobj, selectors.EVENT_READ, (callback, args))
+
+    def remove_reader(self, fileobj):
+        self.selector.unregister(fileobj)
+
+    def run_forever(self):
+        self.running = True
+        self.thread = threading.current_thread()
+        while self.running:
+            self.__run_once()
+
+    # Corre el loop en un thread nuevo y lo devuelve
+    def start(self, name="EventLoop"):
+        thread = threading.Thread(target=self.run_forever, name=name)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.call_soon_threadsafe(self.__stop)
+
+    def close(self):
+        self.selector.close()
+        self.wakeup_recv.close()
+        self.wakeup_send.close()
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self.thread
+
+    def __stop(self):
+        self.running = False
+
+    def __timeout(self):
+        if self.ready or self.threadsafe:
+            return 0
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(self.heap[0][0] - self.time(), 0)
+
+    def __run_once(self):
+        for key, _ in self.selector.select(self.__timeout()):
+            callback, args = key.data
+            self.__run(callback, args)
+
+        now = self.time()
+        while self.heap and self.heap[0][0] <= now:
+            self.ready.append(heapq.heappop(self.heap)[2])
+        with self.threadsafe_lock:
+            self.ready.extend(self.threadsafe)
+            self.threadsafe.clear()
+
+        # Lo que se agregue mientras tanto queda para la próxima vuelta
+        for _ in range(len(self.ready)):
+            call = self.ready.popleft().take()
+            if call is not None:
+                self.__run(*call)
+
+    def __run(self, callback, args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.exception(f"Error running event loop callback: {e}")
+
+    def __drain_wakeup(self):
+        try:
+            while self.wakeup_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
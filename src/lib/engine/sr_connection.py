@@ -0,0 +1,533 @@
+from collections import deque
+
+from loguru import logger
+
+from lib.selective_repeat.constants import (
+    ACK_DELAY,
+    ACK_EVERY,
+    CLOSED,
+    CONGESTION_CONTROL,
+    CONNACK_WAIT_TIMEOUT,
+    CONNECT_RETRIES,
+    CONNECTED,
+    FAST_RETRANSMIT,
+    FIN_RETRIES,
+    FIN_WAIT_TIMEOUT,
+    FINACK_WAIT_TIMEOUT,
+    FORCED_CLOSING,
+    INITIAL_PACKET_NUMBER,
+    MAX_SIZE,
+    NOT_CONNECTED,
+    PEER_CLOSED,
+    RECV_BUFFER_SIZE,
+    WINDOW_SIZE,
+)
+from lib.selective_repeat.packet import (
+    CONNACK,
+    CONNECT,
+    INFO,
+    Connect,
+    Fin,
+    Finack,
+    Info,
+    Packet,
+    check_ack_policy,
+)
+from lib.selective_repeat.util import (
+    AckNumberProvider,
+    AckRegister,
+    BlockAcker,
+    LossRecovery,
+    RTTEstimator,
+)
+from lib.utils import stable_buffer
+
+from .constants import (
+    FIN_SENT,
+    FINISHED,
+    IDLE_TIMEOUT,
+    WRITE_HIGH_WATER,
+    WRITE_LOW_WATER,
+)
+
+
+# Callbacks que recibe la aplicación de una SRConnection (como los
+# protocolos de asyncio). Se llaman desde el loop, no deben bloquear
+class SRProtocol:
+    # Se estableció la conexión
+    def connection_made(self, connection):
+        pass
+
+    def data_received(self, data):
+        pass
+
+    # El otro extremo cerró la conexión (mandó FIN)
+    def eof_received(self):
+        pass
+
+    # Terminó la conexión, exc es None si se cerró normalmente
+    def connection_lost(self, exc):
+        pass
+
+    # Hay demasiados bytes esperando ser enviados / ya bajaron
+    def pause_writing(self):
+        pass
+
+    def resume_writing(self):
+        pass
+
+
+# Lo recibido en orden que todavía no se le pasó a la aplicación. Cumple
+# lo que BlockAcker usa de un MTByteStream (put_bytes y buffered)
+class ReceiveBuffer:
+    def __init__(self):
+        self.chunks = deque()
+        self.size = 0
+
+    def put_bytes(self, data):
+        if data:
+            self.chunks.append(data)
+            self.size += len(data)
+
+    def buffered(self):
+        return self.size
+
+    def pop(self):
+        chunk = self.chunks.popleft()
+        self.size -= len(chunk)
+        return chunk
+
+
+# Una conexión de selective repeat como objeto de estado, sin threads: la
+# maneja un loop (EventLoop o asyncio) que le pasa los datagramas que
+# llegan con datagram_received() y le ejecuta los timers. Envía los
+# paquetes con sender(partes) y usa el loop solo para call_later()
+# Es compatible con SRSocket del otro lado de la conexión
+class SRConnection:
+    def __init__(
+        self,
+        loop,
+        sender,
+        protocol,
+        is_client,
+        window_size=WINDOW_SIZE,
+        max_size=MAX_SIZE,
+        congestion_control=CONGESTION_CONTROL,
+        ack_every=ACK_EVERY,
+        ack_delay=ACK_DELAY,
+        fast_retransmit=FAST_RETRANSMIT,
+        recv_buffer_size=RECV_BUFFER_SIZE,
+        idle_timeout=IDLE_TIMEOUT,
+        on_finished=None,
+    ):
+        self.loop = loop
+        self.sender = sender
+        self.protocol = protocol
+        self.is_client = is_client
+        self.on_finished = on_finished
+        self.state = NOT_CONNECTED
+
+        self.number_provider = AckNumberProvider(
+            window_size, congestion_control
+        )
+        self.max_size = max_size
+        self.ack_register = AckRegister()
+        self.rtt_estimator = RTTEstimator()
+        check_ack_policy(ack_every, ack_delay)
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.upstream = ReceiveBuffer()
+        self.acker = BlockAcker(
+            lambda data: self.sender((data,)),
+            self.upstream,
+            scheduler=loop,
+            recv_buffer_size=recv_buffer_size,
+        )
+        self.reading_paused = False
+
+        # Bytes que la aplicación escribió y todavía no se mandaron
+        self.send_queue = deque()
+        self.queued = 0
+        self.writing_paused = False
+        # El cliente no manda datos hasta que se reconozca su primer INFO
+        # (igual que SRSocket)
+        self.first_acked = not is_client
+
+        self.loss_recovery = LossRecovery(
+            self.ack_register,
+            self.number_provider,
+            self.rtt_estimator,
+            self.__send_info,
+            self.__give_up,
+            lambda: self.state in (FORCED_CLOSING, FINISHED),
+            fast_retransmit,
+        )
+
+        # Sin un thread que se canse de esperar como en SRSocket, si el
+        # otro extremo desaparece la conexión termina por este timer
+        self.idle_timeout = idle_timeout
+        self.last_received = None
+        self.idle_timer = None
+
+        # Timer del handshake o del cierre, y del zero window probe
+        self.timer = None
+        self.retries = 0
+        self.probe_timer = None
+        self.handshake_packet = None
+
+    # Conectar tipo cliente: manda el CONNECT y espera el CONNACK
+    def connect(self):
+        self.handshake_packet = Connect(self.ack_every, self.ack_delay)
+        self.__send_handshake()
+
+    # Conectar tipo servidor: recibe el CONNECT que llegó al listener,
+    # manda el CONNACK y espera el primer INFO
+    def accept(self, connect):
+        self.acker.set_policy(connect.ack_every(), connect.ack_delay())
+        self.handshake_packet = connect.ack(self.ack_every, self.ack_delay)
+        self.__send_handshake()
+
+    # RTT suavizado (None si todavía no hay muestras) y RTO actual
+    def srtt(self):
+        return self.rtt_estimator.srtt()
+
+    def rto(self):
+        return self.rtt_estimator.rto()
+
+    @property
+    def fast_retransmits(self):
+        return self.loss_recovery.fast_retransmits
+
+    @property
+    def timeout_retransmits(self):
+        return self.loss_recovery.timeout_retransmits
+
+    def is_finished(self):
+        return self.state == FINISHED
+
+    def write(self, data):
+        if self.state not in (NOT_CONNECTED, CONNECTED):
+            raise Exception("Connection is closing or was closed")
+        if not data:
+            return
+        # Los paquetes apuntan a los datos hasta que se reconocen: solo se
+        # copian si pueden cambiar mientras tanto (ver stable_buffer)
+        view = memoryview(stable_buffer(data)).cast("B")
+        self.send_queue.append(view)
+        self.queued += len(view)
+        if self.queued > WRITE_HIGH_WATER and not self.writing_paused:
+            self.writing_paused = True
+            self.protocol.pause_writing()
+        self.__fill()
+
+    def get_write_buffer_size(self):
+        return self.queued
+
+    # Deja de pasarle datos a la aplicación. Lo recibido se guarda y la
+    # ventana de recepción se va cerrando
+    def pause_reading(self):
+        self.reading_paused = True
+
+    def resume_reading(self):
+        self.reading_paused = False
+        self.__deliver()
+
+    # Cierra después de enviar (y que se reconozca) lo que esté escrito
+    def close(self):
+        if self.state not in (NOT_CONNECTED, CONNECTED):
+            return
+        if self.state == NOT_CONNECTED:
+            self.__finish(None)
+            return
+        self.state = CLOSED
+        self.acker.stop()
+        self.__maybe_send_fin()
+
+    # Devuelve True si el datagrama hizo avanzar la conexión (un INFO
+    # nuevo, un ACK de algo pendiente o un paso del handshake o del
+    # cierre). Solo esos pueden cambiar la dirección del otro extremo
+    def datagram_received(self, datagram):
+        if self.state == FINISHED:
+            return False
+        try:
+            packet = Packet.from_datagram(datagram)
+        except ValueError as e:
+            logger.warning(f"Dropping invalid packet: {e}")
+            return False
+        logger.info(f"Received packet of type {packet}")
+        self.last_received = self.loop.time()
+
+        if self.state == NOT_CONNECTED:
+            return self.__handle_handshake(packet)
+        return bool(packet.be_handled_by(self))
+
+    def __send_handshake(self):
+        if self.retries > CONNECT_RETRIES:
+            self.__finish(
+                TimeoutError("Could not confirm connection was established")
+            )
+            return
+        if self.retries > 0:
+            logger.warning(
+                f"Timed out waiting for handshake, retrying (attempt"
+                f" {self.retries})"
+            )
+        self.retries += 1
+        self.sender((self.handshake_packet.encode(),))
+        self.timer = self.loop.call_later(
+            CONNACK_WAIT_TIMEOUT, self.__send_handshake
+        )
+
+    def __handle_handshake(self, packet):
+        if self.is_client and packet.type == CONNACK:
+            self.acker.set_policy(packet.ack_every(), packet.ack_delay())
+            # Un INFO vacío confirma la recepción del CONNACK
+            self.__send_info(Info(self.number_provider.try_get()))
+            self.__established()
+            return True
+        if not self.is_client and packet.type == INFO:
+            new = self.acker.received(packet)
+            if packet.number() == INITIAL_PACKET_NUMBER:
+                self.__established()
+            return new
+        if not self.is_client and packet.type == CONNECT:
+            # Asumo que no le llegó mi CONNACK, se reenvía con el timer
+            return False
+        logger.warning(f"Received {packet} while connecting, dropping")
+        return False
+
+    def __established(self):
+        self.timer.cancel()
+        self.timer = None
+        self.retries = 0
+        self.state = CONNECTED
+        logger.debug("Connected")
+        self.idle_timer = self.loop.call_later(
+            self.idle_timeout, self.__check_idle
+        )
+        self.protocol.connection_made(self)
+        self.__deliver()
+        self.__fill()
+
+    # No se reprograma el timer con cada paquete: al vencerse se fija
+    # cuándo llegó el último y, si fue hace poco, se vuelve a esperar
+    def __check_idle(self):
+        self.idle_timer = None
+        if self.state in (FORCED_CLOSING, FINISHED):
+            return
+        idle = self.loop.time() - self.last_received
+        if idle < self.idle_timeout:
+            self.idle_timer = self.loop.call_later(
+                self.idle_timeout - idle, self.__check_idle
+            )
+            return
+        logger.error(f"Nothing received for {idle:.1f} seconds, dropping")
+        self.state = FORCED_CLOSING
+        self.sender((Fin().encode(),))
+        self.__finish(TimeoutError("Peer stopped responding"))
+
+    def handle_connect(self, connect):
+        logger.warning("Received CONNECT packet while already connected.")
+
+    def handle_connack(self, connack):
+        logger.warning("Received CONNACK packet while already connected.")
+
+    def handle_info(self, info):
+        if self.state not in (CONNECTED, CLOSED, FIN_SENT):
+            return False
+        new = self.acker.received(info)
+        self.__deliver()
+        return new
+
+    def handle_ack(self, ack):
+        return self.__acknowledge([ack.number()])
+
+    def handle_sack(self, sack):
+        self.number_provider.set_peer_window(
+            sack.cumulative(), sack.window() // self.max_size
+        )
+        numbers = self.number_provider.unacked_covered_by(
+            sack.cumulative(), sack.ranges()
+        )
+        acknowledged = bool(numbers) and self.__acknowledge(numbers)
+        # Puede haberse abierto la ventana de recepción
+        self.__fill()
+        return acknowledged
+
+    def handle_fin(self, fin):
+        if self.state in (CONNECTED, CLOSED):
+            self.acker.stop()
+            self.state = PEER_CLOSED
+            self.retries = 0
+            self.protocol.eof_received()
+            self.__send_finack()
+            return True
+        if self.state == FIN_SENT:
+            logger.debug(
+                "Both ends of connection sent FIN, switching to FINACK"
+            )
+            self.state = PEER_CLOSED
+            self.retries = 0
+            self.__send_finack()
+            return True
+        if self.state == PEER_CLOSED:
+            logger.warning(
+                "Received FIN packet after sending FINACK, resending it"
+                f" (attempt {self.retries})"
+            )
+            self.__send_finack()
+        return False
+
+    def handle_finack(self, finack):
+        if self.state == FIN_SENT:
+            logger.info("Received FINACK")
+            # Para que el otro extremo deje de esperar antes
+            self.sender((Finack().encode(),))
+            self.__finish(None)
+            return True
+        if self.state == PEER_CLOSED:
+            self.__finish(None)
+            return True
+        logger.warning("Received FINACK packet but a FIN wasn't sent")
+        return False
+
+    # Después de recibir un FIN se manda el FINACK y se espera un rato por
+    # si el FIN se reenvía (no llegó el FINACK)
+    def __send_finack(self):
+        if self.retries >= FIN_RETRIES:
+            logger.warning(
+                "Could not confirm connection was closed for the other end"
+            )
+            self.__finish(None)
+            return
+        self.retries += 1
+        self.__cancel_timer()
+        self.sender((Finack().encode(),))
+        self.timer = self.loop.call_later(
+            FIN_WAIT_TIMEOUT, self.__finish, None
+        )
+
+    def __maybe_send_fin(self):
+        if (
+            self.state == CLOSED
+            and not self.send_queue
+            and not self.ack_register.have_unacknowledged()
+        ):
+            self.state = FIN_SENT
+            self.retries = 0
+            self.__send_fin()
+
+    def __send_fin(self):
+        if self.retries >= FIN_RETRIES:
+            logger.warning(
+                "Could not confirm connection was closed for the other end"
+            )
+            self.__finish(None)
+            return
+        if self.retries > 0:
+            logger.warning(
+                f"Timed out waiting for finack, retrying (attempt"
+                f" {self.retries})"
+            )
+        self.retries += 1
+        self.sender((Fin().encode(),))
+        self.timer = self.loop.call_later(FINACK_WAIT_TIMEOUT, self.__send_fin)
+
+    def __deliver(self):
+        if self.state == NOT_CONNECTED:
+            return
+        delivered = False
+        while self.upstream.buffered() and not self.reading_paused:
+            self.protocol.data_received(self.upstream.pop())
+            delivered = True
+        if delivered:
+            self.acker.window_update()
+
+    # Arma y manda paquetes con lo escrito mientras haya lugar en la
+    # ventana
+    def __fill(self):
+        if self.state not in (CONNECTED, CLOSED) or not self.first_acked:
+            return
+        while self.send_queue:
+            number = self.number_provider.try_get()
+            if number is None:
+                self.__schedule_probe()
+                break
+            head = self.send_queue[0]
+            body = head[: self.max_size]
+            if len(head) > self.max_size:
+                self.send_queue[0] = head[self.max_size :]
+            else:
+                self.send_queue.popleft()
+            self.queued -= len(body)
+            self.__send_info(Info(number, body))
+
+        if self.writing_paused and self.queued <= WRITE_LOW_WATER:
+            self.writing_paused = False
+            self.protocol.resume_writing()
+        self.__maybe_send_fin()
+
+    # Con la ventana de recepción del otro extremo cerrada no llega
+    # ningún SACK que vuelva a llamar a __fill(), se reintenta a tiempo
+    # para el zero window probe
+    def __schedule_probe(self):
+        delay = self.number_provider.probe_delay()
+        if delay is None or self.probe_timer is not None:
+            return
+        self.probe_timer = self.loop.call_later(delay, self.__probe)
+
+    def __probe(self):
+        self.probe_timer = None
+        self.__fill()
+
+    def __send_info(self, packet, attempts=0):
+        if self.state in (FORCED_CLOSING, FINISHED):
+            return
+        timer = self.loop.call_later(
+            self.rtt_estimator.timeout(attempts),
+            self.loss_recovery.check_ack,
+            packet,
+            attempts,
+        )
+        self.ack_register.add_pending(packet, timer, attempts)
+        logger.info(f"Sending packet of type {packet}")
+        self.sender(packet.encode_parts())
+
+    # Un paquete agotó los reintentos
+    def __give_up(self):
+        logger.error("Fatal error, ending connection abruptly")
+        self.state = FORCED_CLOSING
+        self.sender((Fin().encode(),))
+        self.__finish(ConnectionError("Peer is not acknowledging"))
+
+    def __acknowledge(self, numbers):
+        if INITIAL_PACKET_NUMBER in numbers:
+            self.first_acked = True
+        acknowledged = self.loss_recovery.acknowledge(numbers)
+        self.__fill()
+        return acknowledged
+
+    def __cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def __finish(self, exc):
+        if self.state == FINISHED:
+            return
+        self.state = FINISHED
+        self.__cancel_timer()
+        if self.probe_timer:
+            self.probe_timer.cancel()
+        if self.idle_timer:
+            self.idle_timer.cancel()
+        if self.acker.timer:
+            self.acker.timer.cancel()
+        self.ack_register.stop()
+        # Lo que haya quedado guardado se entrega antes de terminar
+        self.reading_paused = False
+        while self.upstream.buffered():
+            self.protocol.data_received(self.upstream.pop())
+        self.protocol.connection_lost(exc)
+        if self.on_finished:
+            self.on_finished(self)
@@ -1,5 +1,7 @@
 import argparse
 
+from lib.ftp.compression import CODECS, DEFAULT_LEVEL, MAX_LEVEL
+
 
 def args_client(upload):
     if upload:
@@ -7,7 +9,12 @@ def args_client(upload):
     else:
         flag = "d"
     first = "%(prog)s  [ - h ] [ - v | -q ] [ - H ADDR ] "
-    second = "[ - p PORT ] [ - " + flag + " FILEPATH ] [ - n FILENAME ]"
+    second = (
+        "[ - p PORT ] [ - " + flag + " FILEPATH ] [ - n FILENAME ]"
+        " [ - c CODEC ] [ - l LEVEL ]"
+    )
+    if not upload:
+        second += " [ - P N ]"
     parser = argparse.ArgumentParser(
         description="< command description >", usage=first + second
     )
@@ -57,6 +64,14 @@ def args_client(upload):
             metavar="",
             required=True,
         )
+        parser.add_argument(
+            "-P",
+            "--parallel",
+            help="connections downloading ranges of the file at once",
+            type=int,
+            metavar="",
+            default=1,
+        )
     parser.add_argument(
         "-n",
         "--name",
@@ -65,4 +80,20 @@ def args_client(upload):
         metavar="",
         required=True,
     )
+    parser.add_argument(
+        "-c",
+        "--compression",
+        help="codec to ask the server for (auto: by file type and sample)",
+        choices=[*CODECS, "auto"],
+        default="none",
+    )
+    parser.add_argument(
+        "-l",
+        "--level",
+        help=f"compression level (0-{MAX_LEVEL})",
+        type=int,
+        choices=range(MAX_LEVEL + 1),
+        metavar="",
+        default=DEFAULT_LEVEL,
+    )
     return parser.parse_args()
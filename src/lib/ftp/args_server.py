@@ -1,9 +1,14 @@
 import argparse
 
+from lib.ftp.worker_pool import POOL_SIZE
+
 
 def args_server():
     first = "%(prog)s  [ - h ] [ - v | -q ] [ - H ADDR ] "
-    second = "[ - p PORT ] [ - s DIRPATH ]"
+    second = (
+        "[ - p PORT ] [ - s DIRPATH ] [ - e {threads,events} ] [ - w N ]"
+        " [ - P N ]"
+    )
 
     parser = argparse.ArgumentParser(
         description="< command description >", usage=first + second
@@ -45,5 +50,31 @@ def args_server():
         metavar="",
         required=True,
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help=(
+            "threads: one thread per connection, events: every connection"
+            " on a single event loop thread"
+        ),
+        choices=("threads", "events"),
+        default="threads",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="number of server processes sharing the port (SO_REUSEPORT)",
+        type=int,
+        metavar="",
+        default=1,
+    )
+    parser.add_argument(
+        "-P",
+        "--pool",
+        help="threads serving connections (threads engine), per process",
+        type=int,
+        metavar="",
+        default=POOL_SIZE,
+    )
 
     return parser.parse_args()
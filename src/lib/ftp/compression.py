@@ -0,0 +1,266 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+
+from loguru import logger
+
+try:
+    import lzma
+except ImportError:
+    # Python compilado sin liblzma: se negocia sin lzma
+    lzma = None
+
+# Codecs que se pueden pedir en el header. El que responde elige el que
+# se usa: el pedido si lo tiene, si no NONE
+NONE = 0
+ZLIB = 1
+LZMA = 2
+CODECS = {"none": NONE, "zlib": ZLIB, "lzma": LZMA}
+# Nivel de zlib o preset de lzma: de 0 a MAX_LEVEL
+DEFAULT_LEVEL = 6
+MAX_LEVEL = 9
+# Con compresión el cuerpo va en frames: largo (4 bytes) y datos
+# comprimidos. Un frame vacío marca el final
+FRAME = struct.Struct("<I")
+# Bytes del archivo que se comprimen por vez
+CHUNK_SIZE = 256 * 1024
+# Datos comprimidos que puede llevar un frame. Lo que da el compresor de
+# una vez (el flush de lzma puede ser todo el archivo) se parte en frames
+# de a lo sumo este tamaño, y al recibir se rechazan los más grandes
+MAX_FRAME = CHUNK_SIZE
+# Frames que el thread de compresión (o de descompresión) puede tener
+# listos sin que los tome el otro lado del pipeline
+PIPELINE_DEPTH = 8
+# Para elegir el codec en "auto": se comprimen SAMPLES muestras de
+# SAMPLE_SIZE bytes repartidas por el archivo y se usa zlib solo si
+# quedan por debajo de MIN_RATIO de su tamaño
+SAMPLE_SIZE = 64 * 1024
+SAMPLES = 4
+MIN_RATIO = 0.9
+# Formatos que ya vienen comprimidos: "auto" no los comprime
+COMPRESSED_SUFFIXES = (
+    ".gz",
+    ".tgz",
+    ".bz2",
+    ".xz",
+    ".zst",
+    ".zip",
+    ".7z",
+    ".rar",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".mp3",
+    ".mp4",
+    ".mkv",
+    ".webm",
+    ".pdf",
+)
+
+
+def available(codec):
+    return codec in (NONE, ZLIB) or (codec == LZMA and lzma is not None)
+
+
+# El codec que usa quien responde al pedir codec
+def negotiate(codec):
+    return codec if available(codec) else NONE
+
+
+# Codec para "auto": ninguno para los formatos ya comprimidos, y para
+# el resto zlib si las muestras del archivo se comprimen bien
+def choose(filename, path=None):
+    if filename.lower().endswith(COMPRESSED_SUFFIXES):
+        return NONE
+    if path is None:
+        return ZLIB
+    size = os.path.getsize(path)
+    if size == 0:
+        return NONE
+    sampled = compressed = 0
+    with open(path, "rb") as file:
+        for i in range(SAMPLES):
+            file.seek(max(0, size - SAMPLE_SIZE) * i // max(1, SAMPLES - 1))
+            sample = file.read(SAMPLE_SIZE)
+            sampled += len(sample)
+            compressed += len(zlib.compress(sample, 1))
+    ratio = compressed / sampled
+    logger.debug(f"sampled compression ratio: {ratio:.2f}")
+    return ZLIB if ratio < MIN_RATIO else NONE
+
+
+# Codec a pedir para un nombre de CODECS o "auto". Sin path (una
+# descarga, el archivo está en el servidor) "auto" decide solo por el
+# nombre del archivo
+def select(name, filename, path=None):
+    codec = choose(filename, path) if name == "auto" else CODECS[name]
+    if not available(codec):
+        logger.warning(f"{name} is not available, using no compression")
+        return NONE
+    return codec
+
+
+def compressor(codec, level=DEFAULT_LEVEL):
+    if codec == ZLIB:
+        return zlib.compressobj(level)
+    if codec == LZMA:
+        return lzma.LZMACompressor(preset=level)
+    raise ValueError(f"unknown codec {codec}")
+
+
+def decompressor(codec):
+    if codec == ZLIB:
+        return zlib.decompressobj()
+    if codec == LZMA:
+        return lzma.LZMADecompressor()
+    raise ValueError(f"unknown codec {codec}")
+
+
+# length bytes del archivo desde offset, de a CHUNK_SIZE
+def read_chunks(path, offset, length):
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while length > 0:
+            data = file.read(min(CHUNK_SIZE, length))
+            if not data:
+                # El archivo se achicó mientras se mandaba
+                raise EOFError(f"{path} is shorter than expected")
+            yield data
+            length -= len(data)
+
+
+# data en frames de a lo sumo MAX_FRAME bytes
+def _framed(data):
+    view = memoryview(data)
+    for i in range(0, len(view), MAX_FRAME):
+        piece = view[i : i + MAX_FRAME]
+        yield FRAME.pack(len(piece)) + piece
+
+
+# Frames con chunks comprimidos, terminando con el frame vacío. La
+# lectura y la compresión corren en otro thread (zlib y lzma liberan el
+# GIL), así que se superponen con el envío de los frames anteriores
+def compressed_frames(chunks, codec, level=DEFAULT_LEVEL):
+    frames = queue.Queue(PIPELINE_DEPTH)
+    stop = threading.Event()
+
+    # Entre que se chequea stop y se encola puede vaciarse la cola (ver
+    # el finally), así que a lo sumo queda un frame que nadie saca
+    def put(item):
+        if not stop.is_set():
+            frames.put(item)
+
+    def compress():
+        try:
+            encoder = compressor(codec, level)
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                for frame in _framed(encoder.compress(chunk)):
+                    put(frame)
+            for frame in _framed(encoder.flush()):
+                put(frame)
+            put(FRAME.pack(0))
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=compress, name="compressor", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Si el envío se cortó, se libera al thread si está esperando
+        # lugar en la cola
+        stop.set()
+        while True:
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                break
+        thread.join()
+
+
+# Descomprime data de a lo sumo CHUNK_SIZE bytes por vez, así un frame
+# chico que se descomprime a mucho no se tiene entero en memoria
+def _decompressed(decoder, data):
+    while True:
+        output = decoder.decompress(data, CHUNK_SIZE)
+        yield output
+        if decoder.eof:
+            return
+        if hasattr(decoder, "unconsumed_tail"):
+            # zlib: lo que no entró queda en unconsumed_tail (y si la
+            # salida se llenó justo puede quedar más sin entrada nueva)
+            data = decoder.unconsumed_tail
+            if not data and len(output) < CHUNK_SIZE:
+                return
+        else:
+            # lzma: guarda la entrada que le falta procesar
+            if decoder.needs_input:
+                return
+            data = b""
+
+
+# Recibe los frames de socket hasta el vacío (uno de más de MAX_FRAME
+# bytes es un ValueError) y le pasa los datos descomprimidos a write, que
+# en total no pueden pasar de limit bytes (lo anunciado): apenas se pasan
+# se corta con ValueError sin escribirlos. La descompresión (y write)
+# corren en otro thread, así que se superponen con la recepción de los
+# frames siguientes. Vuelve cuando write recibió todo
+def receive_compressed(socket, codec, write, limit):
+    frames = queue.Queue(PIPELINE_DEPTH)
+    errors = []
+
+    def decompress():
+        decoder = decompressor(codec)
+        remaining = limit
+        while (data := frames.get()) is not None:
+            # Después de un error solo se vacía la cola, para que la
+            # recepción no se bloquee
+            if errors:
+                continue
+            try:
+                for output in _decompressed(decoder, data):
+                    if len(output) > remaining:
+                        raise ValueError(
+                            f"decompressed data exceeds {limit} bytes"
+                        )
+                    remaining -= len(output)
+                    write(output)
+            except Exception as e:
+                errors.append(e)
+        if not errors and not decoder.eof:
+            errors.append(EOFError("compressed stream ended early"))
+
+    thread = threading.Thread(
+        target=decompress, name="decompressor", daemon=True
+    )
+    thread.start()
+    try:
+        while not errors:
+            (size,) = FRAME.unpack(socket.recv_exact(FRAME.size))
+            if size == 0:
+                break
+            # El largo lo manda el otro extremo: no se reserva más que
+            # un frame legítimo
+            if size > MAX_FRAME:
+                raise ValueError(
+                    f"frame of {size} bytes exceeds {MAX_FRAME} bytes"
+                )
+            frames.put(socket.recv_exact(size))
+    finally:
+        frames.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,153 @@
+import os
+import struct
+import threading
+
+# Sufijos del archivo con lo recibido hasta ahora y de su journal
+PART_SUFFIX = ".part"
+JOURNAL_SUFFIX = ".journal"
+# Cada cuántos bytes escritos se hace fsync y se actualiza el journal. Es
+# lo máximo que se vuelve a transferir al retomar después de un corte
+SYNC_INTERVAL = 16 * 1024 * 1024
+# Journal: tamaño total del archivo, su versión (ver file_version()) y
+# offset hasta el que lo escrito está en disco
+JOURNAL = struct.Struct("<QQQ")
+
+# Por path, el PartialFile que lo está escribiendo. Una transferencia que
+# se retoma antes de que se detecte el corte de la anterior (que sigue
+# con el archivo abierto) la reemplaza, y la anterior ya no escribe
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+# Versión del archivo de origen: su hora de modificación en ns. Otro
+# archivo con el mismo nombre y tamaño (subido de nuevo, o que cambió en
+# el servidor entre dos intentos) tiene otra versión
+def file_version(stat):
+    return stat.st_mtime_ns
+
+
+# Archivo que se recibe por partes y puede retomarse después de un corte.
+# Se escribe en path + PART_SUFFIX y cada SYNC_INTERVAL bytes se hace
+# fsync y se guarda en el journal el offset hasta el que los datos son
+# durables. Al retomar se sigue desde ese offset (lo que haya después
+# se descarta) si el tamaño total y la versión del origen son los mismos,
+# si no desde el principio. Con finish() el archivo pasa a path y se
+# borra el journal
+class PartialFile:
+    def __init__(self, path, size, version=0):
+        self.path = path
+        self.size = size
+        self.version = version
+        self.part_path = path + PART_SUFFIX
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.file = None
+        self.offset = 0
+        self.synced = 0
+        self.superseded = False
+
+    # Offset desde el que se retomaría el archivo de path sin conocer su
+    # tamaño total (para pedirlo antes de que el otro extremo lo diga)
+    @classmethod
+    def saved_offset(cls, path):
+        return cls(path, None).__durable_offset()
+
+    # Borra lo que haya quedado de una transferencia anterior de path,
+    # para empezarla de nuevo
+    @staticmethod
+    def discard(path):
+        for suffix in (PART_SUFFIX, JOURNAL_SUFFIX):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    # Abre el archivo y devuelve el offset desde el que hay que seguir
+    def open(self):
+        with _writers_lock:
+            previous = _writers.get(self.path)
+            if previous is not None:
+                previous.superseded = True
+            _writers[self.path] = self
+        offset = self.__durable_offset()
+        mode = "r+b" if offset else "wb"
+        # Sin buffer, así una transferencia reemplazada no escribe nada
+        # más al cerrar
+        self.file = open(self.part_path, mode, buffering=0)
+        self.file.truncate(offset)
+        self.file.seek(offset)
+        self.offset = self.synced = offset
+        return offset
+
+    # Sin buffer un write() puede escribir solo una parte: se sigue con
+    # el resto, y el offset cuenta solo lo que de verdad se escribió
+    def write(self, data):
+        self.__check_writer()
+        view = memoryview(data).cast("B")
+        while view:
+            written = self.file.write(view)
+            self.offset += written
+            view = view[written:]
+        if self.offset - self.synced >= SYNC_INTERVAL:
+            self.sync()
+
+    def complete(self):
+        return self.offset >= self.size
+
+    def sync(self):
+        if self.superseded:
+            return
+        os.fsync(self.file.fileno())
+        # Se reemplaza entero para que un corte no deje un journal a medias
+        temporary = self.journal_path + ".tmp"
+        with open(temporary, "wb") as journal:
+            journal.write(JOURNAL.pack(self.size, self.version, self.offset))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temporary, self.journal_path)
+        self.synced = self.offset
+
+    # Si la reemplazó otra transferencia, no toca el .part ni el journal
+    # de la nueva (queda para close())
+    def finish(self):
+        self.__check_writer()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.__release()
+
+    # Para una transferencia que se cortó: deja lo recibido en disco para
+    # retomarla
+    def close(self):
+        if self.file is None:
+            return
+        self.sync()
+        self.file.close()
+        self.file = None
+        self.__release()
+
+    def __check_writer(self):
+        if self.superseded:
+            raise Exception(f"{self.path} is being written by a new transfer")
+
+    def __release(self):
+        with _writers_lock:
+            if _writers.get(self.path) is self:
+                del _writers[self.path]
+
+    def __durable_offset(self):
+        try:
+            with open(self.journal_path, "rb") as journal:
+                size, version, offset = JOURNAL.unpack(
+                    journal.read(JOURNAL.size)
+                )
+        except (OSError, struct.error):
+            return 0
+        if self.size is not None and (size, version) != (
+            self.size,
+            self.version,
+        ):
+            return 0
+        if not os.path.exists(self.part_path):
+            return 0
+        return min(offset, os.path.getsize(self.part_path))
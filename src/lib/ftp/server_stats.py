@@ -0,0 +1,41 @@
+import threading
+
+
+# Contadores del servidor de archivos (transferencias, bytes y errores).
+# Los actualizan los threads de cada conexión, y con --workers cada
+# proceso manda los suyos al principal, que los suma con merge()
+class ServerStats:
+    FIELDS = (
+        "uploads",
+        "downloads",
+        "bytes_received",
+        "bytes_sent",
+        "errors",
+        "connections",
+        "rejected",
+        "handshake_errors",
+        "resumed",
+        "compressed",
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, field, amount=1):
+        with self.lock:
+            self.counters[field] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def merge(self, counters):
+        with self.lock:
+            for field, amount in counters.items():
+                self.counters[field] += amount
+
+    def __str__(self):
+        return ", ".join(
+            f"{field}: {amount}" for field, amount in self.snapshot().items()
+        )
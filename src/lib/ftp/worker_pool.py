@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+
+from loguru import logger
+
+# Threads que atienden conexiones por defecto en start_server (--pool)
+POOL_SIZE = 32
+
+
+# Pool fijo de threads con una cola acotada de trabajos. submit() nunca se
+# bloquea: si la cola está llena rechaza el trabajo, así quien acepta
+# conexiones sigue al ritmo de la red y la sobrecarga se ve en las
+# métricas en vez de en la latencia de todas las conexiones
+class WorkerPool:
+    def __init__(self, workers, queue_size):
+        self.jobs = queue.Queue(queue_size)
+        # Se activa si shutdown() no pudo encolar los avisos de fin antes
+        # del timeout: los threads paran al terminar su trabajo actual
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.counters = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "peak_queued": 0,
+            "peak_busy": 0,
+        }
+        # Tiempo que pasaron los trabajos en la cola, en segundos
+        self.wait_total = 0
+        self.wait_max = 0
+        # Daemon: si shutdown() deja de esperar a un trabajo trabado, no
+        # impide que termine el proceso
+        self.threads = [
+            threading.Thread(target=self.__work, name=f"pool-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    # Encola function(*args). Devuelve False si la cola está llena
+    def submit(self, function, *args):
+        try:
+            self.jobs.put_nowait((function, args, time.monotonic()))
+        except queue.Full:
+            with self.lock:
+                self.counters["rejected"] += 1
+            return False
+        with self.lock:
+            self.counters["submitted"] += 1
+            self.counters["peak_queued"] = max(
+                self.counters["peak_queued"], self.jobs.qsize()
+            )
+        return True
+
+    def stats(self):
+        with self.lock:
+            started = self.counters["completed"] + self.counters["failed"]
+            return {
+                **self.counters,
+                "busy": self.busy,
+                "queued": self.jobs.qsize(),
+                "mean_wait_ms": (
+                    self.wait_total / started * 1000 if started else 0
+                ),
+                "max_wait_ms": self.wait_max * 1000,
+            }
+
+    # Termina los trabajos encolados y los que están corriendo, y para
+    # los threads. Con timeout espera como mucho eso en total y devuelve
+    # False si quedaron trabajos sin terminar
+    def shutdown(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in self.threads:
+            try:
+                if deadline is None:
+                    self.jobs.put(None)
+                else:
+                    remaining = max(deadline - time.monotonic(), 0)
+                    self.jobs.put(None, timeout=remaining)
+            except queue.Full:
+                self.stopping.set()
+                break
+        for thread in self.threads:
+            if deadline is None:
+                thread.join()
+            else:
+                thread.join(max(deadline - time.monotonic(), 0))
+        return not any(thread.is_alive() for thread in self.threads)
+
+    def __work(self):
+        while True:
+            job = self.jobs.get()
+            if self.stopping.is_set():
+                # Descarta el trabajo y deja un aviso para despertar al
+                # siguiente thread que espere en la cola
+                try:
+                    self.jobs.put_nowait(None)
+                except queue.Full:
+                    pass
+                break
+            if job is None:
+                break
+            function, args, queued_at = job
+            waited = time.monotonic() - queued_at
+            with self.lock:
+                self.busy += 1
+                self.counters["peak_busy"] = max(
+                    self.counters["peak_busy"], self.busy
+                )
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            result = "completed"
+            try:
+                function(*args)
+            except Exception:
+                logger.exception("Worker job failed")
+                result = "failed"
+            with self.lock:
+                self.busy -= 1
+                self.counters[result] += 1
+
+    def __str__(self):
+        return ", ".join(
+            (
+                f"{name}: {value:.2f}"
+                if isinstance(value, float)
+                else f"{name}: {value}"
+            )
+            for name, value in self.stats().items()
+        )
@@ -0,0 +1,121 @@
+import os
+import select
+import socket
+
+from loguru import logger
+
+# Tamaño de cada slab del pool, donde se reciben varios datagramas seguidos
+SLAB_SIZE = 2**20
+# Slabs usados que se guardan para reutilizar cuando nadie los referencia
+POOL_SLABS = 8
+# Máximo de datagramas que se leen por cada vez que el socket está listo
+MAX_BATCH = 64
+# Buffer de recepción que se le pide al kernel (lo limita net.core.rmem_max)
+SOCKET_RECV_BUFFER = 4 * 2**20
+
+
+# Pool de slabs (bytearray grandes) donde se reciben los datagramas uno
+# detrás del otro. Cada datagrama se entrega como una vista de solo
+# lectura del slab, así que el slab no se vuelve a usar hasta que no quede
+# ninguna vista de él. Quien guarde los datos hasta que los lea la
+# aplicación tiene que copiarlos
+class BufferPool:
+    def __init__(self, buffer_size, slab_size=SLAB_SIZE, max_slabs=POOL_SLABS):
+        self.buffer_size = buffer_size
+        self.slab_size = max(slab_size, buffer_size)
+        self.max_slabs = max_slabs
+        self.retired = []
+        self.slab = None
+        self.view = None
+        self.offset = 0
+        self.slabs_allocated = 0
+        self.__rotate()
+
+    # Devuelve dónde recibir el próximo datagrama (al menos buffer_size
+    # bytes libres)
+    def reserve(self):
+        if self.slab_size - self.offset < self.buffer_size:
+            self.__rotate()
+        return self.view[self.offset : self.offset + self.buffer_size]
+
+    # Marca como usados los size bytes recibidos en lo que devolvió
+    # reserve() y los devuelve como vista de solo lectura
+    def commit(self, size):
+        data = self.view[self.offset : self.offset + size].toreadonly()
+        self.offset += size
+        return data
+
+    def __rotate(self):
+        if self.slab is not None:
+            # Las vistas entregadas mantienen vivo el buffer aunque se
+            # libere esta
+            self.view.release()
+            self.retired.append(self.slab)
+            # Los que no entran quedan vivos solo mientras haya vistas
+            # de ellos
+            if len(self.retired) > self.max_slabs:
+                self.retired.pop(0)
+        self.slab = self.__free_slab()
+        self.view = memoryview(self.slab)
+        self.offset = 0
+
+    def __free_slab(self):
+        for i, slab in enumerate(self.retired):
+            if _is_free(slab):
+                return self.retired.pop(i)
+        self.slabs_allocated += 1
+        return bytearray(self.slab_size)
+
+
+# Un bytearray no se puede redimensionar mientras haya vistas de él
+def _is_free(slab):
+    try:
+        slab.append(0)
+    except BufferError:
+        return False
+    slab.pop()
+    return True
+
+
+# Lee datagramas de un socket UDP de a tandas: espera a que haya algo para
+# leer y después saca todo lo que haya (hasta MAX_BATCH) sin bloquearse,
+# recibiendo directamente en un BufferPool
+class BatchReceiver:
+    def __init__(self, udp_socket, buffer_size, max_batch=MAX_BATCH):
+        # Se usa un duplicado del socket para que sea no bloqueante sin
+        # cambiar el timeout con el que se envía por el original
+        self.socket = socket.socket(fileno=os.dup(udp_socket.fileno()))
+        self.socket.setblocking(False)
+        self.pool = BufferPool(buffer_size)
+        self.buffer_size = buffer_size
+        self.max_batch = max_batch
+        try:
+            self.socket.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RECV_BUFFER
+            )
+        except OSError as e:
+            logger.warning(f"Could not set receive buffer size: {e}")
+
+    # Devuelve una lista de (datagrama, addr), vacía si pasó el timeout
+    def recv_batch(self, timeout=None):
+        readable, _, _ = select.select([self.socket], [], [], timeout)
+        if not readable:
+            return []
+        return self.drain()
+
+    # Lee sin bloquearse lo que ya esté en el socket (para cuando otro,
+    # como un event loop, ya sabe que se puede leer)
+    def drain(self):
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                size, addr = self.socket.recvfrom_into(
+                    self.pool.reserve(), self.buffer_size
+                )
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((self.pool.commit(size), addr))
+        return batch
+
+    def close(self):
+        self.socket.close()
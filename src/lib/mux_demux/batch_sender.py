@@ -0,0 +1,177 @@
+import ctypes
+import errno
+import select
+import socket
+import struct
+
+# Máximo de datagramas por llamada a sendmmsg(). Linux acepta hasta
+# UIO_MAXIOV (1024)
+MAX_BATCH = 64
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("base", ctypes.c_void_p), ("len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("name", ctypes.c_void_p),
+        ("namelen", ctypes.c_uint32),
+        ("iov", ctypes.POINTER(_IOVec)),
+        ("iovlen", ctypes.c_size_t),
+        ("control", ctypes.c_void_p),
+        ("controllen", ctypes.c_size_t),
+        ("flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("hdr", _MsgHdr), ("len", ctypes.c_uint)]
+
+
+# Py_buffer de CPython, para obtener la dirección de bytes y memoryview
+# de solo lectura sin copiarlos (ctypes solo lo hace con los escribibles)
+class _PyBuffer(ctypes.Structure):
+    _fields_ = [
+        ("buf", ctypes.c_void_p),
+        ("obj", ctypes.c_void_p),
+        ("len", ctypes.c_ssize_t),
+        ("itemsize", ctypes.c_ssize_t),
+        ("readonly", ctypes.c_int),
+        ("ndim", ctypes.c_int),
+        ("format", ctypes.c_char_p),
+        ("shape", ctypes.c_void_p),
+        ("strides", ctypes.c_void_p),
+        ("suboffsets", ctypes.c_void_p),
+        ("internal", ctypes.c_void_p),
+    ]
+
+
+def _load_sendmmsg():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = (
+        ctypes.c_int,
+        ctypes.POINTER(_MMsgHdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+    )
+    sendmmsg.restype = ctypes.c_int
+    get_buffer = ctypes.pythonapi.PyObject_GetBuffer
+    get_buffer.argtypes = (
+        ctypes.py_object,
+        ctypes.POINTER(_PyBuffer),
+        ctypes.c_int,
+    )
+    release_buffer = ctypes.pythonapi.PyBuffer_Release
+    release_buffer.argtypes = (ctypes.POINTER(_PyBuffer),)
+    return sendmmsg
+
+
+# None si la plataforma no tiene sendmmsg() (fuera de Linux)
+_sendmmsg = _load_sendmmsg()
+
+
+def has_sendmmsg():
+    return _sendmmsg is not None
+
+
+# Si addr es (IPv4 numérica, port), lo único que sabe armar _sockaddr().
+# Los nombres (como "localhost") los resuelve sendmsg()
+def _numeric(addr):
+    try:
+        socket.inet_aton(addr[0])
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+# sockaddr_in de una dirección IPv4 (host, port)
+def _sockaddr(addr):
+    return (
+        struct.pack("=H", socket.AF_INET)
+        + struct.pack("!H", addr[1])
+        + socket.inet_aton(addr[0])
+        + bytes(8)
+    )
+
+
+# Envía varios datagramas con una sola llamada al sistema. messages es una
+# lista de (buffers, addr), donde los buffers de cada datagrama se juntan
+# como en sendmsg() sin copiarlos. Si la plataforma no tiene sendmmsg(),
+# se envían de a uno, y lo mismo si alguna dirección no es una IPv4
+# numérica. Respeta el timeout del socket como sendmsg()
+def sendmmsg(udp_socket, messages):
+    if (
+        _sendmmsg is None
+        or udp_socket.family != socket.AF_INET
+        or not all(_numeric(addr) for addr in {a for _, a in messages})
+    ):
+        for buffers, addr in messages:
+            udp_socket.sendmsg(buffers, (), 0, addr)
+        return
+    for start in range(0, len(messages), MAX_BATCH):
+        _send_batch(udp_socket, messages[start : start + MAX_BATCH])
+
+
+def _send_batch(udp_socket, messages):
+    headers = (_MMsgHdr * len(messages))()
+    views = []
+    names = {}
+    # Se guardan las referencias a los iovec y sockaddr hasta que se
+    # envían
+    keep = []
+    try:
+        for header, (buffers, addr) in zip(headers, messages):
+            name = names.get(addr)
+            if name is None:
+                name = names[addr] = ctypes.create_string_buffer(
+                    _sockaddr(addr), 16
+                )
+            iov = (_IOVec * len(buffers))()
+            for vector, buffer in zip(iov, buffers):
+                view = _PyBuffer()
+                ctypes.pythonapi.PyObject_GetBuffer(
+                    buffer, ctypes.byref(view), 0
+                )
+                views.append(view)
+                vector.base = view.buf
+                vector.len = view.len
+            keep.append(iov)
+            header.hdr.name = ctypes.addressof(name)
+            header.hdr.namelen = 16
+            header.hdr.iov = iov
+            header.hdr.iovlen = len(buffers)
+        sent = 0
+        while sent < len(messages):
+            sent += _send_some(udp_socket, headers, sent)
+    finally:
+        for view in views:
+            ctypes.pythonapi.PyBuffer_Release(ctypes.byref(view))
+
+
+# Envía desde headers[first] y devuelve cuántos datagramas salieron
+def _send_some(udp_socket, headers, first):
+    count = len(headers) - first
+    while True:
+        sent = _sendmmsg(
+            udp_socket.fileno(), ctypes.byref(headers[first]), count, 0
+        )
+        if sent >= 0:
+            return sent
+        error = ctypes.get_errno()
+        if error == errno.EINTR:
+            continue
+        if error not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            raise OSError(error, f"sendmmsg: {errno.errorcode[error]}")
+        # Buffer de envío lleno con el socket no bloqueante (o con
+        # timeout): se espera como lo haría sendmsg()
+        timeout = udp_socket.gettimeout()
+        if timeout == 0:
+            raise BlockingIOError(error, "sendmmsg would block")
+        _, writable, _ = select.select([], [udp_socket], [], timeout)
+        if not writable:
+            raise socket.timeout("timed out")
@@ -5,6 +5,8 @@ import socket
 
 from loguru import logger
 
+from .batch_sender import sendmmsg
+
 
 class BuggyUDPSocket:
     def __init__(self, buggyness_factor=0.0):
@@ -18,12 +20,39 @@ class BuggyUDPSocket:
             logger.warning(f"Lost packet. First 10 bytes: {data[:10]}")
         return len(data)
 
+    # Envía los buffers como un único datagrama, sin concatenarlos
+    def sendmsg(self, buffers, addr):
+        if random.random() > self.buggyness_factor:
+            return self.socket.sendmsg(buffers, (), 0, addr)
+        else:
+            logger.warning(
+                f"Lost packet. First 10 bytes: {bytes(buffers[0][:10])}"
+            )
+        return sum(len(buffer) for buffer in buffers)
+
+    # Envía varios datagramas, una lista de (buffers, addr), con una sola
+    # llamada al sistema (ver batch_sender.sendmmsg)
+    def sendmmsg(self, messages):
+        kept = []
+        for buffers, addr in messages:
+            if random.random() > self.buggyness_factor:
+                kept.append((buffers, addr))
+            else:
+                logger.warning(
+                    f"Lost packet. First 10 bytes: {bytes(buffers[0][:10])}"
+                )
+        if kept:
+            sendmmsg(self.socket, kept)
+
     def recvfrom(self, size):
         return self.socket.recvfrom(size)
 
     def close(self):
         return self.socket.close()
 
+    def fileno(self):
+        return self.socket.fileno()
+
     def settimeout(self, timeout):
         return self.socket.settimeout(timeout)
 
@@ -32,3 +61,8 @@ class BuggyUDPSocket:
 
     def bind(self, addr):
         return self.socket.bind(addr)
+
+    # Permite que varios procesos hagan bind al mismo puerto. El kernel
+    # reparte los datagramas entre ellos según la dirección de origen
+    def set_reuse_port(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
@@ -0,0 +1,124 @@
+import hmac
+import os
+import threading
+import time
+from collections import deque
+
+from .header import COOKIE, DATA, ECHO, HELLO, encode_header
+
+# Bytes de la cookie (HMAC truncado)
+COOKIE_SIZE = 8
+# Cada cuántos segundos cambia la cookie de un cliente. Se aceptan la del
+# período actual y la del anterior
+COOKIE_PERIOD = 10
+# Datagramas que guarda el cliente mientras espera la cookie. Los
+# protocolos reenvían por timeout, así que alcanza con pocos
+PENDING_DATAGRAMS = 16
+
+
+# Handshake sin estado del lado del listener: a un HELLO con un connection
+# ID desconocido se le responde con una cookie (un HMAC del ID, la
+# dirección y el período) sin guardar nada, y recién se crea la conexión
+# cuando llega un ECHO con una cookie válida. Así el tráfico de
+# direcciones que no responden (o falsificadas) no llena la cola de
+# accept ni la memoria
+class CookieIssuer:
+    def __init__(self):
+        self.secret = os.urandom(16)
+
+    # Procesa un datagrama de un connection ID sin conexión. Devuelve la
+    # respuesta a enviarle (o None) y, si trae una cookie válida, el
+    # contenido con el que crear la conexión (si no None)
+    def handle_unknown(self, kind, connection_id, payload, addr):
+        # El HELLO viene con relleno del tamaño de la cookie, así la
+        # respuesta no es más grande que lo que la pidió
+        if kind == HELLO and len(payload) >= COOKIE_SIZE:
+            period = self.__period()
+            reply = encode_header(connection_id, COOKIE) + self.__cookie(
+                connection_id, addr, period
+            )
+            return reply, None
+        if kind == ECHO and self.check(
+            connection_id, addr, payload[:COOKIE_SIZE]
+        ):
+            return None, payload[COOKIE_SIZE:]
+        return None, None
+
+    def check(self, connection_id, addr, cookie):
+        period = self.__period()
+        return any(
+            hmac.compare_digest(
+                cookie, self.__cookie(connection_id, addr, valid)
+            )
+            for valid in (period, period - 1)
+        )
+
+    def __period(self):
+        return int(time.monotonic() // COOKIE_PERIOD)
+
+    def __cookie(self, connection_id, addr, period):
+        message = f"{connection_id}|{addr[0]}|{addr[1]}|{period}".encode()
+        return hmac.digest(self.secret, message, "sha256")[:COOKIE_SIZE]
+
+
+# Contenido de un datagrama de una conexión ya creada: sin la cookie si es
+# un ECHO (el cliente todavía no recibió nada del listener), o None si no
+# es de datos
+def strip_cookie(kind, payload):
+    if kind == DATA:
+        return payload
+    if kind == ECHO:
+        return payload[COOKIE_SIZE:]
+    return None
+
+
+# Lado cliente del handshake. Hasta tener la cookie, cada datagrama se
+# guarda y se manda un HELLO en su lugar (los reenvíos del protocolo
+# reintentan el HELLO si se pierde). Con la cookie, se mandan como ECHO
+# hasta que llega el primer DATA del listener, que indica que ya creó la
+# conexión
+class CookieClient:
+    def __init__(self, connection_id):
+        self.connection_id = connection_id
+        self.header = encode_header(connection_id)
+        self.hello = encode_header(connection_id, HELLO) + bytes(COOKIE_SIZE)
+        self.echo_header = None
+        self.established = False
+        self.pending = deque(maxlen=PENDING_DATAGRAMS)
+        self.lock = threading.Lock()
+
+    # Devuelve los datagramas (tuplas de buffers) a enviar en lugar del
+    # formado por buffers
+    def wrap(self, buffers):
+        if self.established:
+            return ((self.header, *buffers),)
+        with self.lock:
+            if self.established:
+                return ((self.header, *buffers),)
+            if self.echo_header is not None:
+                return ((self.echo_header, *buffers),)
+            self.pending.append(buffers)
+            return ((self.hello,),)
+
+    # Procesa un datagrama recibido. Devuelve su contenido si es para la
+    # conexión (si no None) y los datagramas pendientes a enviar
+    def received(self, kind, payload):
+        if kind == DATA:
+            if not self.established:
+                with self.lock:
+                    self.established = True
+                    self.pending.clear()
+            return payload, ()
+        if kind != COOKIE or len(payload) < COOKIE_SIZE:
+            return None, ()
+        with self.lock:
+            if self.established or self.echo_header is not None:
+                return None, ()
+            self.echo_header = encode_header(self.connection_id, ECHO) + bytes(
+                payload[:COOKIE_SIZE]
+            )
+            pending = tuple(
+                (self.echo_header, *buffers) for buffers in self.pending
+            )
+            self.pending.clear()
+        return None, pending
@@ -0,0 +1,50 @@
+import os
+import struct
+
+# Versión del header de mux-demux. Los datagramas con otra versión se
+# descartan
+PROTOCOL_VERSION = 2
+# Header de cada datagrama: versión y tipo (4 bits cada uno) y connection
+# ID (elegido al azar por el cliente al conectarse). El listener
+# demultiplexa por el ID, así que la conexión sigue aunque cambie la
+# dirección del cliente
+HEADER = struct.Struct("!BI")
+
+# Tipos de datagrama. DATA lleva los paquetes de la conexión, los otros
+# son del handshake con cookie (ver cookie.py)
+DATA = 0
+# Primer datagrama del cliente, pide una cookie
+HELLO = 1
+# Respuesta del listener a HELLO, trae la cookie
+COOKIE = 2
+# Como DATA, pero con la cookie antes del contenido. El cliente los manda
+# así hasta que el listener le responde
+ECHO = 3
+KINDS = (DATA, HELLO, COOKIE, ECHO)
+
+
+def new_connection_id():
+    return int.from_bytes(os.urandom(HEADER.size - 1), byteorder="big")
+
+
+def encode_header(connection_id, kind=DATA):
+    return HEADER.pack(PROTOCOL_VERSION << 4 | kind, connection_id)
+
+
+# Devuelve el tipo, el connection ID y el contenido del datagrama sin el
+# header, como memoryview para no copiarlo. Lanza ValueError si el header
+# no es válido
+def extract_packet(packet):
+    packet = memoryview(packet)
+    if len(packet) < HEADER.size:
+        raise ValueError(f"Datagram too short ({len(packet)} bytes)")
+    first, connection_id = HEADER.unpack_from(packet)
+    version, kind = first >> 4, first & 0x0F
+    if version != PROTOCOL_VERSION:
+        raise ValueError(
+            f"Invalid header version (expected {PROTOCOL_VERSION}, got"
+            f" {version})"
+        )
+    if kind not in KINDS:
+        raise ValueError(f"Invalid datagram kind {kind}")
+    return kind, connection_id, packet[HEADER.size :]
@@ -1,18 +1,34 @@
+import operator
 import queue
 import threading
 import time
 
-from .mux_demux_stream import (
-    socket,
-    MuxDemuxStream,
-    extract_packet,
-    PACKET_SIZE,
-)
+from .mux_demux_stream import MuxDemuxStream, PACKET_SIZE
+from .batch_receiver import BatchReceiver
+from .batch_sender import MAX_BATCH
 from .buggy_udp import BuggyUDPSocket
+from .cookie import CookieIssuer, strip_cookie
+from .header import extract_packet
+from .peer_path import PeerPath
+from .send_scheduler import SendScheduler
 from ..utils import MTByteStream
 
 from loguru import logger
 
+# Segundos sin recibir nada de una conexión a partir de los cuales se la da
+# por muerta (el otro lado desapareció sin cerrar) y se libera su estado
+IDLE_TIMEOUT = 60
+# Máximo de conexiones con estado en el listener (aceptadas o esperando
+# un accept)
+MAX_CONNECTIONS = 1024
+# Con la tabla llena, una conexión nueva desaloja a la menos usada solo si
+# no se recibe nada de ella hace este tiempo. Si no, se rechaza la nueva
+EVICT_MIN_IDLE = 5
+# Cada cuánto se buscan conexiones inactivas
+REAP_INTERVAL = 1
+# Lo que espera close() a que terminen las conexiones abiertas
+CLOSE_LINGER = 10
+
 
 class SafeUDPSocket:
     def __init__(self, udp_socket):
@@ -25,6 +41,15 @@ class SafeUDPSocket:
             bytes_sent = self.socket.sendto(data, addr)
         return bytes_sent
 
+    def sendmsg(self, buffers, addr):
+        with self.lock_send:
+            bytes_sent = self.socket.sendmsg(buffers, addr)
+        return bytes_sent
+
+    def sendmmsg(self, messages):
+        with self.lock_send:
+            self.socket.sendmmsg(messages)
+
     def recvfrom(self, size):
         with self.lock_recv:
             data = self.socket.recvfrom(size)
@@ -35,6 +60,9 @@ class SafeUDPSocket:
             value = self.socket.close()
         return value
 
+    def fileno(self):
+        return self.socket.fileno()
+
     def settimeout(self, timeout):
         with self.lock_send:
             value = self.socket.settimeout(timeout)
@@ -70,32 +98,69 @@ class MTQueueWrapper:
         return self.queue.get(block=block, timeout=timeout)
 
 
+# En el scheduler se ponen las partes de cada datagrama, que el
+# send_thread envía juntas con sendmsg() a la última dirección de la que
+# llegó algo con ese connection ID (addr se ignora)
 class MTSocketSender:
-    def __init__(self, addr, my_queue):
-        self.addr = addr
-        self.queue = my_queue
+    def __init__(self, connection_id, scheduler):
+        self.connection_id = connection_id
+        self.scheduler = scheduler
 
     def sendto(self, data, addr):
-        self.queue.put((data, addr))
-        return len(data)
+        return self.sendmsg((data,), addr)
+
+    def sendmsg(self, buffers, addr):
+        self.scheduler.put(buffers, self.connection_id)
+        return sum(len(buffer) for buffer in buffers)
+
+    # El send_thread ya junta los datagramas de todas las conexiones en
+    # cada sendmmsg()
+    def sendmmsg(self, messages):
+        for buffers, _ in messages:
+            self.scheduler.put(buffers, self.connection_id)
 
     def close(self):
-        self.queue.put((None, self.addr))
+        self.scheduler.put(None, self.connection_id)
 
 
 class MuxDemuxListener:
-    def __init__(self, buggyness_factor=0):
+    def __init__(
+        self,
+        buggyness_factor=0,
+        reuse_port=False,
+        max_connections=MAX_CONNECTIONS,
+        idle_timeout=IDLE_TIMEOUT,
+    ):
         self.buggyness_factor = buggyness_factor
+        # Ver BuggyUDPSocket.set_reuse_port()
+        self.reuse_port = reuse_port
         self.queue_timeout = None
         self.queue_block = True
         self.bind_addr = None
         self.queue_size = 0
         self.accept_addr = None
         self.accept_socket = None
+        # Por connection ID: el stream de cada conexión y la dirección a
+        # la que se le responde (ver PeerPath)
         self.bytestreams = {}
+        self.paths = {}
+        # Hora (de time.monotonic()) del último datagrama de cada una
+        self.last_seen = {}
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        # Para agregar y sacar conexiones de las tablas (la búsqueda de
+        # cada datagrama no lo toma). Se avisa cada vez que se saca una
+        self.table_lock = threading.Condition()
+        # Con close() no se aceptan más conexiones
+        self.closing = False
+        # Solo se crea un bytestream cuando el cliente devuelve la cookie
+        self.cookies = CookieIssuer()
         self.stop_event = threading.Event()
         self.waiting_connections = None
-        self.queue_to_send = queue.SimpleQueue()
+        # Cola de salida de todas las conexiones (ver SendScheduler)
+        self.scheduler = SendScheduler()
+        # Máximo de datagramas que el send_thread envía en cada sendmmsg()
+        self.send_batch = MAX_BATCH
 
         self.recv_thread_handle = threading.Thread(target=self.recv_thread)
         self.send_thread_handle = threading.Thread(target=self.send_thread)
@@ -104,6 +169,8 @@ class MuxDemuxListener:
         logger.info("Binding listener to {}".format(bind_addr))
         self.bind_addr = bind_addr
         accept_socket = BuggyUDPSocket(self.buggyness_factor)
+        if self.reuse_port:
+            accept_socket.set_reuse_port()
         accept_socket.bind(self.bind_addr)
         self.accept_socket = SafeUDPSocket(accept_socket)
 
@@ -116,82 +183,222 @@ class MuxDemuxListener:
     def accept(self):
         while True:
             try:
-                addr = self.waiting_connections.get(
+                connection_id = self.waiting_connections.get(
                     timeout=self.queue_timeout, block=self.queue_block
                 )
-                logger.debug("Accepted connection from {}".format(addr))
-                socket_sender = MTSocketSender(addr, self.queue_to_send)
+                # Ver interrupt_accept()
+                if connection_id is None:
+                    return None
+                path = self.paths.get(connection_id)
+                bytestream = self.bytestreams.get(connection_id)
+                if bytestream is None:
+                    # Se desalojó antes de que la aceptaran
+                    continue
+                logger.debug(f"Accepted connection from {path.addr}")
+                socket_sender = MTSocketSender(connection_id, self.scheduler)
 
                 new_stream = MuxDemuxStream()
                 new_stream.from_listener(
-                    self.bytestreams[addr], socket_sender, addr
+                    bytestream,
+                    socket_sender,
+                    path.addr,
+                    connection_id,
+                    path,
                 )
                 return new_stream
             except queue.Empty:
                 return None
 
+    # Hace que un accept() bloqueado (o el próximo) devuelva None, para
+    # poder esperar conexiones sin timeout y despertarlo al terminar
+    def interrupt_accept(self):
+        try:
+            self.waiting_connections.put_nowait(None)
+        except queue.Full:
+            # Con conexiones esperando accept() no se bloquea
+            pass
+
     def send_thread(self):
         while True:
             try:
-                (data, addr) = self.queue_to_send.get(timeout=1)
-                # Me indica que el socket se desconecto
-                if data is None:
-                    del self.bytestreams[addr]
-                    logger.debug(
-                        f"Removing addr {addr} from bytestreams (now"
-                        f" {len(self.bytestreams)} remaining)"
-                    )
-                else:
-                    bytes_sent = 0
-                    while bytes_sent < len(data):
-                        bytes_sent += self.accept_socket.sendto(
-                            data[bytes_sent:], addr
-                        )
+                batch = self.scheduler.get_batch(self.send_batch, timeout=1)
             except queue.Empty:
                 if self.stop_event.is_set():
                     logger.debug("Stopping send thread")
                     break
                 else:
                     continue
+            # Los datagramas listos salen juntos en un solo sendmmsg(), en el
+            # orden del scheduler
+            messages = []
+            stopping = False
+            for buffers, connection_id in batch:
+                # Me indica que el socket se desconecto
+                if buffers is None:
+                    self.__send_messages(messages)
+                    messages = []
+                    # Sin connection ID es close() despertando al thread
+                    if connection_id is None:
+                        stopping = True
+                        break
+                    self.__remove(connection_id)
+                    continue
+                path = self.paths.get(connection_id)
+                # Si no, la conexión se desalojó y el paquete se pierde
+                if path is not None:
+                    messages.append((buffers, path.addr))
+            self.__send_messages(messages)
+            if stopping:
+                logger.debug("Stopping send thread")
+                break
+
+    def __send_messages(self, messages):
+        if len(messages) == 1:
+            self.accept_socket.sendmsg(*messages[0])
+        elif messages:
+            self.accept_socket.sendmmsg(messages)
 
     def recv_thread(self):
         logger.debug("Starting accepter thread")
+        # Con timeout el socket queda no bloqueante para el receptor, pero
+        # los envíos esperan a poder escribir
         self.accept_socket.settimeout(1)
-        while True:
-            try:
-                data, addr = self.accept_socket.recvfrom(PACKET_SIZE)
-            except socket.timeout:
-                if self.stop_event.is_set():
-                    logger.debug("Stopping recv thread")
-                    break
-                else:
+        receiver = BatchReceiver(self.accept_socket, PACKET_SIZE)
+        next_reap = time.monotonic() + REAP_INTERVAL
+        while not self.stop_event.is_set():
+            batch = receiver.recv_batch(timeout=REAP_INTERVAL)
+            # Una sola hora para todo el batch
+            now = time.monotonic()
+            for data, addr in batch:
+                try:
+                    kind, connection_id, data = extract_packet(data)
+                except ValueError:
+                    # Cualquiera puede mandarlos: se descartan sin log,
+                    # que sería uno por datagrama (ver __demux)
                     continue
-
-            data = extract_packet(data)
-            logger.trace("Received packet: {}".format(data))
-
-            if addr not in self.bytestreams:
-                if not self.waiting_connections.full():
-                    # Necesito crear el bytestream aca porque el primer paquete
-                    # puede contener informacion
-                    logger.debug("Creating bytestream for {}".format(addr))
-                    self.bytestreams[addr] = MTByteStream()
-                    self.bytestreams[addr].put_bytes(data)
-                    self.waiting_connections.put(addr)
-                else:
-                    # Queue is full
-                    logger.warning("Queue is full")
-            else:
-                logger.debug("Adding packet to bytestream")
-                self.bytestreams[addr].put_bytes(data)
-
-    def close(self):
-        while len(self.bytestreams) > 0:
-            logger.warning(
-                f"bytestreams is not empty: {self.bytestreams.keys()}"
+                self.__demux(kind, connection_id, data, addr, now)
+            if now >= next_reap:
+                self.__reap(now)
+                next_reap = now + REAP_INTERVAL
+        logger.debug("Stopping recv thread")
+        receiver.close()
+
+    # Sin logs por datagrama: loguru arma el registro (con la hora) antes
+    # de filtrar por nivel, y esto se ejecuta para cada paquete recibido
+    def __demux(self, kind, connection_id, data, addr, now):
+        bytestream = self.bytestreams.get(connection_id)
+        path = self.paths.get(connection_id)
+        if bytestream is None or path is None:
+            if self.closing:
+                return
+            reply, data = self.cookies.handle_unknown(
+                kind, connection_id, data, addr
             )
-            time.sleep(2)
+            if reply is not None:
+                self.accept_socket.sendto(reply, addr)
+            if data is not None:
+                self.__new_connection(connection_id, data, addr, now)
+        else:
+            data = strip_cookie(kind, data)
+            if data is None:
+                return
+            self.last_seen[connection_id] = now
+            # Un datagrama vacío no llega al stream, así que no se cuenta
+            if not data:
+                return
+            # El cliente puede haber cambiado de dirección (por ejemplo un
+            # NAT que le cambió el puerto): se le responde a la nueva
+            # cuando la conexión la confirma
+            path.received_from(addr)
+            bytestream.put_bytes(data)
+
+    def __new_connection(self, connection_id, data, addr, now):
+        if self.waiting_connections.full():
+            logger.warning("Queue is full")
+            return
+        if len(self.bytestreams) >= self.max_connections:
+            if not self.__evict_least_recent(now):
+                logger.warning("Connection table is full")
+                return
+        # Necesito crear el bytestream aca porque el primer paquete
+        # puede contener informacion
+        logger.debug("Creating bytestream for {}".format(addr))
+        bytestream = MTByteStream()
+        path = PeerPath(addr)
+        if data:
+            path.received_from(addr)
+        bytestream.put_bytes(data)
+        with self.table_lock:
+            self.paths[connection_id] = path
+            self.last_seen[connection_id] = now
+            self.bytestreams[connection_id] = bytestream
+        self.waiting_connections.put(connection_id)
+
+    # Desaloja las conexiones de las que no se recibe nada hace más de
+    # idle_timeout
+    def __reap(self, now):
+        with self.table_lock:
+            idle = [
+                connection_id
+                for connection_id, seen in self.last_seen.items()
+                if now - seen > self.idle_timeout
+            ]
+        for connection_id in idle:
+            logger.info(f"Connection {connection_id} timed out")
+            self.__evict(connection_id)
+
+    def __evict_least_recent(self, now):
+        with self.table_lock:
+            connection_id, seen = min(
+                self.last_seen.items(), key=operator.itemgetter(1)
+            )
+        if now - seen < EVICT_MIN_IDLE:
+            return False
+        logger.info(f"Evicting least recently used connection {connection_id}")
+        self.__evict(connection_id)
+        return True
+
+    # Saca la conexión y cierra su stream: quien lo esté leyendo (el
+    # packet handler del socket de arriba) recibe EOFError y termina la
+    # conexión
+    def __evict(self, connection_id):
+        bytestream = self.__remove(connection_id)
+        if bytestream is not None:
+            bytestream.close()
+
+    def __remove(self, connection_id):
+        with self.table_lock:
+            bytestream = self.bytestreams.pop(connection_id, None)
+            path = self.paths.pop(connection_id, None)
+            self.last_seen.pop(connection_id, None)
+            self.table_lock.notify_all()
+            remaining = len(self.bytestreams)
+        self.scheduler.discard(connection_id)
+        if bytestream is not None:
+            logger.debug(
+                f"Removing connection {connection_id} ({path.addr}) from"
+                f" bytestreams (now {remaining} remaining)"
+            )
+        return bytestream
+
+    # Deja de aceptar conexiones y espera a que terminen las abiertas como
+    # mucho linger segundos. Las que quedan se desalojan
+    def close(self, linger=CLOSE_LINGER):
+        self.closing = True
+        with self.table_lock:
+            if not self.table_lock.wait_for(
+                lambda: not self.bytestreams, linger
+            ):
+                logger.warning(
+                    f"Closing listener with {len(self.bytestreams)} open"
+                    " connections"
+                )
+            open_connections = list(self.bytestreams)
+        for connection_id in open_connections:
+            self.__evict(connection_id)
         self.stop_event.set()
+        self.interrupt_accept()
+        self.scheduler.put(None, None)
         self.recv_thread_handle.join()
         self.send_thread_handle.join()
         self.accept_socket.close()
@@ -1,26 +1,16 @@
 import socket
 import threading
-import time
 
+from .batch_receiver import BatchReceiver
 from .buggy_udp import BuggyUDPSocket
+from .cookie import CookieClient
+from .header import encode_header, extract_packet, new_connection_id
 from ..utils import MTByteStream
 from loguru import logger
 
-MAGIC_WORD = "ROSTOV"
 PACKET_SIZE = 2**16 - 8
 
 
-def extract_packet(packet):
-    magic_word = packet[: len(MAGIC_WORD)]
-    magic_word = magic_word.decode("utf-8")
-    if magic_word != MAGIC_WORD:
-        logger.error(
-            "Invalid magic word (expected %s, got %s)", MAGIC_WORD, magic_word
-        )
-    packet = packet[len(MAGIC_WORD) :]
-    return packet
-
-
 class MuxDemuxStream:
     def __init__(self, buggyness_factor=0.0):
         self.buggyness_factor = buggyness_factor
@@ -28,7 +18,15 @@ class MuxDemuxStream:
         self.bytestream = None
         self.send_socket = None
         self.send_addr = None
+        self.connection_id = None
+        self.header = None
+        # Handshake con cookie, solo para el stream creado con connect()
+        self.cookie = None
         self.recv_socket = None
+        # Solo para el stream creado con from_listener(): la dirección del
+        # otro extremo y los datagramas leídos (ver confirm_path())
+        self.path = None
+        self.datagrams_read = 0
         # Only for stream created with connect()
         self.recv_thread_handle = None
         self.queue_timeout = None
@@ -36,50 +34,96 @@ class MuxDemuxStream:
         self.close_event = threading.Event()
 
     def connect(self, send_addr):
-        self.send_addr = send_addr
+        # Se resuelve una sola vez, así no se resuelve el nombre en cada
+        # envío y sendmmsg() recibe una IPv4 numérica
+        host, port = send_addr
+        self.send_addr = socket.getaddrinfo(
+            host, port, socket.AF_INET, socket.SOCK_DGRAM
+        )[0][4]
+        self.__set_connection_id(new_connection_id())
+        self.cookie = CookieClient(self.connection_id)
         self.bytestream = MTByteStream()
         self.recv_socket = BuggyUDPSocket(self.buggyness_factor)
         self.send_socket = self.recv_socket
         self.recv_thread_handle = threading.Thread(target=self.recv_thread)
         self.recv_thread_handle.start()
 
-    def from_listener(self, bytestream, send_socket, send_addr):
+    def from_listener(
+        self, bytestream, send_socket, send_addr, connection_id, path=None
+    ):
         logger.debug("Starting stream for listener")
         self.send_socket = send_socket
         self.send_addr = send_addr
+        self.path = path
+        self.__set_connection_id(connection_id)
         self.bytestream = bytestream
 
+    def __set_connection_id(self, connection_id):
+        self.connection_id = connection_id
+        self.header = encode_header(connection_id)
+
     def recv_thread(self):
         logger.debug("Starting receiver thread")
+        # Con timeout el socket queda no bloqueante para el receptor, pero
+        # los envíos esperan a poder escribir
         self.recv_socket.settimeout(1)
-        while True:
-            try:
-                data, addr = self.recv_socket.recvfrom(PACKET_SIZE)
-                data = extract_packet(data)
-
-                logger.debug(
-                    "Received {} bytes from {} ({})".format(
-                        len(data), addr, data
-                    )
-                )
-
+        receiver = BatchReceiver(self.recv_socket, PACKET_SIZE)
+        while not self.close_event.is_set():
+            for data, addr in receiver.recv_batch(timeout=1):
+                # Datagramas de otra dirección, que no son del protocolo o
+                # de otra conexión (cualquiera puede mandarlos a este
+                # puerto): se descartan sin log, que sería uno por
+                # datagrama, y sin cortar la recepción. Solo el listener
+                # sigue a una conexión que cambia de dirección, el
+                # servidor siempre responde desde la misma
                 if addr != self.send_addr:
-                    raise Exception(
-                        "Received packet from invalid address {} - Expected {}"
-                        .format(addr, self.send_addr)
-                    )
-                self.bytestream.put_bytes(data)
-            except socket.timeout:
-                if self.close_event.is_set():
-                    logger.debug("Receiver thread exiting")
-                    return
+                    continue
+                try:
+                    kind, connection_id, data = extract_packet(data)
+                except ValueError:
+                    continue
+                if connection_id != self.connection_id:
+                    continue
+                data, pending = self.cookie.received(kind, data)
+                for datagram in pending:
+                    self.send_socket.sendmsg(datagram, self.send_addr)
+                if data is not None:
+                    self.bytestream.put_bytes(data)
+        logger.debug("Receiver thread exiting")
+        receiver.close()
 
     def send(self, buffer):
-        self.send_socket.sendto(
-            str.encode(MAGIC_WORD) + buffer, self.send_addr
-        )
+        return self.send_buffers((buffer,))
+
+    # Envía un datagrama formado por los buffers (por ejemplo header y
+    # body de un paquete) sin copiarlos: se juntan en el sendmsg()
+    # El stream de connect() los manda según el handshake (ver
+    # CookieClient)
+    def send_buffers(self, buffers):
+        if self.cookie is None:
+            self.send_socket.sendmsg((self.header, *buffers), self.send_addr)
+        else:
+            for datagram in self.cookie.wrap(buffers):
+                self.send_socket.sendmsg(datagram, self.send_addr)
         # Siempre se envia la totalidad del paquete
-        return len(buffer)
+        return sum(len(buffer) for buffer in buffers)
+
+    # Como send_buffers() para varios datagramas (uno por cada tupla de
+    # buffers), con una sola llamada al sistema si se puede (sendmmsg)
+    def send_batch(self, datagrams):
+        if self.cookie is None:
+            messages = [
+                ((self.header, *buffers), self.send_addr)
+                for buffers in datagrams
+            ]
+        else:
+            messages = [
+                (datagram, self.send_addr)
+                for buffers in datagrams
+                for datagram in self.cookie.wrap(buffers)
+            ]
+        self.send_socket.sendmmsg(messages)
+        return sum(len(buffer) for buffers in datagrams for buffer in buffers)
 
     def send_all(self, data):
         bytes_sent = 0
@@ -88,30 +132,50 @@ class MuxDemuxStream:
         return bytes_sent
 
     def recv(self, buff_size):
-        data = b""
-        while len(data) < buff_size:
-            new_data = self.bytestream.get_bytes(
-                buff_size - len(data),
-                self.queue_timeout,
-                block=self.queue_block,
+        return self.bytestream.get_bytes(
+            buff_size, self.queue_timeout, block=self.queue_block
+        )
+
+    # Como recv(), pero copia los datos en buffer y devuelve cuántos leyó
+    def recv_into(self, buffer):
+        return self.bytestream.readinto(
+            buffer, self.queue_timeout, block=self.queue_block
+        )
+
+    # Devuelve el contenido de un datagrama entero (un paquete), sin
+    # pasar por el stream de bytes
+    def recv_datagram(self):
+        try:
+            datagram = self.bytestream.get_chunk(
+                self.queue_timeout, block=self.queue_block
             )
-            if new_data != b"":
-                data += new_data
-            else:
-                return data
+        except socket.timeout as e:
+            raise TimeoutError("Timeout reading from stream") from e
+        self.datagrams_read += 1
+        return datagram
+
+    # El último datagrama leído hizo avanzar la conexión (un INFO nuevo o
+    # un ACK de algo pendiente): si llegó de otra dirección, el listener
+    # pasa a responder ahí (ver PeerPath)
+    def confirm_path(self):
+        if self.path is not None:
+            self.path.confirm(self.datagrams_read)
+
+    # Se bloquea en el stream hasta tener buff_size bytes, con el timeout
+    # del stream como tiempo total de la lectura
+    def recv_exact(self, buff_size):
+        try:
+            data = self.recv(buff_size)
+        except socket.timeout as e:
+            raise TimeoutError("Timeout reading from stream") from e
+        if len(data) < buff_size:
+            raise TimeoutError("Timeout reading from stream")
         return data
 
-    def recv_exact(self, buff_size):
-        data = b""
-        start = time.time()
-        while True:
-            data += self.recv(buff_size - len(data))
-            if len(data) == buff_size:
-                return data
-            else:
-                if time.time() - start > self.queue_timeout:
-                    raise TimeoutError("Timeout reading from stream")
-                time.sleep(0.1)
+    # Despierta a quien esté bloqueado leyendo del stream (ver
+    # MTByteStream.interrupt)
+    def interrupt(self):
+        self.bytestream.interrupt()
 
     def settimeout(self, timeout):
         self.queue_timeout = timeout
@@ -0,0 +1,42 @@
+import threading
+
+# Datagramas de otra dirección que se recuerdan como mucho por conexión
+# hasta que la conexión confirma alguno
+MAX_CANDIDATES = 64
+
+
+# Dirección a la que se le responde a una conexión del listener. Un
+# datagrama que llega de otra dirección (un NAT que le cambió el puerto
+# al cliente, pero también un paquete viejo repetido o uno falsificado
+# con el connection ID) no la cambia: se anota su número y solo se pasa
+# a esa dirección si la conexión de arriba confirma que ese datagrama
+# hizo avanzar su estado (ver MuxDemuxStream.confirm_path)
+class PeerPath:
+    def __init__(self, addr):
+        self.addr = addr
+        self.lock = threading.Lock()
+        # Datagramas pasados a la conexión, y por número los que vinieron
+        # de otra dirección
+        self.received = 0
+        self.candidates = {}
+
+    # Se llama con cada datagrama que se le pasa a la conexión, en el
+    # orden en que se los va a leer
+    def received_from(self, addr):
+        with self.lock:
+            self.received += 1
+            if addr != self.addr and len(self.candidates) < MAX_CANDIDATES:
+                self.candidates[self.received] = addr
+
+    # El datagrama número number (contando desde 1) hizo avanzar la
+    # conexión. Los anteriores ya no pueden confirmarse
+    def confirm(self, number):
+        with self.lock:
+            if not self.candidates:
+                return
+            addr = self.candidates.pop(number, None)
+            self.candidates = {
+                n: a for n, a in self.candidates.items() if n > number
+            }
+            if addr is not None:
+                self.addr = addr
@@ -0,0 +1,118 @@
+import queue
+import threading
+from collections import deque
+
+# Tipo (primer byte) de los paquetes con datos, INFO, tanto en selective
+# repeat como en stop and wait. El resto (CONNECT, ACK, FIN, ...) son de
+# control
+INFO_TYPE = b"2"
+# Bytes que puede enviar cada conexión por ronda de deficit round robin.
+# Tiene que ser al menos el datagrama más grande para que cada ronda
+# avance
+QUANTUM = 2**16
+
+
+# Los datagramas se pasan como (header de mux-demux, header del paquete,
+# body...), ver MuxDemuxStream.send_buffers()
+def is_control(buffers):
+    return len(buffers) < 2 or buffers[1][:1] != INFO_TYPE
+
+
+# Cola de salida del listener. Los paquetes de control (y los avisos de
+# cierre) salen antes que cualquier INFO, en orden de llegada. Los INFO
+# quedan en una cola por conexión y se reparten con deficit round robin:
+# en cada ronda una conexión envía hasta QUANTUM bytes, así una ventana
+# entera de una descarga grande no demora a las demás conexiones
+class SendScheduler:
+    def __init__(self, quantum=QUANTUM):
+        self.quantum = quantum
+        self.condition = threading.Condition()
+        self.control = deque()
+        # Por connection ID: (buffers, tamaño) de los INFO pendientes y el
+        # crédito en bytes de la ronda
+        self.queues = {}
+        self.deficits = {}
+        # Conexiones con INFO pendientes, la primera es la que está
+        # enviando
+        self.active = deque()
+
+    # Con buffers None es un aviso para el thread que envía (ver
+    # MuxDemuxListener.send_thread)
+    def put(self, buffers, connection_id):
+        with self.condition:
+            if buffers is None or is_control(buffers):
+                self.control.append((buffers, connection_id))
+            else:
+                pending = self.queues.get(connection_id)
+                if pending is None:
+                    pending = self.queues[connection_id] = deque()
+                    # El crédito se da al llegarle el turno: enseguida si
+                    # no hay otras esperando
+                    self.deficits[connection_id] = (
+                        0 if self.active else self.quantum
+                    )
+                    self.active.append(connection_id)
+                size = sum(len(buffer) for buffer in buffers)
+                pending.append((buffers, size))
+            self.condition.notify()
+
+    # Devuelve el próximo (buffers, connection_id) a enviar. Lanza
+    # queue.Empty si no hay nada después de timeout segundos
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.control or self.active, timeout
+            ):
+                raise queue.Empty
+            if self.control:
+                return self.control.popleft()
+            return self.__next_info()
+
+    # Como get(), pero devuelve una lista con hasta max_count de los
+    # próximos a enviar, en orden
+    def get_batch(self, max_count, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.control or self.active, timeout
+            ):
+                raise queue.Empty
+            batch = []
+            while len(batch) < max_count and (self.control or self.active):
+                if self.control:
+                    batch.append(self.control.popleft())
+                else:
+                    batch.append(self.__next_info())
+            return batch
+
+    # Descarta los INFO pendientes de una conexión que se cerró
+    def discard(self, connection_id):
+        with self.condition:
+            if self.queues.pop(connection_id, None) is None:
+                return
+            del self.deficits[connection_id]
+            was_first = self.active[0] == connection_id
+            self.active.remove(connection_id)
+            if was_first and self.active:
+                self.deficits[self.active[0]] += self.quantum
+
+    def __next_info(self):
+        while True:
+            connection_id = self.active[0]
+            pending = self.queues[connection_id]
+            buffers, size = pending[0]
+            if size <= self.deficits[connection_id]:
+                break
+            # No le alcanza el crédito: le toca a la siguiente, con un
+            # quantum más
+            self.active.rotate(-1)
+            self.deficits[self.active[0]] += self.quantum
+        pending.popleft()
+        self.deficits[connection_id] -= size
+        if not pending:
+            # Sin nada pendiente no acumula crédito para la próxima vez
+            del self.queues[connection_id]
+            del self.deficits[connection_id]
+            self.active.popleft()
+            if self.active:
+                self.deficits[self.active[0]] += self.quantum
+        return buffers, connection_id
@@ -0,0 +1,157 @@
+import asyncio
+
+from loguru import logger
+
+from lib.mux_demux.cookie import CookieIssuer, strip_cookie
+from lib.mux_demux.header import extract_packet
+from lib.selective_repeat.async_sr_socket import (
+    AsyncSRSocket,
+    datagram_sender,
+    set_recv_buffer,
+)
+from lib.selective_repeat.packet import CONNECT, Packet
+
+# Lo que espera close() a que terminen las conexiones aceptadas
+CLOSE_LINGER = 10
+
+
+# Recibe los datagramas del socket del listener y los reparte por
+# connection ID entre las conexiones (como MuxDemuxListener)
+class ListenerDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, listener):
+        self.listener = listener
+
+    def datagram_received(self, data, addr):
+        try:
+            kind, connection_id, packet = extract_packet(data)
+        except ValueError:
+            # Cualquiera puede mandarlos: se descartan sin log (como
+            # Endpoint)
+            return
+        self.listener.datagram_received(kind, connection_id, packet, addr)
+
+    def error_received(self, exc):
+        logger.warning(f"UDP socket error: {exc}")
+
+
+# Versión asyncio de RDTListener (solo selective repeat): acepta
+# conexiones de SRSocket o AsyncSRSocket y devuelve AsyncSRSocket
+class AsyncRDTListener:
+    def __init__(self, buggyness_factor=0.0, **socket_args):
+        self.buggyness_factor = buggyness_factor
+        # Argumentos de los AsyncSRSocket aceptados
+        self.socket_args = socket_args
+        self.transport = None
+        # Por connection ID: la conexión y la dirección a la que se envía
+        self.connections = {}
+        self.addresses = {}
+        # Las conexiones se crean cuando el cliente devuelve la cookie
+        self.cookies = CookieIssuer()
+        self.queue_size = 0
+        self.connecting = 0
+        self.accepted = None
+        # Seteado mientras no hay conexiones (lo espera close())
+        self.idle = None
+        self.recv_addr = None
+
+    async def bind(self, recv_addr):
+        logger.debug(f"bind({recv_addr})")
+        self.recv_addr = recv_addr
+        self.idle = asyncio.Event()
+        self.idle.set()
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: ListenerDatagramProtocol(self), local_addr=recv_addr
+        )
+        set_recv_buffer(self.transport)
+
+    # Cantidad de conexiones establecidas esperando un accept(), y de
+    # conexiones estableciéndose, a partir de la cual se ignoran los
+    # CONNECT nuevos
+    def listen(self, queue_size):
+        self.queue_size = queue_size
+        self.accepted = asyncio.Queue()
+
+    async def accept(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.accepted.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def datagram_received(self, kind, connection_id, packet, addr):
+        connection = self.connections.get(connection_id)
+        if connection is not None:
+            packet = strip_cookie(kind, packet)
+            # Solo un paquete que hace avanzar la conexión la pasa a la
+            # dirección de la que llegó (ver SRConnection.datagram_received).
+            # La conexión pudo terminar con ese mismo paquete
+            if (
+                packet is not None
+                and connection.datagram_received(packet)
+                and connection_id in self.addresses
+            ):
+                self.addresses[connection_id] = addr
+            return
+        reply, packet = self.cookies.handle_unknown(
+            kind, connection_id, packet, addr
+        )
+        if reply is not None:
+            self.transport.sendto(reply, addr)
+        if packet is not None and bytes(packet[:1]) == CONNECT:
+            try:
+                connect = Packet.from_datagram(packet)
+            except ValueError as e:
+                logger.warning(f"Dropping invalid CONNECT: {e}")
+                return
+            self.__new_connection(connection_id, connect, addr)
+
+    # Espera a que terminen las conexiones aceptadas como mucho linger
+    # segundos (como MuxDemuxListener.close()) y cierra el socket. Las que
+    # quedan ya no reciben nada
+    async def close(self, linger=CLOSE_LINGER):
+        logger.debug("Stopping RDT listener")
+        try:
+            await asyncio.wait_for(self.idle.wait(), linger)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Closing listener with {len(self.connections)} open"
+                " connections"
+            )
+        self.transport.close()
+
+    def __new_connection(self, connection_id, connect, addr):
+        if self.accepted is None:
+            return
+        if self.accepted.qsize() + self.connecting >= self.queue_size:
+            logger.warning("Queue is full")
+            return
+        logger.debug(f"New connection from {addr}")
+        socket = AsyncSRSocket(**self.socket_args)
+        connection = socket.from_listener(
+            datagram_sender(
+                self.transport,
+                connection_id,
+                self.addresses,
+                self.buggyness_factor,
+            )
+        )
+        connection.on_finished = lambda _: self.__remove(connection_id)
+        self.addresses[connection_id] = addr
+        self.connections[connection_id] = connection
+        self.idle.clear()
+        self.connecting += 1
+        socket.established.add_done_callback(
+            lambda established: self.__established(socket, established)
+        )
+        connection.accept(connect)
+
+    def __remove(self, connection_id):
+        del self.connections[connection_id]
+        del self.addresses[connection_id]
+        if not self.connections:
+            self.idle.set()
+
+    def __established(self, socket, established):
+        self.connecting -= 1
+        if established.exception() is None:
+            self.accepted.put_nowait(socket)
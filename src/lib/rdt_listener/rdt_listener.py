@@ -1,4 +1,9 @@
-from lib.mux_demux.mux_demux_listener import MuxDemuxListener
+from lib.mux_demux.mux_demux_listener import (
+    CLOSE_LINGER,
+    IDLE_TIMEOUT,
+    MAX_CONNECTIONS,
+    MuxDemuxListener,
+)
 from lib.stop_and_wait.saw_socket import SAWSocket
 from lib.selective_repeat.sr_socket import SRSocket
 
@@ -9,11 +14,25 @@ SELECTIVE_REPEAT = "selective_repeat"
 
 
 class RDTListener:
-    def __init__(self, rdt_method: str, buggyness_factor=0.0):
+    def __init__(
+        self,
+        rdt_method: str,
+        buggyness_factor=0.0,
+        congestion_control=None,
+        reuse_port=False,
+        max_connections=MAX_CONNECTIONS,
+        idle_timeout=IDLE_TIMEOUT,
+    ):
         self.rdt_method = rdt_method
+        # Control de congestión de los SRSocket aceptados (None para usar
+        # el default del socket)
+        self.congestion_control = congestion_control
         self.queue_size = 0
         self.recv_addr = None
-        self.mux_demux_listener = MuxDemuxListener(buggyness_factor)
+        # Ver MuxDemuxListener para max_connections e idle_timeout
+        self.mux_demux_listener = MuxDemuxListener(
+            buggyness_factor, reuse_port, max_connections, idle_timeout
+        )
         self.buggyness_factor = buggyness_factor
 
     def bind(self, recv_addr):
@@ -26,25 +45,47 @@ class RDTListener:
         self.mux_demux_listener.listen(queue_size)
 
     def accept(self, **socket_args):
-        new_mux_demux_stream = self.mux_demux_listener.accept()
+        new_mux_demux_stream = self.accept_stream()
         if new_mux_demux_stream is None:
             return None
+        return self.handshake(new_mux_demux_stream, **socket_args)
 
+    # La primera mitad de accept(): devuelve el stream de la próxima
+    # conexión sin esperar su CONNECT, para hacer el handshake en otro
+    # thread y que un cliente lento no demore a los demás
+    def accept_stream(self):
+        return self.mux_demux_listener.accept()
+
+    # La segunda mitad de accept(): espera el CONNECT del stream y
+    # devuelve el socket conectado. Si falla el stream queda cerrado
+    def handshake(self, new_mux_demux_stream, **socket_args):
         if self.rdt_method == STOP_AND_WAIT:
             new_rdt_stream = SAWSocket(self.buggyness_factor, **socket_args)
         elif self.rdt_method == SELECTIVE_REPEAT:
+            if self.congestion_control is not None:
+                socket_args.setdefault(
+                    "congestion_control", self.congestion_control
+                )
             new_rdt_stream = SRSocket(**socket_args)
         else:
             raise NotImplementedError(
                 f"RDT method {self.rdt_method} not implemented"
             )
-        new_rdt_stream.from_listener(new_mux_demux_stream)
+        try:
+            new_rdt_stream.from_listener(new_mux_demux_stream)
+        except Exception:
+            new_mux_demux_stream.close()
+            raise
 
         return new_rdt_stream
 
-    def close(self):
+    # Ver MuxDemuxListener.interrupt_accept()
+    def interrupt_accept(self):
+        self.mux_demux_listener.interrupt_accept()
+
+    def close(self, linger=CLOSE_LINGER):
         logger.debug("Stopping RDT listener")
-        self.mux_demux_listener.close()
+        self.mux_demux_listener.close(linger)
 
     def settimeout(self, timeout):
         self.mux_demux_listener.settimeout(timeout)
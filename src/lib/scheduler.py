@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from loguru import logger
+
+
+# Timer devuelto por TimerScheduler.call_later(), se puede cancelar
+# en O(1) (queda marcado y se descarta cuando llega al tope del heap)
+class TimerHandle:
+    __slots__ = ("when", "call", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        # Callback y argumentos juntos: cancel() puede correr en otro
+        # thread, y así no se puede leer uno sin el otro
+        self.call = (callback, args)
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.call = None
+
+    # Para quien lo ejecuta: (callback, args), o None si se canceló
+    def take(self):
+        call = self.call
+        self.cancel()
+        return call
+
+
+# Un solo thread que ejecuta todos los timers del proceso. Los timers se
+# guardan en un heap ordenado por vencimiento, armar uno es O(log n) y
+# cancelarlo O(1)
+# Los callbacks se ejecutan en el thread del scheduler, por lo que no
+# deben bloquear
+class TimerScheduler:
+    def __init__(self, name="TimerScheduler"):
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.name = name
+        self.thread = None
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(when, callback, args)
+        with self.condition:
+            self.__ensure_started()
+            heapq.heappush(self.heap, (when, next(self.counter), handle))
+            # Solo hace falta despertar al thread si cambió el próximo
+            # vencimiento
+            if self.heap[0][2] is handle:
+                self.condition.notify()
+        return handle
+
+    def pending(self):
+        with self.condition:
+            return sum(1 for _, _, h in self.heap if not h.cancelled)
+
+    def __ensure_started(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name=self.name, daemon=True
+            )
+            self.thread.start()
+
+    def __next_due(self):
+        with self.condition:
+            while True:
+                while self.heap and self.heap[0][2].cancelled:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                delay = self.heap[0][0] - time.monotonic()
+                if delay <= 0:
+                    return heapq.heappop(self.heap)[2]
+                self.condition.wait(delay)
+
+    def run(self):
+        while True:
+            call = self.__next_due().take()
+            if call is None:
+                continue
+            callback, args = call
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.exception(f"Error running timer callback: {e}")
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+# Scheduler compartido por todos los sockets del proceso
+def get_scheduler():
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = TimerScheduler()
+        return _default_scheduler
+
+
+# Un proceso hijo de fork() hereda el scheduler pero no su thread: se
+# crea otro la primera vez que se lo pida
+def _reset_after_fork():
+    global _default_scheduler, _default_lock
+    _default_scheduler = None
+    _default_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,252 @@
+import asyncio
+import random
+import socket
+from collections import deque
+
+from loguru import logger
+
+from lib.engine.sr_connection import SRConnection, SRProtocol
+from lib.mux_demux.batch_receiver import SOCKET_RECV_BUFFER
+from lib.mux_demux.cookie import CookieClient
+from lib.mux_demux.header import (
+    encode_header,
+    extract_packet,
+    new_connection_id,
+)
+from .constants import RECV_BUFFER_SIZE
+from .sr_socket import EndOfStream
+
+
+# Envía los paquetes de una SRConnection por un transport de asyncio,
+# perdiendo algunos como BuggyUDPSocket. Si se pasa addresses, se envía a
+# addresses[connection_id] (la conexión puede cambiar de dirección), si
+# no a la dirección a la que está conectado el transport. Los clientes
+# pasan su CookieClient para hacer el handshake
+# El transport no tiene sendmsg(), así que cada datagrama se junta en un
+# solo bytes antes de enviarlo
+def datagram_sender(
+    transport,
+    connection_id,
+    addresses=None,
+    buggyness_factor=0.0,
+    cookie=None,
+):
+    header = encode_header(connection_id)
+
+    def send(parts):
+        if random.random() > buggyness_factor:
+            addr = addresses[connection_id] if addresses is not None else None
+            if cookie is None:
+                transport.sendto(b"".join((header, *parts)), addr)
+                return
+            for datagram in cookie.wrap(parts):
+                transport.sendto(b"".join(datagram), addr)
+        else:
+            logger.warning(f"Lost packet. First 10 bytes: {parts[0][:10]}")
+
+    return send
+
+
+# Agranda el buffer de recepción del socket del transport (como
+# BatchReceiver): asyncio lee un datagrama por vez y con muchas
+# conexiones el default se llena enseguida
+def set_recv_buffer(transport):
+    try:
+        transport.get_extra_info("socket").setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RECV_BUFFER
+        )
+    except OSError as e:
+        logger.warning(f"Could not set receive buffer size: {e}")
+
+
+# Recibe los datagramas del socket UDP de un AsyncSRSocket cliente
+class ClientDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, cookie):
+        self.cookie = cookie
+        self.transport = None
+        self.connection = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            kind, connection_id, packet = extract_packet(data)
+        except ValueError:
+            # Se descartan sin log, como los de otras conexiones
+            return
+        if not self.connection or connection_id != self.cookie.connection_id:
+            return
+        packet, pending = self.cookie.received(kind, packet)
+        for datagram in pending:
+            self.transport.sendto(b"".join(datagram))
+        if packet is not None:
+            self.connection.datagram_received(packet)
+
+    def error_received(self, exc):
+        logger.warning(f"UDP socket error: {exc}")
+
+
+# Versión asyncio de SRSocket: la conexión la maneja una SRConnection
+# sobre el loop de asyncio (sin threads) y los métodos se esperan con
+# await. Es compatible con SRSocket y RDTListener del otro lado
+class AsyncSRSocket(SRProtocol):
+    def __init__(self, **connection_args):
+        # Argumentos de SRConnection (window_size, max_size, etc.)
+        self.connection_args = connection_args
+        self.connection = None
+        self.transport = None
+        self.loop = None
+        self.chunks = deque()
+        self.buffered = 0
+        self.eof = False
+        self.readable = None
+        self.writable = None
+        self.established = None
+        self.finished = None
+        self.exc = None
+
+    async def connect(self, addr, buggyness_factor=0.0):
+        if self.connection is not None:
+            raise Exception("Socket has already been connected")
+        self.__setup()
+        cookie = CookieClient(new_connection_id())
+        transport, datagrams = await self.loop.create_datagram_endpoint(
+            lambda: ClientDatagramProtocol(cookie), remote_addr=addr
+        )
+        self.transport = transport
+        set_recv_buffer(transport)
+        self.connection = self.new_connection(
+            datagram_sender(
+                transport,
+                cookie.connection_id,
+                buggyness_factor=buggyness_factor,
+                cookie=cookie,
+            ),
+            True,
+        )
+        datagrams.connection = self.connection
+        self.connection.connect()
+        await self.established
+
+    # Usado por AsyncRDTListener para los sockets que acepta
+    def from_listener(self, sender):
+        self.__setup()
+        self.connection = self.new_connection(sender, False)
+        return self.connection
+
+    def new_connection(self, sender, is_client):
+        return SRConnection(
+            self.loop, sender, self, is_client, **self.connection_args
+        )
+
+    def srtt(self):
+        return self.connection.srtt()
+
+    def rto(self):
+        return self.connection.rto()
+
+    async def send(self, buffer):
+        if self.connection is None or self.connection.is_finished():
+            raise Exception("Socket is not connected or connection was closed")
+        # Espera si hay demasiados bytes sin enviar (ver WRITE_HIGH_WATER)
+        await self.writable.wait()
+        self.connection.write(buffer)
+
+    async def recv(self, buff_size, timeout=None):
+        if self.connection is None:
+            raise Exception("Socket is not connected")
+        while not self.chunks:
+            if self.eof:
+                raise EndOfStream("Connection was closed")
+            self.readable.clear()
+            try:
+                await asyncio.wait_for(self.readable.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Timeout reading from socket")
+        return self.__take(buff_size)
+
+    # Si pasa el timeout o se termina el stream, devuelve lo leído hasta
+    # el momento
+    async def recv_exact(self, size, timeout=None):
+        pieces = []
+        received = 0
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while received < size:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - self.loop.time()
+            try:
+                pieces.append(await self.recv(size - received, remaining))
+            except (TimeoutError, EndOfStream):
+                if received == 0:
+                    raise
+                break
+            received += len(pieces[-1])
+        return b"".join(pieces)
+
+    # Cierra después de que se reconozca todo lo enviado
+    async def close(self):
+        if self.connection is None:
+            return
+        self.connection.close()
+        await asyncio.shield(self.finished)
+
+    def connection_made(self, connection):
+        if not self.established.done():
+            self.established.set_result(None)
+
+    def data_received(self, data):
+        self.chunks.append(data)
+        self.buffered += len(data)
+        self.readable.set()
+        # Lo que no se lee queda en la SRConnection y se achica la ventana
+        # de recepción del otro extremo
+        if self.buffered >= RECV_BUFFER_SIZE:
+            self.connection.pause_reading()
+
+    def eof_received(self):
+        self.eof = True
+        self.readable.set()
+
+    def connection_lost(self, exc):
+        self.eof = True
+        self.exc = exc
+        self.readable.set()
+        self.writable.set()
+        if not self.established.done():
+            self.established.set_exception(
+                exc or ConnectionError("Connection closed while connecting")
+            )
+        if not self.finished.done():
+            self.finished.set_result(None)
+        if self.transport is not None:
+            self.transport.close()
+
+    def pause_writing(self):
+        self.writable.clear()
+
+    def resume_writing(self):
+        self.writable.set()
+
+    def __setup(self):
+        self.loop = asyncio.get_running_loop()
+        self.readable = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self.established = self.loop.create_future()
+        self.finished = self.loop.create_future()
+
+    def __take(self, size):
+        pieces = []
+        while self.chunks and size > 0:
+            chunk = self.chunks.popleft()
+            if len(chunk) > size:
+                self.chunks.appendleft(chunk[size:])
+                chunk = chunk[:size]
+            pieces.append(chunk)
+            size -= len(chunk)
+            self.buffered -= len(chunk)
+        if self.buffered < RECV_BUFFER_SIZE // 2:
+            self.connection.resume_reading()
+        return b"".join(pieces)
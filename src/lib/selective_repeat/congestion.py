@@ -0,0 +1,246 @@
+from abc import ABC, abstractmethod
+from collections import deque
+import time
+
+from .constants import INITIAL_CWND, MIN_CWND
+
+# Ventanas de congestión (en paquetes) que el AckNumberProvider combina
+# con la window del selective repeat: se usa min(cwnd, window_size)
+# Todos los métodos se llaman con el lock del AckNumberProvider tomado
+
+
+class CongestionControl(ABC):
+    name = None
+
+    def __repr__(self):
+        return self.__class__.__name__
+
+    # Cantidad de paquetes que se pueden tener sin ACK
+    @abstractmethod
+    def window(self):
+        pass
+
+    # Llegó el ACK de acked paquetes nuevos, rtt es la muestra de RTT
+    # (None si no hubo, por ejemplo por ser una retransmisión)
+    @abstractmethod
+    def on_ack(self, acked, rtt):
+        pass
+
+    # Se detectó una pérdida sin esperar el timeout (fast retransmit)
+    @abstractmethod
+    def on_loss(self):
+        pass
+
+    # Expiró el timer de retransmisión de un paquete
+    @abstractmethod
+    def on_timeout(self):
+        pass
+
+
+# Sin control de congestión, solo limita la window del selective repeat
+class NoCongestionControl(CongestionControl):
+    name = "none"
+
+    def window(self):
+        return float("inf")
+
+    def on_ack(self, acked, rtt):
+        pass
+
+    def on_loss(self):
+        pass
+
+    def on_timeout(self):
+        pass
+
+
+# AIMD (RFC 5681): slow start hasta ssthresh, después crece un paquete
+# por RTT y se divide a la mitad con cada pérdida
+class Reno(CongestionControl):
+    name = "reno"
+
+    def __init__(self, initial_window=INITIAL_CWND):
+        self.cwnd = initial_window
+        self.ssthresh = float("inf")
+
+    def window(self):
+        return max(int(self.cwnd), MIN_CWND)
+
+    def on_ack(self, acked, rtt):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+
+    def on_loss(self):
+        self.ssthresh = max(self.cwnd / 2, 2 * MIN_CWND)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self):
+        self.ssthresh = max(self.cwnd / 2, 2 * MIN_CWND)
+        self.cwnd = MIN_CWND
+
+
+# CUBIC (RFC 8312): después de una pérdida la ventana sigue una función
+# cúbica del tiempo centrada en la ventana en la que se perdió
+class Cubic(CongestionControl):
+    name = "cubic"
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, initial_window=INITIAL_CWND):
+        self.cwnd = initial_window
+        self.ssthresh = float("inf")
+        self.w_max = 0
+        self.k = 0
+        self.epoch_start = None
+        self.min_rtt = None
+
+    def window(self):
+        return max(int(self.cwnd), MIN_CWND)
+
+    def on_ack(self, acked, rtt):
+        if rtt is not None:
+            self.min_rtt = (
+                rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+            )
+
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+            return
+
+        now = time.monotonic()
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1 / 3)
+            else:
+                self.k = 0
+                self.w_max = self.cwnd
+
+        t = now - self.epoch_start + (self.min_rtt or 0)
+        target = self.C * (t - self.k) ** 3 + self.w_max
+
+        # Región "TCP friendly": nunca crecer más lento que Reno
+        if self.min_rtt:
+            reno = self.w_max * self.BETA + (
+                3 * (1 - self.BETA) / (1 + self.BETA)
+            ) * ((now - self.epoch_start) / self.min_rtt)
+            target = max(target, reno)
+
+        if target > self.cwnd:
+            self.cwnd += acked * (target - self.cwnd) / self.cwnd
+        else:
+            self.cwnd += acked * 0.01 / self.cwnd
+
+    def __reduce(self):
+        self.epoch_start = None
+        # Fast convergence: liberar ancho de banda para flujos nuevos
+        if self.cwnd < self.w_max:
+            self.w_max = self.cwnd * (1 + self.BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * self.BETA, 2 * MIN_CWND)
+
+    def on_loss(self):
+        self.__reduce()
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self):
+        self.__reduce()
+        self.cwnd = MIN_CWND
+
+
+# Control basado en la tasa de entrega (estilo BBR): estima el ancho de
+# banda como la máxima tasa de entrega de las últimas rondas y el RTT
+# mínimo, y usa como ventana un múltiplo del BDP (bandwidth-delay product)
+# Las pérdidas no se toman como señal de congestión, solo los timeouts
+class DeliveryRate(CongestionControl):
+    name = "bbr"
+    CWND_GAIN = 2
+    BW_FILTER_ROUNDS = 10
+    MIN_RTT_WINDOW = 10
+    STARTUP_GROWTH = 1.25
+    STARTUP_ROUNDS = 3
+
+    def __init__(self, initial_window=INITIAL_CWND):
+        self.cwnd = initial_window
+        self.bw_samples = deque(maxlen=self.BW_FILTER_ROUNDS)
+        self.min_rtt = None
+        self.min_rtt_stamp = 0
+        self.delivered = 0
+        self.round_start = None
+        self.round_delivered = 0
+        self.filling_pipe = True
+        self.full_bw = 0
+        self.full_bw_rounds = 0
+
+    def window(self):
+        return max(int(self.cwnd), MIN_CWND)
+
+    def max_bw(self):
+        return max(self.bw_samples, default=0)
+
+    def on_ack(self, acked, rtt):
+        now = time.monotonic()
+        self.delivered += acked
+        if rtt is not None and (
+            self.min_rtt is None
+            or rtt <= self.min_rtt
+            or now - self.min_rtt_stamp > self.MIN_RTT_WINDOW
+        ):
+            self.min_rtt = rtt
+            self.min_rtt_stamp = now
+
+        if self.round_start is None:
+            self.round_start = now
+            self.round_delivered = self.delivered
+        elif self.min_rtt and now - self.round_start >= self.min_rtt:
+            self.__end_round(now)
+
+        if self.filling_pipe:
+            # Startup: crecer como slow start hasta que el ancho de banda
+            # deje de aumentar
+            self.cwnd += acked
+        elif self.min_rtt:
+            self.cwnd = self.CWND_GAIN * self.max_bw() * self.min_rtt
+
+    def __end_round(self, now):
+        bw = (self.delivered - self.round_delivered) / (now - self.round_start)
+        self.bw_samples.append(bw)
+        self.round_start = now
+        self.round_delivered = self.delivered
+
+        if not self.filling_pipe:
+            return
+        if self.max_bw() >= self.full_bw * self.STARTUP_GROWTH:
+            self.full_bw = self.max_bw()
+            self.full_bw_rounds = 0
+            return
+        self.full_bw_rounds += 1
+        if self.full_bw_rounds >= self.STARTUP_ROUNDS:
+            self.filling_pipe = False
+
+    def on_loss(self):
+        pass
+
+    def on_timeout(self):
+        self.cwnd = MIN_CWND
+        self.round_start = None
+
+
+CONGESTION_CONTROLS = {
+    cls.name: cls for cls in (NoCongestionControl, Reno, Cubic, DeliveryRate)
+}
+
+
+def new_congestion_control(name):
+    if isinstance(name, CongestionControl):
+        return name
+    try:
+        return CONGESTION_CONTROLS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown congestion control: {name} (available:"
+            f" {', '.join(CONGESTION_CONTROLS)})"
+        )
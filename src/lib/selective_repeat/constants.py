@@ -28,10 +28,21 @@ INITIAL_INFO_TIMEOUT = 5
 # antes de fallar
 CONNECT_RETRIES = 50
 
-# Cada cuandos segundos reenviar un paquete que para el cual
-# no se recibió el ACK
+# Segundos a esperar el ACK de un paquete antes de reenviarlo, mientras
+# no haya ninguna muestra de RTT (después se usa el RTO estimado)
 ACK_TIMEOUT = 1.5
 
+# Cotas del RTO estimado a partir del RTT (en segundos)
+MIN_RTO = 0.1
+MAX_RTO = 3
+# Tope del backoff exponencial de un paquete que se reenvía (RFC 6298 pide
+# al menos 60 segundos): puede pasar MAX_RTO para no seguir reenviando
+# seguido cuando el camino se cortó
+MAX_BACKOFF_RTO = 60
+
+# Granularidad del reloj usada en el cálculo del RTO (RFC 6298)
+CLOCK_GRANULARITY = 0.001
+
 # Cantidad de veces a reintentar enviar un paquete
 # antes de cerrar la conexion
 ACK_RETRIES = 50
@@ -39,8 +50,9 @@ ACK_RETRIES = 50
 # Primer numero de secuencia a enviar. Entre 0 y ACK_NUMBERS-1
 INITIAL_PACKET_NUMBER = 0
 
-# ~MTU. Maximum UDP payload is 65527, minus mux-demux header (6 bytes),
-# minus our header (7 bytes) so this can't be geater than 65514
+# ~MTU. Maximum UDP payload is 65527, minus mux-demux header (5 bytes, plus
+# the 8 byte cookie until the handshake ends), minus our header (7 bytes)
+# so this can't be geater than 65507
 MAX_SIZE = 62000
 
 # Cada cuando interrumpir el bloqueo para checkear si se esta
@@ -54,12 +66,57 @@ CLOSED_CHECK_INTERVAL = 1
 # Constantes del header de los paquetes
 PACKET_NUMBER_BYTES = 4
 PACKET_SIZE_BYTES = 2
+SACK_COUNT_BYTES = 1
+RECV_WINDOW_BYTES = 4
+
+# Cantidad máxima de rangos de paquetes recibidos fuera de orden que se
+# informan en cada SACK
+MAX_SACK_RANGES = 4
+
+# Política de ACK que se le pide al otro extremo en el CONNECT/CONNACK:
+# mandar un SACK cada ACK_EVERY INFO recibidos en orden o a los
+# ACK_DELAY segundos, lo que pase primero. Los INFO fuera de orden o
+# repetidos se reconocen inmediatamente
+# ACK_DELAY tiene que ser bastante menor a MIN_RTO
+ACK_EVERY = 2
+ACK_DELAY = 0.01
+ACK_EVERY_BYTES = 1
+ACK_DELAY_BYTES = 2
+
+# Memoria máxima (en bytes) que guarda el receptor entre lo que espera
+# ser leído por la aplicación y lo recibido fuera de orden. Lo que queda
+# libre se informa en cada SACK como ventana de recepción
+RECV_BUFFER_SIZE = 8 * 1024 * 1024
+
+# Si la ventana de recepción del otro extremo está cerrada, cada cuántos
+# segundos mandar un paquete igual (zero window probe) por si se perdió
+# la actualización de la ventana
+ZERO_WINDOW_PROBE_INTERVAL = 0.5
 
 # Siempre se debe cumplir WINDOW_SIZE < ACK_NUMBERS / 2
 WINDOW_SIZE = 500
 ACK_NUMBERS = 1 << 8 * PACKET_NUMBER_BYTES
 # 4294967296 si PACKET_NUMBER_BYTES = 4
 
+# Algoritmo de control de congestión por defecto (ver congestion.py)
+# y ventanas de congestión inicial y mínima, en paquetes
+CONGESTION_CONTROL = "reno"
+INITIAL_CWND = 10
+MIN_CWND = 1
+
+# Fast retransmit: un paquete se da por perdido sin esperar su timer
+# cuando ya se reconocieron DUPTHRESH paquetes posteriores, o cuando se
+# reconoció uno enviado después y pasó más de un RTT más la ventana de
+# reordenamiento (REORDERING_WINDOW, fracción del SRTT) desde su envío
+FAST_RETRANSMIT = True
+DUPTHRESH = 3
+REORDERING_WINDOW = 0.25
+
+# Máximo de INFO nuevos que send() manda juntos, en una sola llamada al
+# sistema (sendmmsg), cuando la ventana tiene lugar para varios. Con 1 se
+# envían de a uno
+SEND_BATCH = 32
+
 # --- CONSTANTES DE ESTADOS ---
 
 # No envie el CONNECT (si soy socket) ni lo recibi (si soy listener)
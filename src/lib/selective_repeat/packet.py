@@ -1,10 +1,20 @@
-import math
+import struct
 from loguru import logger
 
+from lib.utils import DatagramReader
+
 from lib.selective_repeat.constants import (
+    ACK_DELAY,
+    ACK_DELAY_BYTES,
+    ACK_EVERY,
+    ACK_EVERY_BYTES,
+    ACK_NUMBERS,
+    MAX_SACK_RANGES,
     MAX_SIZE,
     PACKET_NUMBER_BYTES,
     PACKET_SIZE_BYTES,
+    RECV_WINDOW_BYTES,
+    SACK_COUNT_BYTES,
 )
 
 CONNECT = b"0"
@@ -13,6 +23,7 @@ INFO = b"2"
 ACK = b"3"
 FIN = b"4"
 FINACK = b"5"
+SACK = b"6"
 
 NAMES = {
     b"0": "CONNECT",
@@ -21,8 +32,13 @@ NAMES = {
     b"3": "ACK",
     b"4": "FIN",
     b"5": "FINACK",
+    b"6": "SACK",
 }
 
+# Header de los INFO: tipo, tamaño del body y número de paquete. Tiene que
+# coincidir con PACKET_SIZE_BYTES y PACKET_NUMBER_BYTES
+INFO_HEADER = struct.Struct("!cHI")
+
 
 class Packet:
     def __init__(self, packet_type=None):
@@ -43,6 +59,8 @@ class Packet:
             return Info.decode_from_stream(stream)
         if packet_type == ACK:
             return Ack.decode_from_stream(stream)
+        if packet_type == SACK:
+            return Sack.decode_from_stream(stream)
         if packet_type == CONNECT:
             return Connect.decode_from_stream(stream)
         if packet_type == CONNACK:
@@ -54,6 +72,20 @@ class Packet:
 
         raise ValueError(f"Unknown packet type: {packet_type}")
 
+    # Decodifica un paquete que llegó entero en un datagrama. Los body de
+    # los INFO son memoryview sobre el datagrama
+    @staticmethod
+    def from_datagram(datagram):
+        view = memoryview(datagram)
+        packet_type = bytes(view[:1])
+        if packet_type == INFO:
+            return Info.decode_from_datagram(view)
+        if packet_type not in PACKET_CLASSES:
+            raise ValueError(f"Unknown packet type: {packet_type}")
+        return PACKET_CLASSES[packet_type].decode_from_stream(
+            DatagramReader(view[1:])
+        )
+
     @staticmethod
     def get_type_from_byte(byte):
         return NAMES.get(byte, None)
@@ -64,6 +96,11 @@ class Packet:
         )
         return self.type
 
+    # Partes del paquete codificado, para enviarlas con sendmsg() sin
+    # juntarlas en un solo bytes
+    def encode_parts(self):
+        return (self.encode(),)
+
     def __str__(self):
         return "PACKET"
 
@@ -71,37 +108,78 @@ class Packet:
         pass
 
 
-class Connect(Packet):
-    def __init__(self):
-        super().__init__(CONNECT)
+# Chequea que la política de ACK entre en los campos del CONNECT/CONNACK
+def check_ack_policy(ack_every, ack_delay):
+    max_every = 2 ** (8 * ACK_EVERY_BYTES) - 1
+    if not 1 <= ack_every <= max_every:
+        raise ValueError(
+            f"ack_every must be between 1 and {max_every}, got {ack_every}"
+        )
+    # Se manda en milisegundos
+    max_delay_ms = 2 ** (8 * ACK_DELAY_BYTES) - 1
+    if not 0 <= round(ack_delay * 1000) <= max_delay_ms:
+        raise ValueError(
+            f"ack_delay must be between 0 and {max_delay_ms / 1000} seconds,"
+            f" got {ack_delay}"
+        )
+
+
+# Clase base de CONNECT y CONNACK: llevan la política de ACK que quiere
+# quien envía el paquete para los INFO que manda (ver ACK_EVERY)
+class AckPolicyPacket(Packet):
+    def __init__(self, packet_type, ack_every=ACK_EVERY, ack_delay=ACK_DELAY):
+        super().__init__(packet_type)
+        self.__ack_every = ack_every
+        self.__ack_delay = ack_delay
 
     @classmethod
     def decode_from_stream(cls, stream):
-        return cls()
+        ack_every = int.from_bytes(
+            stream.recv_exact(ACK_EVERY_BYTES), byteorder="big"
+        )
+        ack_delay_ms = int.from_bytes(
+            stream.recv_exact(ACK_DELAY_BYTES), byteorder="big"
+        )
+        return cls(ack_every, ack_delay_ms / 1000)
+
+    def encode(self):
+        bytes = super().encode()
+        bytes += self.__ack_every.to_bytes(ACK_EVERY_BYTES, byteorder="big")
+        bytes += round(self.__ack_delay * 1000).to_bytes(
+            ACK_DELAY_BYTES, byteorder="big"
+        )
+        return bytes
+
+    def ack_every(self):
+        return self.__ack_every
+
+    def ack_delay(self):
+        return self.__ack_delay
+
+
+class Connect(AckPolicyPacket):
+    def __init__(self, ack_every=ACK_EVERY, ack_delay=ACK_DELAY):
+        super().__init__(CONNECT, ack_every, ack_delay)
 
     def __str__(self):
         return "CONNECT"
 
-    def ack(self):
-        return Connack()
+    def ack(self, ack_every=ACK_EVERY, ack_delay=ACK_DELAY):
+        return Connack(ack_every, ack_delay)
 
     def be_handled_by(self, handler):
-        handler.handle_connect(self)
+        return handler.handle_connect(self)
 
 
-class Connack(Packet):
-    def __init__(self):
-        super().__init__(CONNACK)
-
-    @classmethod
-    def decode_from_stream(cls, stream):
-        return cls()
+class Connack(AckPolicyPacket):
+    def __init__(self, ack_every=ACK_EVERY, ack_delay=ACK_DELAY):
+        super().__init__(CONNACK, ack_every, ack_delay)
 
     def __str__(self):
         return "CONNACK"
 
     def be_handled_by(self, handler):
-        handler.handle_connack(self)
+        return handler.handle_connack(self)
 
 
 class Ack(Packet):
@@ -128,7 +206,74 @@ class Ack(Packet):
         return f"ACK (number {self.number()})"
 
     def be_handled_by(self, handler):
-        handler.handle_ack(self)
+        return handler.handle_ack(self)
+
+
+# ACK acumulativo: confirma todos los paquetes hasta cumulative (inclusive)
+# y además los rangos [inicio, fin] (inclusive) recibidos fuera de orden
+# window es la cantidad de bytes que el receptor todavía puede guardar
+# (ventana de recepción), por defecto la máxima representable
+class Sack(Packet):
+    MAX_WINDOW = (1 << 8 * RECV_WINDOW_BYTES) - 1
+
+    def __init__(self, cumulative, ranges=(), window=MAX_WINDOW):
+        super().__init__(SACK)
+        self.__cumulative = cumulative % ACK_NUMBERS
+        self.__ranges = list(ranges)[:MAX_SACK_RANGES]
+        self.__window = min(max(int(window), 0), self.MAX_WINDOW)
+
+    @classmethod
+    def decode_from_stream(cls, stream):
+        cumulative = int.from_bytes(
+            stream.recv_exact(PACKET_NUMBER_BYTES), byteorder="big"
+        )
+        count = int.from_bytes(
+            stream.recv_exact(SACK_COUNT_BYTES), byteorder="big"
+        )
+        ranges = []
+        if count:
+            data = stream.recv_exact(count * 2 * PACKET_NUMBER_BYTES)
+            numbers = [
+                int.from_bytes(
+                    data[i : i + PACKET_NUMBER_BYTES], byteorder="big"
+                )
+                for i in range(0, len(data), PACKET_NUMBER_BYTES)
+            ]
+            ranges = list(zip(numbers[::2], numbers[1::2]))
+        window = int.from_bytes(
+            stream.recv_exact(RECV_WINDOW_BYTES), byteorder="big"
+        )
+        return cls(cumulative, ranges, window)
+
+    def encode(self):
+        bytes = super().encode()
+        bytes += self.__cumulative.to_bytes(
+            PACKET_NUMBER_BYTES, byteorder="big"
+        )
+        bytes += len(self.__ranges).to_bytes(SACK_COUNT_BYTES, byteorder="big")
+        for start, end in self.__ranges:
+            bytes += start.to_bytes(PACKET_NUMBER_BYTES, byteorder="big")
+            bytes += end.to_bytes(PACKET_NUMBER_BYTES, byteorder="big")
+        bytes += self.__window.to_bytes(RECV_WINDOW_BYTES, byteorder="big")
+        return bytes
+
+    def cumulative(self):
+        return self.__cumulative
+
+    def ranges(self):
+        return self.__ranges
+
+    def window(self):
+        return self.__window
+
+    def __str__(self):
+        return (
+            f"SACK (cumulative {self.cumulative()}, ranges {self.ranges()},"
+            f" window {self.window()})"
+        )
+
+    def be_handled_by(self, handler):
+        return handler.handle_sack(self)
 
 
 class Info(Packet):
@@ -149,24 +294,38 @@ class Info(Packet):
         return cls(number, body)
 
     @classmethod
-    def from_buffer(cls, buffer, mtu=MAX_SIZE, initial_number=0):
-        packets = []
-        amount = math.ceil(len(buffer) / mtu)
-        for i in range(initial_number, initial_number + amount):
-
-            packet = cls(i, buffer[i * mtu : (i + 1) * mtu])
-            packets.append(packet)
+    def decode_from_datagram(cls, view):
+        if len(view) < INFO_HEADER.size:
+            raise ValueError(
+                f"Truncated INFO header ({len(view)} of {INFO_HEADER.size}"
+                " bytes)"
+            )
+        _, length, number = INFO_HEADER.unpack_from(view)
+        body = view[INFO_HEADER.size :]
+        if len(body) != length:
+            raise ValueError(
+                f"INFO {number} body length mismatch (header says {length},"
+                f" got {len(body)})"
+            )
+        return cls(number, body)
 
-        return packets
+    # Genera los paquetes a medida que se piden. Los body son memoryview
+    # sobre buffer (no se copia), que no se tiene que modificar hasta que
+    # se reconozcan todos los paquetes
+    @classmethod
+    def from_buffer(cls, buffer, mtu=MAX_SIZE, initial_number=0):
+        view = memoryview(buffer).cast("B")
+        for i, offset in enumerate(range(0, len(view), mtu)):
+            yield cls(initial_number + i, view[offset : offset + mtu])
 
     def encode(self):
-        bytes = super().encode()
-        size = len(self.__body) if self.__body else 0
-        bytes += size.to_bytes(PACKET_SIZE_BYTES, byteorder="big")
-        bytes += self.__number.to_bytes(PACKET_NUMBER_BYTES, byteorder="big")
-        if self.__body:
-            bytes += self.__body
-        return bytes
+        return b"".join(self.encode_parts())
+
+    def encode_parts(self):
+        if not self.__body:
+            return (INFO_HEADER.pack(INFO, 0, self.__number),)
+        header = INFO_HEADER.pack(INFO, len(self.__body), self.__number)
+        return (header, self.__body)
 
     def body(self):
         return self.__body
@@ -184,7 +343,7 @@ class Info(Packet):
         return Ack(self.number())
 
     def be_handled_by(self, handler):
-        handler.handle_info(self)
+        return handler.handle_info(self)
 
 
 class Fin(Packet):
@@ -202,7 +361,7 @@ class Fin(Packet):
         return Finack()
 
     def be_handled_by(self, handler):
-        handler.handle_fin(self)
+        return handler.handle_fin(self)
 
 
 class Finack(Packet):
@@ -217,4 +376,15 @@ class Finack(Packet):
         return "FINACK"
 
     def be_handled_by(self, handler):
-        handler.handle_finack(self)
+        return handler.handle_finack(self)
+
+
+PACKET_CLASSES = {
+    CONNECT: Connect,
+    CONNACK: Connack,
+    INFO: Info,
+    ACK: Ack,
+    FIN: Fin,
+    FINACK: Finack,
+    SACK: Sack,
+}
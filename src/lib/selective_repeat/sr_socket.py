@@ -1,4 +1,3 @@
-from queue import Empty
 from lib.mux_demux.mux_demux_stream import MuxDemuxStream
 from lib.selective_repeat.packet import (
     Packet,
@@ -7,20 +6,25 @@ from lib.selective_repeat.packet import (
     Fin,
     Finack,
     ACK,
+    SACK,
     INFO,
     CONNECT,
     CONNACK,
     FIN,
     FINACK,
+    check_ack_policy,
 )
 import socket
-from lib.utils import MTByteStream
+from lib.utils import MTByteStream, stable_buffer
+from lib.scheduler import get_scheduler
 import threading
 from loguru import logger
 from .util import (
     AckNumberProvider,
     AckRegister,
     BlockAcker,
+    LossRecovery,
+    RTTEstimator,
     SafeSendSocket,
     SocketStatus,
 )
@@ -30,11 +34,13 @@ from .constants import (
     CONNECT_WAIT_TIMEOUT,
     CONNACK_WAIT_TIMEOUT,
     CONNECT_RETRIES,
-    ACK_TIMEOUT,
-    ACK_RETRIES,
+    CONGESTION_CONTROL,
+    ACK_DELAY,
+    ACK_EVERY,
     FIN_RETRIES,
     FIN_WAIT_TIMEOUT,
     FINACK_WAIT_TIMEOUT,
+    FAST_RETRANSMIT,
     MAX_SIZE,
     PEER_CLOSED,
     STOP_CHECK_INTERVAL,
@@ -42,13 +48,26 @@ from .constants import (
     CONNECTED,
     FORCED_CLOSING,
     INITIAL_PACKET_NUMBER,
+    RECV_BUFFER_SIZE,
+    SEND_BATCH,
     WINDOW_SIZE,
 )
+import math
 import time
 
 
 class SRSocket:
-    def __init__(self, window_size=WINDOW_SIZE, max_size=MAX_SIZE):
+    def __init__(
+        self,
+        window_size=WINDOW_SIZE,
+        max_size=MAX_SIZE,
+        congestion_control=CONGESTION_CONTROL,
+        ack_every=ACK_EVERY,
+        ack_delay=ACK_DELAY,
+        fast_retransmit=FAST_RETRANSMIT,
+        recv_buffer_size=RECV_BUFFER_SIZE,
+        send_batch=SEND_BATCH,
+    ):
         self.socket = None  # Solo usado para leer y cerrar el socket
         self.send_socket = SafeSendSocket()
         self.packet_thread_handler = threading.Thread(
@@ -56,17 +75,64 @@ class SRSocket:
         )
         self.status = SocketStatus()
 
-        self.number_provider = AckNumberProvider(window_size)
+        self.number_provider = AckNumberProvider(
+            window_size, congestion_control
+        )
         self.max_size = max_size
+        self.send_batch = send_batch
         self.upstream_channel = MTByteStream()
         self.ack_register = AckRegister()
+        self.rtt_estimator = RTTEstimator()
+        # Política de ACK que se le pide al otro extremo para nuestros
+        # INFO, la del propio acker se negocia al conectar
+        check_ack_policy(ack_every, ack_delay)
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
         self.acker = BlockAcker(
-            self.send_socket.send_all, self.upstream_channel
+            self.send_socket.send_all,
+            self.upstream_channel,
+            recv_buffer_size=recv_buffer_size,
+        )
+        # Avisar la ventana de recepción a medida que la aplicación lee
+        self.upstream_channel.on_read = self.acker.window_update
+        # Timers de retransmisión, compartidos con el resto de los sockets
+        self.scheduler = get_scheduler()
+        self.loss_recovery = LossRecovery(
+            self.ack_register,
+            self.number_provider,
+            self.rtt_estimator,
+            self.__send_info,
+            # No bloquear el thread del scheduler esperando al packet
+            # handler
+            lambda: threading.Thread(target=self.__force_close).start(),
+            lambda: self.status.get() == FORCED_CLOSING,
+            fast_retransmit,
         )
+        # Timeout de recv() y recv_exact() cuando no se les pasa uno
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
 
     def set_window_size(self, window_size):
         self.number_provider.set_window_size(window_size)
 
+    @property
+    def fast_retransmits(self):
+        return self.loss_recovery.fast_retransmits
+
+    @property
+    def timeout_retransmits(self):
+        return self.loss_recovery.timeout_retransmits
+
+    # RTT suavizado (None si todavía no hay muestras) y RTO actual,
+    # en segundos
+    def srtt(self):
+        return self.rtt_estimator.srtt()
+
+    def rto(self):
+        return self.rtt_estimator.rto()
+
     # Conectar tipo cliente
     def connect(self, addr, buggyness_factor=0):
         if self.status.get() != NOT_CONNECTED:
@@ -78,7 +144,8 @@ class SRSocket:
         self.send_socket.set_socket(self.socket)
         self.ack_register.enable_wait_first()
         # Esperar CONNACK
-        self.__wait_connack(Connect())
+        connack = self.__wait_connack(Connect(self.ack_every, self.ack_delay))
+        self.acker.set_policy(connack.ack_every(), connack.ack_delay())
         # Envío un INFO para confirmar recepción de CONNACK
         self.__send_info(Info(self.number_provider.get()))
         # Yo ya me puedo considerar conectado
@@ -97,15 +164,16 @@ class SRSocket:
         self.socket.settimeout(CONNECT_WAIT_TIMEOUT)
         # Espero un connect
         connect = self.__wait_connect()
+        self.acker.set_policy(connect.ack_every(), connect.ack_delay())
 
         # Mando connack y espero el primer info
-        self.__wait_initial_info(connect.ack())
+        self.__wait_initial_info(connect.ack(self.ack_every, self.ack_delay))
         self.status.set_status(CONNECTED)
         self.packet_thread_handler.start()
 
     def __wait_connect(self):
         self.socket.settimeout(CONNECT_WAIT_TIMEOUT)
-        packet = Packet.read_from_stream(self.socket)
+        packet = self.__recv_packet()
         if packet.type != CONNECT:
             logger.error(f"Received  {packet}, Expecting CONNECT")
             raise Exception(f"Received  {packet}, Expecting CONNECT")
@@ -116,9 +184,9 @@ class SRSocket:
         self.send_socket.send_all(connect.encode())
         for i in range(CONNECT_RETRIES):
             try:
-                packet = Packet.read_from_stream(self.socket)
+                packet = self.__recv_packet()
                 if packet.type == CONNACK:
-                    return
+                    return packet
                 logger.error(f"Received  {packet}, Expecting CONNACK")
                 raise Exception(f"Received  {packet}, Expecting CONNACK")
             except (TimeoutError, socket.timeout):
@@ -134,12 +202,13 @@ class SRSocket:
         self.send_socket.send_all(connack.encode())
         for i in range(CONNECT_RETRIES):
             try:
-                packet = Packet.read_from_stream(self.socket)
+                packet = self.__recv_packet()
                 if packet.type == CONNECT:
                     # Asumo que no le llego mi connack
                     continue
                 if packet.type == INFO:
-                    self.acker.received(packet)
+                    if self.acker.received(packet):
+                        self.socket.confirm_path()
                     if packet.number() != INITIAL_PACKET_NUMBER:
                         continue
                     return
@@ -156,6 +225,17 @@ class SRSocket:
                 continue
         raise TimeoutError("Could not confirm connection was established")
 
+    # Descarta los datagramas que no son un paquete válido (cortados o de
+    # tipo desconocido) y espera el siguiente, con el timeout del socket
+    # para cada uno
+    def __recv_packet(self):
+        while True:
+            datagram = self.socket.recv_datagram()
+            try:
+                return Packet.from_datagram(datagram)
+            except ValueError as e:
+                logger.warning(f"Dropping invalid packet: {e}")
+
     def packet_handler(self):
         logger.debug("Packet handler started")
         self.socket.settimeout(STOP_CHECK_INTERVAL)
@@ -165,9 +245,15 @@ class SRSocket:
             and self.status.get() != FORCED_CLOSING
         ):
             try:
-                packet = Packet.read_from_stream(self.socket)
+                packet = self.__recv_packet()
             except (TimeoutError, socket.timeout):
                 continue
+            except EOFError:
+                # El listener desalojó la conexión: no va a llegar nada más
+                logger.error("Connection was dropped, ending it abruptly")
+                self.status.set_status(FORCED_CLOSING)
+                self.upstream_channel.interrupt()
+                break
 
             logger.info(f"Received packet of type {packet}")
             packet.be_handled_by(self)
@@ -180,14 +266,28 @@ class SRSocket:
     def handle_connack(self, connack):
         logger.warning("Received CONNACK packet while already connected.")
 
+    # Solo un paquete que hace avanzar la conexión puede cambiar la
+    # dirección del otro extremo (ver MuxDemuxStream.confirm_path)
     def handle_info(self, info):
-        self.acker.received(info)
+        if self.acker.received(info):
+            self.socket.confirm_path()
 
     def handle_ack(self, ack):
-        self.number_provider.push(ack.number())
-        self.ack_register.acknowledge(ack)
+        if self.loss_recovery.acknowledge([ack.number()]):
+            self.socket.confirm_path()
+
+    def handle_sack(self, sack):
+        self.number_provider.set_peer_window(
+            sack.cumulative(), sack.window() // self.max_size
+        )
+        numbers = self.number_provider.unacked_covered_by(
+            sack.cumulative(), sack.ranges()
+        )
+        if numbers and self.loss_recovery.acknowledge(numbers):
+            self.socket.confirm_path()
 
     def handle_fin(self, fin):
+        self.acker.stop()
         self.status.set_status(PEER_CLOSED)
         self.__wait_finack_arrived(fin.ack())
         self.ack_register.stop()
@@ -200,7 +300,7 @@ class SRSocket:
         self.send_socket.send_all(finack.encode())
         for i in range(FIN_RETRIES):
             try:
-                packet = Packet.read_from_stream(self.socket)
+                packet = self.__recv_packet()
                 if packet.type == FIN:
                     logger.warning(
                         "Received FIN packet after sending FINACK, resending"
@@ -222,11 +322,10 @@ class SRSocket:
                     "Received unexpected packet type ({packet})"
                     f" while checking FINACK arrived, retrying (attempt {i})"
                 )
-                if packet.type == ACK:
+                if packet.type in (ACK, SACK):
                     # Un ack que quedó colgado
-                    self.number_provider.push(packet.number())
-                    self.ack_register.acknowledge(packet)
-            except (TimeoutError, socket.timeout):
+                    packet.be_handled_by(self)
+            except (TimeoutError, socket.timeout, EOFError):
                 logger.debug(
                     f"{FIN_WAIT_TIMEOUT} seconds passed since FINACK was"
                     " sent and didn't receive another FIN or FINACK, assuming"
@@ -249,14 +348,23 @@ class SRSocket:
         self.socket.close()
 
     def close(self):
+        if self.status.get() == FORCED_CLOSING:
+            # Ya no hay con quién cerrar (ver __force_close())
+            self.packet_thread_handler.join()
+            self.socket.close()
+            return
         self.ack_register.wait_first_acked()
         if self.status.get() == CLOSED:
             return
+        self.acker.stop()
 
         if self.status.get() == PEER_CLOSED:
             self.packet_thread_handler.join()
         else:
             self.status.set_status(CLOSED)
+            # Que el packet handler vea el cambio de estado sin esperar a
+            # que se cumpla el timeout de lectura
+            self.socket.interrupt()
             self.packet_thread_handler.join()
             # Peer may have closed before I could
             # join this thread
@@ -271,7 +379,7 @@ class SRSocket:
         self.send_socket.send_all(fin.encode())
         for i in range(FIN_RETRIES):
             try:
-                packet = Packet.read_from_stream(self.socket)
+                packet = self.__recv_packet()
                 if packet.type == FINACK:
                     logger.info("Received FINACK")
                     # Sending finack to hopefully stop the receiver's
@@ -288,6 +396,8 @@ class SRSocket:
                     # Algun info que no le llegó mi ack o le quedó colgado
                     self.acker.received(packet)
                     continue
+            except EOFError:
+                break
             except (TimeoutError, socket.timeout):
                 self.send_socket.send_all(fin.encode())
                 logger.warning(
@@ -299,71 +409,89 @@ class SRSocket:
             "Could not confirm connection was closed for the other end"
         )
 
-    def __check_ack(self, packet, send_attempt):
-        if self.ack_register.check_acknowledged(packet):
-            return
+    def __send_info(self, packet, attempts=0):
 
         if self.status.get() == FORCED_CLOSING:
+            logger.trace("FORCED_CLOSING in progress")
             return
 
-        if send_attempt > ACK_RETRIES:
-            return self.__force_close()
+        self.__add_pending(packet, attempts)
+        self.send_socket.send_parts(packet.encode_parts())
 
-        logger.warning(
-            f"Packet with number {packet.number()} not acknowledged on time,"
-            f" resending it (attempt {send_attempt})"
-        )
-        logger.debug(f"Resend Attemp {send_attempt}")
-        self.__send_info(packet, send_attempt + 1)
-
-    def __send_info(self, packet, attempts=0):
+    # Como __send_info() para varios INFO nuevos, que salen juntos
+    def __send_infos(self, packets):
 
         if self.status.get() == FORCED_CLOSING:
             logger.trace("FORCED_CLOSING in progress")
             return
 
-        self.send_socket.send_all(packet.encode())
-        self.ack_register.add_pending(packet)
-        timer = threading.Timer(
-            ACK_TIMEOUT,
-            self.__check_ack,
-            [packet, attempts],
+        for packet in packets:
+            self.__add_pending(packet, 0)
+        self.send_socket.send_batch(
+            [packet.encode_parts() for packet in packets]
+        )
+
+    def __add_pending(self, packet, attempts):
+        timer = self.scheduler.call_later(
+            self.rtt_estimator.timeout(attempts),
+            self.loss_recovery.check_ack,
+            packet,
+            attempts,
         )
-        timer.name = f"Timer-{packet.number()}-{attempts}"
+        self.ack_register.add_pending(packet, timer, attempts)
         logger.info(f"Sending packet of type {packet}")
-        timer.start()
 
     def send(self, buffer):
         if self.status.get() != CONNECTED:
             raise Exception("Socket is not connected or connection was closed")
 
         logger.debug(f"Sending buffer of length {len(buffer)}")
+        # Los paquetes apuntan al buffer hasta que se reconocen, así que
+        # uno mutable se copia una vez para que no cambie mientras tanto
+        buffer = stable_buffer(buffer)
         packets = Info.from_buffer(buffer, self.max_size)
-        logger.debug("Fragmented buffer into %d packets" % len(packets))
+        logger.debug(
+            "Fragmenting buffer into %d packets"
+            % math.ceil(len(buffer) / self.max_size)
+        )
 
         self.ack_register.wait_first_acked()
 
         packets = iter(packets)
         packet = next(packets)
-        while True:
+        while packet is not None:
             try:
                 packet.set_number(
                     self.number_provider.get(timeout=CLOSED_CHECK_INTERVAL)
                 )
-                self.__send_info(packet)
-                packet = next(packets)
-            except (TimeoutError, socket.timeout, Empty) as e:
+            except (TimeoutError, socket.timeout) as e:
                 # Connection may have been closed when we were waiting
                 # for a packet number
                 if self.status.is_closed():
                     raise Exception("Connection was closed during send") from e
-            except StopIteration:
-                break
+                continue
+            batch = [packet]
+            packet = next(packets, None)
+            # Si la ventana tiene lugar para más, se numeran sin esperar
+            # y se envían todos con una sola llamada al sistema
+            while packet is not None and len(batch) < self.send_batch:
+                number = self.number_provider.try_get()
+                if number is None:
+                    break
+                packet.set_number(number)
+                batch.append(packet)
+                packet = next(packets, None)
+            if len(batch) == 1:
+                self.__send_info(batch[0])
+            else:
+                self.__send_infos(batch)
 
     def recv(self, buff_size, timeout=None):
         if self.status.get() == NOT_CONNECTED:
             raise Exception("Socket is not connected")
         logger.trace("Trying to receive data (buff_size %d)" % buff_size)
+        if timeout is None:
+            timeout = self.timeout
         start = time.time()
 
         while True:
@@ -382,16 +510,20 @@ class SRSocket:
     # If it times out or there is an end of stream, it returns
     # the data read so far
     def recv_exact(self, size, timeout=None):
-        buffer = b""
+        if timeout is None:
+            timeout = self.timeout
+        pieces = []
+        received = 0
         start = time.time()
-        while len(buffer) < size and (
+        while received < size and (
             not timeout or time.time() - start < timeout
         ):
-            buffer += self.recv(size - len(buffer), timeout)
+            pieces.append(self.recv(size - received, timeout))
+            received += len(pieces[-1])
 
-        if len(buffer) == 0:
+        if received == 0:
             raise TimeoutError("No data received")
-        return buffer
+        return b"".join(pieces)
 
 
 class EndOfStream(Exception):
@@ -1,48 +1,207 @@
+from .packet import Sack
 from .constants import (
+    ACK_DELAY,
+    ACK_EVERY,
+    ACK_RETRIES,
+    ACK_TIMEOUT,
+    DUPTHRESH,
+    MAX_SACK_RANGES,
+    CLOCK_GRANULARITY,
+    MAX_BACKOFF_RTO,
+    MAX_RTO,
+    MIN_RTO,
     CLOSED,
+    FAST_RETRANSMIT,
     FORCED_CLOSING,
     INITIAL_PACKET_NUMBER,
     NOT_CONNECTED,
     PEER_CLOSED,
+    RECV_BUFFER_SIZE,
+    REORDERING_WINDOW,
     WINDOW_SIZE,
+    ZERO_WINDOW_PROBE_INTERVAL,
     ACK_NUMBERS,
 )
+from .congestion import NoCongestionControl, new_congestion_control
+from lib.scheduler import get_scheduler
 from loguru import logger
 import threading
-import queue
+import time
 
 
 # Maneja la window actual y bloquea el get() hasta que haya
-# espacio en la window
+# espacio en la window. La window usable es la menor entre la del
+# selective repeat, la de congestión y la de recepción del otro extremo
 class AckNumberProvider:
-    def __init__(self, window_size=WINDOW_SIZE):
+    def __init__(self, window_size=WINDOW_SIZE, congestion_control=None):
         self.oldest_not_acked = INITIAL_PACKET_NUMBER
+        self.next_number = INITIAL_PACKET_NUMBER
         self.acked = set()
-        self.lock = threading.Lock()
-        self.available = queue.SimpleQueue()
+        self.in_flight = 0
+        self.condition = threading.Condition()
         self.window_size = window_size
-        for i in range(
-            INITIAL_PACKET_NUMBER, INITIAL_PACKET_NUMBER + window_size
-        ):
-            self.available.put(i % ACK_NUMBERS)
+        self.congestion_control = new_congestion_control(
+            congestion_control or NoCongestionControl()
+        )
+        # Último número enviado cuando se redujo la ventana de congestión:
+        # las pérdidas de paquetes anteriores son del mismo evento
+        self.recovery_point = None
+        # Primer número que no entra en la ventana de recepción del otro
+        # extremo (None hasta recibir el primer SACK) y desde cuándo está
+        # cerrada
+        self.peer_window_end = None
+        self.peer_window_closed_at = None
+
+    def set_window_size(self, window_size):
+        with self.condition:
+            self.window_size = window_size
+            self.condition.notify_all()
+
+    # El otro extremo puede recibir packets paquetes después de cumulative
+    # La ventana nunca se achica (un SACK viejo no la puede cerrar)
+    def set_peer_window(self, cumulative, packets):
+        end = (cumulative + 1 + packets) % ACK_NUMBERS
+        with self.condition:
+            if self.peer_window_end is None or gt_packets(
+                end, self.peer_window_end
+            ):
+                self.peer_window_end = end
+                self.condition.notify_all()
+
+    def __peer_window_open(self):
+        return self.peer_window_end is None or gt_packets(
+            self.peer_window_end, self.next_number
+        )
+
+    def __can_send(self):
+        span = (self.next_number - self.oldest_not_acked) % ACK_NUMBERS
+        return (
+            span < self.window_size
+            and self.in_flight < self.congestion_control.window()
+            and (self.__peer_window_open() or self.__probe_due())
+        )
+
+    # Con la ventana de recepción cerrada se deja pasar un paquete cada
+    # ZERO_WINDOW_PROBE_INTERVAL, para que el SACK que lo reconozca
+    # traiga la ventana actualizada
+    def __probe_due(self):
+        now = time.monotonic()
+        if self.peer_window_closed_at is None:
+            self.peer_window_closed_at = now
+        return now - self.peer_window_closed_at >= ZERO_WINDOW_PROBE_INTERVAL
 
     def get(self, timeout=None):
-        n = self.available.get(timeout=timeout)
+        with self.condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self.__can_send():
+                wait = (
+                    None if deadline is None else deadline - time.monotonic()
+                )
+                if wait is not None and wait <= 0:
+                    raise TimeoutError("No packet number available")
+                if self.peer_window_closed_at is not None:
+                    # Despertarse a tiempo para mandar el probe
+                    probe = ZERO_WINDOW_PROBE_INTERVAL
+                    wait = probe if wait is None else min(wait, probe)
+                self.condition.wait(wait)
+            return self.__take_number()
+
+    # Como get(), pero sin esperar: devuelve None si no hay lugar en la
+    # ventana (para quien no se puede bloquear, como el event loop)
+    def try_get(self):
+        with self.condition:
+            if not self.__can_send():
+                return None
+            return self.__take_number()
+
+    # Segundos hasta poder mandar un zero window probe, o None si la
+    # ventana de recepción del otro extremo no está cerrada
+    def probe_delay(self):
+        with self.condition:
+            if self.peer_window_closed_at is None:
+                return None
+            elapsed = time.monotonic() - self.peer_window_closed_at
+            return max(ZERO_WINDOW_PROBE_INTERVAL - elapsed, 0)
+
+    def __take_number(self):
+        if self.__peer_window_open():
+            self.peer_window_closed_at = None
+        else:
+            logger.debug("Peer receive window closed, sending probe")
+            self.peer_window_closed_at = time.monotonic()
+        n = self.next_number
+        self.next_number = (self.next_number + 1) % ACK_NUMBERS
+        self.in_flight += 1
         return n
 
-    def push(self, number):
-        with self.lock:
-            if self.oldest_not_acked == number:
-                self.acked.add(number)
-                self.__update_oldest()
-            elif gt_packets(number, self.oldest_not_acked):
-                self.acked.add(number)
+    def __in_window(self, number):
+        return number == self.oldest_not_acked or (
+            gt_packets(number, self.oldest_not_acked)
+            and gt_packets(self.next_number, number)
+        )
+
+    # Devuelve True si number no había sido reconocido
+    def push(self, number, rtt=None):
+        return len(self.push_many([number], rtt)) > 0
+
+    # Reconoce varios números tomando el lock una sola vez. Devuelve los
+    # que no habían sido reconocidos
+    def push_many(self, numbers, rtt=None):
+        with self.condition:
+            new = list(
+                dict.fromkeys(
+                    n
+                    for n in numbers
+                    if self.__in_window(n) and n not in self.acked
+                )
+            )
+            if not new:
+                return new
+            self.acked.update(new)
+            self.in_flight -= len(new)
+            self.congestion_control.on_ack(len(new), rtt)
+            self.__update_oldest()
+            self.condition.notify_all()
+            return new
+
+    # Números enviados y sin reconocer que cubre un SACK
+    def unacked_covered_by(self, cumulative, ranges):
+        with self.condition:
+            span = (self.next_number - self.oldest_not_acked) % ACK_NUMBERS
+            covered = {}
+            for start, end in [(self.oldest_not_acked, cumulative), *ranges]:
+                if gt_packets(self.oldest_not_acked, start):
+                    start = self.oldest_not_acked
+                first = (start - self.oldest_not_acked) % ACK_NUMBERS
+                last = (end - self.oldest_not_acked) % ACK_NUMBERS
+                if gt_packets(self.oldest_not_acked, end) or first > last:
+                    continue
+                for offset in range(first, min(last + 1, span)):
+                    n = (self.oldest_not_acked + offset) % ACK_NUMBERS
+                    if n not in self.acked:
+                        covered[n] = None
+            return list(covered)
+
+    # Avisa al control de congestión de la pérdida del paquete number,
+    # una sola vez por ventana enviada
+    def lost(self, number, timeout=True):
+        with self.condition:
+            if self.recovery_point is not None and not gt_packets(
+                number, self.recovery_point
+            ):
+                return
+            self.recovery_point = (self.next_number - 1) % ACK_NUMBERS
+            if timeout:
+                self.congestion_control.on_timeout()
+            else:
+                self.congestion_control.on_loss()
+            logger.debug(
+                f"Packet {number} lost, congestion window is now"
+                f" {self.congestion_control.window()}"
+            )
 
     def __update_oldest(self):
         while self.oldest_not_acked in self.acked:
-            self.available.put(
-                (self.oldest_not_acked + self.window_size) % ACK_NUMBERS
-            )
             self.acked.remove(self.oldest_not_acked)
             self.oldest_not_acked = (self.oldest_not_acked + 1) % ACK_NUMBERS
 
@@ -58,61 +217,328 @@ def gt_packets(packet_number, other_packet_number):
 
 
 # Hace ACK a los INFO recibidos y los envia al upstream en orden
+# Cada ACK es un SACK con el último número recibido en orden y los
+# rangos recibidos fuera de orden. Los INFO en orden se reconocen de a
+# ack_every o a los ack_delay segundos (ACK demorado)
+# Entre el upstream y los bloques fuera de orden se guardan como mucho
+# recv_buffer_size bytes, lo que queda libre se anuncia como ventana
 class BlockAcker:
-    def __init__(self, sender, upstream_channel):
+    def __init__(
+        self,
+        sender,
+        upstream_channel,
+        ack_every=ACK_EVERY,
+        ack_delay=ACK_DELAY,
+        scheduler=None,
+        recv_buffer_size=RECV_BUFFER_SIZE,
+    ):
         self.last_received = INITIAL_PACKET_NUMBER - 1
         self.blocks = {}
+        self.blocks_size = 0
+        self.recv_buffer_size = recv_buffer_size
+        self.advertised_window = recv_buffer_size
+        self.max_body = 0
         self.sender = sender
         self.upstream_channel = upstream_channel
+        self.lock = threading.RLock()
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.scheduler = scheduler or get_scheduler()
+        self.unacked = 0
+        self.timer = None
+        # Estadísticas
+        self.infos_received = 0
+        self.acks_sent = 0
+        self.infos_dropped = 0
+
+    def set_policy(self, ack_every, ack_delay):
+        logger.debug(
+            f"Acking every {ack_every} INFO packets or {ack_delay} seconds"
+        )
+        with self.lock:
+            self.ack_every = max(ack_every, 1)
+            self.ack_delay = ack_delay
+
+    # Rangos de paquetes guardados fuera de orden. El primero es el que
+    # contiene al último paquete recibido (RFC 2018)
+    def sack_ranges(self, last_number=None):
+        ranges = []
+        for n in sorted(
+            self.blocks,
+            key=lambda n: (n - self.last_received) % ACK_NUMBERS,
+        ):
+            if ranges and ranges[-1][1] == (n - 1) % ACK_NUMBERS:
+                ranges[-1][1] = n
+            else:
+                ranges.append([n, n])
+
+        for i, (start, end) in enumerate(ranges):
+            if last_number is None:
+                break
+            if last_number in (start, end) or (
+                gt_packets(last_number, start) and gt_packets(end, last_number)
+            ):
+                ranges.insert(0, ranges.pop(i))
+                break
+        return [(start, end) for start, end in ranges[:MAX_SACK_RANGES]]
+
+    # Bytes guardados entre el upstream y los bloques fuera de orden
+    def buffered(self):
+        with self.lock:
+            return self.upstream_channel.buffered() + self.blocks_size
+
+    # Ventana de recepción, contada desde el último paquete recibido en
+    # orden. Los bloques fuera de orden caen dentro de ella, así que no
+    # se descuentan (si el otro extremo la respeta, buffered() nunca
+    # supera recv_buffer_size)
+    def window(self):
+        buffered = self.upstream_channel.buffered()
+        return max(self.recv_buffer_size - buffered, 0)
+
+    # Avisa la nueva ventana si la aplicación leyó lo suficiente desde
+    # el último SACK (evitando mandar ventanas chicas, RFC 1122)
+    def window_update(self):
+        with self.lock:
+            window = self.window()
+            if (
+                window - self.advertised_window >= self.recv_buffer_size // 4
+                or (self.advertised_window < self.max_body <= window)
+            ):
+                logger.debug(f"Receive window opened to {window} bytes")
+                self.__send_ack()
 
     def __send_stored(self):
-        i = self.last_received
+        i = (self.last_received + 1) % ACK_NUMBERS
         while i in self.blocks:
-            self.upstream_channel.put_bytes(self.blocks[i].body())
-            self.blocks.pop(i)
+            body = self.blocks.pop(i)
+            self.blocks_size -= len(body)
+            self.upstream_channel.put_bytes(body)
             self.last_received = i
-            i += 1
+            i = (i + 1) % ACK_NUMBERS
 
+    # Devuelve True si el paquete era nuevo y se guardó
     def received(self, packet):
+        with self.lock:
+            self.infos_received += 1
+            in_order = (
+                self.last_received + 1
+            ) % ACK_NUMBERS == packet.number()
+            had_gap = len(self.blocks) > 0
+            new = in_order or (
+                gt_packets(packet.number(), self.last_received)
+                and packet.number() not in self.blocks
+            )
+            size = len(packet.body())
+            self.max_body = max(self.max_body, size)
+
+            if new and self.buffered() + size > self.recv_buffer_size:
+                # No hay lugar, el otro extremo lo va a reenviar
+                logger.warning(
+                    f"Receive buffer full, dropping packet {packet.number()}"
+                )
+                self.infos_dropped += 1
+                self.__send_ack(packet.number())
+                return False
+
+            # El body puede ser una vista del slab donde se recibió el
+            # datagrama (ver BufferPool). Se copia para no retener el slab
+            # entero, con datagramas de otras conexiones, mientras la
+            # aplicación no lo lee: así la ventana cuenta la memoria que de
+            # verdad se guarda
+            if in_order:
+                self.last_received = packet.number()
+                self.upstream_channel.put_bytes(bytes(packet.body()))
+                self.__send_stored()
+            elif new:
+                self.blocks[packet.number()] = bytes(packet.body())
+                self.blocks_size += size
+
+            self.unacked += 1
+            # Se reconocen en el momento los paquetes fuera de orden,
+            # repetidos o que llenan un hueco, y el primero de la conexión
+            if (
+                not in_order
+                or had_gap
+                or packet.number() == INITIAL_PACKET_NUMBER
+                or self.unacked >= self.ack_every
+            ):
+                self.__send_ack(packet.number())
+            elif self.timer is None:
+                self.timer = self.scheduler.call_later(
+                    self.ack_delay, self.flush
+                )
+            return new
 
-        if (self.last_received + 1) % ACK_NUMBERS == packet.number():
-            self.last_received = packet.number()
-            self.blocks[packet.number()] = packet
-            self.__send_stored()
-        elif gt_packets(packet.number(), self.last_received):
-            self.blocks[packet.number()] = packet
+    # Envía el ACK de los paquetes pendientes de reconocer
+    def flush(self):
+        with self.lock:
+            if self.unacked > 0:
+                self.__send_ack()
 
-        ack = packet.ack()
+    # Envía los ACK pendientes y deja de demorar los siguientes (para
+    # cuando se está cerrando la conexión)
+    def stop(self):
+        with self.lock:
+            self.ack_every = 1
+            self.flush()
+
+    def __send_ack(self, last_number=None):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.unacked = 0
+        self.advertised_window = self.window()
+        ack = Sack(
+            self.last_received,
+            self.sack_ranges(last_number),
+            self.advertised_window,
+        )
         logger.info(f"Sending {ack}")
+        self.acks_sent += 1
         self.sender(ack.encode())
 
 
-# Registra que paquetes tienen ack pendiente
+# Estimador del RTT y del timeout de retransmisión (Jacobson/Karels,
+# RFC 6298). Las muestras de paquetes retransmitidos no se deben pasar
+# a sample() (algoritmo de Karn)
+class RTTEstimator:
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(
+        self,
+        initial_rto=ACK_TIMEOUT,
+        min_rto=MIN_RTO,
+        max_rto=MAX_RTO,
+        max_backoff=MAX_BACKOFF_RTO,
+    ):
+        self.lock = threading.Lock()
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.max_backoff = max_backoff
+        self.__srtt = None
+        self.__rttvar = None
+        self.__rto = initial_rto
+
+    def sample(self, rtt):
+        with self.lock:
+            if self.__srtt is None:
+                self.__srtt = rtt
+                self.__rttvar = rtt / 2
+            else:
+                self.__rttvar = (1 - self.BETA) * self.__rttvar + (
+                    self.BETA * abs(self.__srtt - rtt)
+                )
+                self.__srtt = (1 - self.ALPHA) * self.__srtt + (
+                    self.ALPHA * rtt
+                )
+            rto = self.__srtt + max(CLOCK_GRANULARITY, self.K * self.__rttvar)
+            self.__rto = min(max(rto, self.min_rto), self.max_rto)
+
+    def srtt(self):
+        with self.lock:
+            return self.__srtt
+
+    def rto(self):
+        with self.lock:
+            return self.__rto
+
+    # Timeout para el intento número attempt de un paquete (backoff
+    # exponencial). max_rto solo acota el RTO estimado, el backoff sigue
+    # hasta max_backoff
+    def timeout(self, attempt=0):
+        return min(self.rto() * (2**attempt), self.max_backoff)
+
+
+# Paquete enviado que espera su ACK
+class PendingPacket:
+    __slots__ = ("packet", "timer", "sent_at", "attempt")
+
+    def __init__(self, packet, timer, attempt):
+        self.packet = packet
+        self.timer = timer
+        self.sent_at = time.monotonic()
+        self.attempt = attempt
+
+    def cancel(self):
+        if self.timer:
+            self.timer.cancel()
+
+
+# Registra que paquetes tienen ack pendiente, junto con el timer de
+# retransmisión de cada uno (que se cancela al recibir el ACK)
 class AckRegister:
     def __init__(self):
         self.lock = threading.Lock()
-        self.unacknowledged = set()
+        self.unacknowledged = {}
         self.first_acked = None
         self.stopped = threading.Event()
 
-    def add_pending(self, packet):
+    def add_pending(self, packet, timer=None, attempt=0):
+        pending = PendingPacket(packet, timer, attempt)
         if self.stopped.is_set():
             logger.warning(
                 f"Tried to set packet {packet.number()} as pending, but"
                 " the AckRegister is stopped"
             )
+            pending.cancel()
             return
         with self.lock:
-            self.unacknowledged.add(packet.number())
+            old = self.unacknowledged.get(packet.number())
+            self.unacknowledged[packet.number()] = pending
+        if old:
+            old.cancel()
 
         logger.debug(
             f"Added pending acknowledgement for packet {packet.number()}"
         )
 
+    # Devuelve el PendingPacket que estaba esperando el ACK (o None si ya
+    # había sido reconocido)
     def acknowledge(self, packet):
         self.__set_first(packet.number())
         with self.lock:
-            self.unacknowledged.discard(packet.number())
+            pending = self.unacknowledged.pop(packet.number(), None)
+        if pending:
+            pending.cancel()
+        return pending
+
+    # Como acknowledge() pero para varios números, tomando el lock una
+    # sola vez
+    def acknowledge_many(self, numbers):
+        for number in numbers:
+            self.__set_first(number)
+        with self.lock:
+            pendings = [self.unacknowledged.pop(n, None) for n in numbers]
+        pendings = [pending for pending in pendings if pending]
+        for pending in pendings:
+            pending.cancel()
+        return pendings
+
+    # Devuelve los PendingPacket que se consideran perdidos (RACK/FACK):
+    # los enviados antes que el último paquete reconocido (que se envió
+    # en delivered_sent_at) que se enviaron hace más de max_age segundos
+    # o para los que ya se reconocieron DUPTHRESH paquetes posteriores
+    # (highest_acked es el mayor número reconocido). Esto último solo
+    # vale para la primera transmisión: un reenvío tiene un número menor
+    # que los que se enviaron antes que él
+    def detect_lost(self, delivered_sent_at, highest_acked, max_age):
+        now = time.monotonic()
+        with self.lock:
+            return [
+                pending
+                for number, pending in self.unacknowledged.items()
+                if pending.sent_at < delivered_sent_at
+                and (
+                    now - pending.sent_at > max_age
+                    or (
+                        pending.attempt == 0
+                        and gt_packets(highest_acked, number)
+                        and (highest_acked - number) % ACK_NUMBERS >= DUPTHRESH
+                    )
+                )
+            ]
 
     # Devuelve true si fue recibió Ack, false sino
     def check_acknowledged(self, packet):
@@ -131,9 +557,12 @@ class AckRegister:
                 logger.warning(
                     "Clearing unacknowledged packets on AckRegister, but ACKs"
                     " not received for numbers "
-                    + str(self.unacknowledged)
+                    + str(list(self.unacknowledged))
                 )
+            pendings = list(self.unacknowledged.values())
             self.unacknowledged.clear()
+        for pending in pendings:
+            pending.cancel()
 
     def __set_first(self, number):
         if self.first_acked and number == INITIAL_PACKET_NUMBER:
@@ -148,6 +577,96 @@ class AckRegister:
             self.first_acked.wait(timeout=timeout)
 
 
+# Lo que hacen SRSocket y SRConnection al recibir ACKs y al vencerse el
+# timer de un INFO: muestras de RTT, ventana de congestión y detección de
+# pérdidas. Los reenvíos los hace cada uno con resend(packet, attempt),
+# give_up() se llama cuando un paquete agotó los reintentos y closing()
+# indica si la conexión se está cerrando de golpe
+class LossRecovery:
+    def __init__(
+        self,
+        ack_register,
+        number_provider,
+        rtt_estimator,
+        resend,
+        give_up,
+        closing,
+        fast_retransmit=FAST_RETRANSMIT,
+    ):
+        self.ack_register = ack_register
+        self.number_provider = number_provider
+        self.rtt_estimator = rtt_estimator
+        self.resend = resend
+        self.give_up = give_up
+        self.closing = closing
+        # Detección de pérdidas por SACK: momento de envío del último
+        # paquete reconocido y mayor número reconocido hasta ahora
+        self.fast_retransmit = fast_retransmit
+        self.delivered_sent_at = 0
+        self.highest_acked = None
+        self.fast_retransmits = 0
+        self.timeout_retransmits = 0
+
+    # Devuelve True si se reconoció algún paquete que estaba pendiente
+    def acknowledge(self, numbers):
+        pendings = self.ack_register.acknowledge_many(numbers)
+        # Karn: solo se mide el RTT de paquetes que no fueron reenviados,
+        # usando el enviado más recientemente
+        samples = [p.sent_at for p in pendings if p.attempt == 0]
+        rtt = None
+        if samples:
+            rtt = time.monotonic() - max(samples)
+            self.rtt_estimator.sample(rtt)
+        self.number_provider.push_many(numbers, rtt)
+        if self.fast_retransmit and pendings:
+            self.__detect_losses(numbers, pendings, rtt)
+        return bool(pendings)
+
+    # Timer de retransmisión del intento send_attempt de packet
+    def check_ack(self, packet, send_attempt):
+        if self.ack_register.check_acknowledged(packet):
+            return
+        if self.closing():
+            return
+        if send_attempt > ACK_RETRIES:
+            self.give_up()
+            return
+
+        logger.warning(
+            f"Packet with number {packet.number()} not acknowledged on time,"
+            f" resending it (attempt {send_attempt})"
+        )
+        self.timeout_retransmits += 1
+        self.number_provider.lost(packet.number())
+        self.resend(packet, send_attempt + 1)
+
+    # Reenvía sin esperar al timer los paquetes que quedaron atrás de los
+    # recién reconocidos (ver AckRegister.detect_lost)
+    def __detect_losses(self, numbers, pendings, rtt):
+        self.delivered_sent_at = max(
+            self.delivered_sent_at, max(p.sent_at for p in pendings)
+        )
+        for number in numbers:
+            if self.highest_acked is None or gt_packets(
+                number, self.highest_acked
+            ):
+                self.highest_acked = number
+
+        srtt = self.rtt_estimator.srtt() or self.rtt_estimator.rto()
+        max_age = (rtt or srtt) + srtt * REORDERING_WINDOW
+        lost = self.ack_register.detect_lost(
+            self.delivered_sent_at, self.highest_acked, max_age
+        )
+        for pending in lost:
+            if pending.attempt > ACK_RETRIES:
+                continue
+            number = pending.packet.number()
+            logger.info(f"Packet {number} detected as lost, fast retransmit")
+            self.fast_retransmits += 1
+            self.number_provider.lost(number, timeout=False)
+            self.resend(pending.packet, pending.attempt + 1)
+
+
 class SafeSendSocket:
     def __init__(self, socket=None):
         self.socket = socket
@@ -162,6 +681,20 @@ class SafeSendSocket:
         with self.send_lock:
             self.socket.send_all(data)
 
+    # Envía un paquete ya dividido en partes (ver Packet.encode_parts)
+    def send_parts(self, parts):
+        if self.socket is None:
+            raise Exception("No socket has been set")
+        with self.send_lock:
+            self.socket.send_buffers(parts)
+
+    # Envía varios paquetes juntos (ver MuxDemuxStream.send_batch)
+    def send_batch(self, parts_list):
+        if self.socket is None:
+            raise Exception("No socket has been set")
+        with self.send_lock:
+            self.socket.send_batch(parts_list)
+
 
 class SocketStatus:
     def __init__(self, status=NOT_CONNECTED):
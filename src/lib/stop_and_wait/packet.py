@@ -1,7 +1,8 @@
-from math import ceil
 import socket
+import struct
 from abc import ABC, abstractmethod
 from .exceptions import ProtocolError
+from ..utils import DatagramReader
 
 CONNECT = b"0"
 CONNACK = b"1"
@@ -15,6 +16,10 @@ class Packet(ABC):
     def __repr__(self):
         return self.__class__.__name__
 
+    # Partes de bytes(self), para enviarlas con sendmsg() sin juntarlas
+    def parts(self):
+        return (bytes(self),)
+
     @staticmethod
     @abstractmethod
     def read_from_stream(stream):
@@ -61,6 +66,8 @@ class ConnackPacket(Packet):
 
 class InfoPacket(Packet):
     MAX_SPLIT_NUMBER = 2**16
+    # Tipo, largo del body y número
+    HEADER = struct.Struct("!cHI")
     type = INFO
 
     def __init__(self, number=0, body=b""):
@@ -83,27 +90,41 @@ class InfoPacket(Packet):
             raise ProtocolError("Timeout while reading INFO packet")
         return packet
 
+    # Decodifica un INFO que llegó entero en un datagrama (desde el tipo),
+    # con el body como memoryview sobre el datagrama
+    @classmethod
+    def from_datagram(cls, view):
+        if len(view) < cls.HEADER.size:
+            raise ValueError(
+                f"Truncated INFO header ({len(view)} of {cls.HEADER.size}"
+                " bytes)"
+            )
+        _, length, number = cls.HEADER.unpack_from(view)
+        body = view[cls.HEADER.size :]
+        if len(body) != length:
+            raise ValueError(
+                f"INFO {number} body length mismatch (header says {length},"
+                f" got {len(body)})"
+            )
+        return cls(number, body)
+
     def __bytes__(self):
-        packet_bytes = self.type
-        packet_bytes += self.length.to_bytes(2, byteorder="big")
-        packet_bytes += self.number.to_bytes(4, byteorder="big")
-        packet_bytes += self.body
-        return packet_bytes
+        return b"".join(self.parts())
+
+    def parts(self):
+        header = self.HEADER.pack(self.type, self.length, self.number)
+        return (header, self.body)
 
+    # Genera los paquetes a medida que se piden, con body memoryview
+    # sobre buffer (sin copiarlo). Un buffer vacío genera un paquete vacío
     @classmethod
     def split(cls, mtu, buffer, initial_number=0):
-        if len(buffer) <= mtu:
-            return [InfoPacket(initial_number, buffer)]
-
-        number_of_packets = ceil(len(buffer) / mtu)
-        packets = []
-        for i in range(number_of_packets):
-            packet = InfoPacket(
-                (i + initial_number) % cls().MAX_SPLIT_NUMBER,
-                buffer[i * mtu : (i + 1) * mtu],
+        view = memoryview(buffer).cast("B")
+        for i, offset in enumerate(range(0, max(len(view), 1), mtu)):
+            yield InfoPacket(
+                (i + initial_number) % cls.MAX_SPLIT_NUMBER,
+                view[offset : offset + mtu],
             )
-            packets.append(packet)
-        return packets
 
     def be_handled_by(self, handler):
         handler.handle_info(self)
@@ -178,22 +199,40 @@ class PacketFactory:
             return FinackPacket.read_from_stream(stream)
         raise ValueError(f"Unknown packet type: {packet_type}")
 
+    # Decodifica un paquete que llegó entero en un datagrama
+    @classmethod
+    def from_datagram(cls, datagram):
+        view = memoryview(datagram)
+        packet_type = bytes(view[:1])
+        if packet_type == INFO:
+            return InfoPacket.from_datagram(view)
+        for packet_class in (
+            AckPacket,
+            ConnectPacket,
+            ConnackPacket,
+            FinPacket,
+            FinackPacket,
+        ):
+            if packet_class.type == packet_type:
+                return packet_class.read_from_stream(DatagramReader(view[1:]))
+        raise ValueError(f"Unknown packet type: {packet_type}")
+
     @classmethod
     def read_connack(cls, stream):
-        packet_type = stream.recv_exact(1)
-        if ConnackPacket.type == packet_type:
-            return ConnackPacket.read_from_stream(stream)
+        packet = cls.from_datagram(stream.recv_datagram())
+        if ConnackPacket.type == packet.type:
+            return packet
         raise ValueError(
             f"Expected Connack Packet (type {ConnackPacket.type}), got type"
-            f" {packet_type}"
+            f" {packet.type}"
         )
 
     @classmethod
     def read_ack(cls, stream):
-        packet_type = stream.recv_exact(1)
-        if AckPacket.type == packet_type:
-            return AckPacket.read_from_stream(stream)
+        packet = cls.from_datagram(stream.recv_datagram())
+        if AckPacket.type == packet.type:
+            return packet
         raise ValueError(
             f"Expected Ack Packet (type {AckPacket.type}), got type"
-            f" {packet_type}"
+            f" {packet.type}"
         )
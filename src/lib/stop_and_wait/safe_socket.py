@@ -1,4 +1,7 @@
 import threading
+
+from loguru import logger
+
 from .packet import PacketFactory
 
 
@@ -13,14 +16,24 @@ class SafeSocket:
         with self.send_lock:
             self.socket.send_all(data)
 
+    def send_parts(self, parts):
+        with self.send_lock:
+            self.socket.send_buffers(parts)
+
     def recv(self, size):
         with self.recv_lock:
             return self.socket.recv(size)
 
+    # Descarta los datagramas que no son un paquete válido (cortados o de
+    # tipo desconocido) y espera el siguiente
     def read_packet(self):
-        with self.recv_lock:
-            packet = PacketFactory.read_from_stream(self.socket)
-        return packet
+        while True:
+            with self.recv_lock:
+                datagram = self.socket.recv_datagram()
+            try:
+                return PacketFactory.from_datagram(datagram)
+            except ValueError as e:
+                logger.warning(f"Dropping invalid packet: {e}")
 
     def close(self):
         with self.recv_lock:
@@ -7,12 +7,12 @@ import time
 
 from ..exceptions import ProtocolError, EndOfStream
 from ..packet import (
-    PacketFactory,
     InfoPacket,
     AckPacket,
     FinPacket,
     FinackPacket,
 )
+from ...utils import stable_buffer
 
 SEND_RETRIES = 50
 
@@ -22,9 +22,10 @@ class SAWSocketInterface(ABC):
     ACK_WAIT_TIMEOUT = 1.5
     SAFETY_TIME_BEFORE_DISCONNECT = 10
     FINACK_WAIT_TIMEOUT = 1.5
-    # Must check MSS <= 65514
+    # Must check MSS <= 65515
     MSS = 62000
     CLOSED_CHECK_INTERVAL = 1
+    READER_INTERRUPT_INTERVAL = 0.05
 
     # 65536/2 = 32768, 32768 - 13 = 32755
 
@@ -39,6 +40,9 @@ class SAWSocketInterface(ABC):
 
         self.state = initial_state
         self.state_lock = threading.RLock()
+        # Lo toma quien esté leyendo paquetes del socket (el packet
+        # handler o el cierre de la conexión), para que no se los roben
+        self.reader_lock = threading.RLock()
 
         self.ack_queue = queue.SimpleQueue()
         self.finack_received = threading.Event()
@@ -50,10 +54,12 @@ class SAWSocketInterface(ABC):
         pass
 
     def recv_exact(self, buff_size):
-        data = b""
-        while len(data) < buff_size:
-            data += self.recv(buff_size - len(data))
-        return data
+        pieces = []
+        received = 0
+        while received < buff_size:
+            pieces.append(self.recv(buff_size - received))
+            received += len(pieces[-1])
+        return b"".join(pieces)
 
     def set_state(self, state):
         self.state = state
@@ -67,27 +73,50 @@ class SAWSocketInterface(ABC):
         self.socket.settimeout(self.PACKET_HANDLER_TIMEOUT)
         self.socket.setblocking(True)
         while True:
-            time.sleep(0.1)
             with self.state_lock:
                 if not self.state.can_recv() and not self.state.can_send():
                     self.socket.close()
                     return
-                try:
+            # Se espera el paquete sin el state_lock tomado, para no
+            # bloquear a send() mientras no llega nada
+            try:
+                with self.reader_lock:
                     packet = self.socket.read_packet()
-                except socket.timeout:
-                    continue
-                except ProtocolError as e:
-                    logger.error(f"Protocol violation: {e}")
-                    break
-                logger.debug(f"Received packet {packet}")
-                packet.be_handled_by(self)
+            except socket.timeout:
+                continue
+            except ProtocolError as e:
+                logger.error(f"Protocol violation: {e}")
+                break
+            except EOFError:
+                # El listener desalojó la conexión
+                logger.error("Connection was dropped")
+                break
+            logger.debug(f"Received packet {packet}")
+            with self.state_lock:
+                # La conexión pudo cerrarse mientras se leía el paquete
+                if self.state.can_recv() or self.state.can_send():
+                    packet.be_handled_by(self)
         logger.info("Disconnecting")
         self.state.set_disconnected()
         self.socket.close()
 
+    # Toma el reader_lock. Si lo tiene el packet handler esperando un
+    # paquete, se lo despierta para no tener que esperar su timeout
+    def __acquire_reader(self):
+        if self.reader_lock.acquire(blocking=False):
+            return
+        self.socket.interrupt()
+        while not self.reader_lock.acquire(
+            timeout=self.READER_INTERRUPT_INTERVAL
+        ):
+            self.socket.interrupt()
+
     def received_ack(self, packet):
         if packet.number == self.current_info_number:
             logger.info(f"Received expected ACK packet (Nº {packet.number})")
+            # Solo un paquete que hace avanzar la conexión puede cambiar la
+            # dirección del otro extremo (ver MuxDemuxStream.confirm_path)
+            self.socket.confirm_path()
             self.ack_queue.put(packet)
             self.current_info_number += 1
             self.current_info_number %= InfoPacket.MAX_SPLIT_NUMBER
@@ -97,7 +126,10 @@ class SAWSocketInterface(ABC):
     def send_ack_for(self, packet):
         if self.current_ack_number == packet.number:
             logger.info(f"Received expected INFO packet (Nº {packet.number})")
-            self.info_bytestream.put_bytes(packet.body)
+            # Se copia para no retener el buffer del datagrama mientras la
+            # aplicación no lo lee
+            self.info_bytestream.put_bytes(bytes(packet.body))
+            self.socket.confirm_path()
             self.current_ack_number += 1
             self.current_ack_number %= InfoPacket.MAX_SPLIT_NUMBER
         else:
@@ -123,11 +155,18 @@ class SAWSocketInterface(ABC):
         self.socket.send_all(bytes(FinackPacket()))
 
     def wait_for_fin_retransmission(self):
+        self.__acquire_reader()
+        try:
+            self.__wait_for_fin_retransmission()
+        finally:
+            self.reader_lock.release()
+
+    def __wait_for_fin_retransmission(self):
         self.socket.settimeout(self.SAFETY_TIME_BEFORE_DISCONNECT)
         logger.info("Waiting some time for FIN retransmission")
         while True:
             try:
-                packet = PacketFactory.read_from_stream(self.socket)
+                packet = self.socket.read_packet()
                 if packet.type == FinPacket.type:
                     logger.debug("Received FIN retransmission")
                     self.socket.send_all(bytes(FinackPacket()))
@@ -149,17 +188,30 @@ class SAWSocketInterface(ABC):
         self.state.handle_finack(packet)
 
     def send_fin_reliably(self):
-        old_timeout = self.socket.gettimeout()
-        self.socket.settimeout(2)
-        logger.info(
-            f"Sending FIN reliably with timeout {self.socket.gettimeout()}"
-        )
+        self.__acquire_reader()
+        try:
+            old_timeout = self.socket.gettimeout()
+            self.socket.settimeout(2)
+            logger.info(
+                "Sending FIN reliably with timeout"
+                f" {self.socket.gettimeout()}"
+            )
+            self.__send_fin_reliably()
+            self.socket.settimeout(old_timeout)
+        finally:
+            self.reader_lock.release()
+        if not self.finack_received.is_set():
+            logger.warning("Could not confirm FIN was received")
+        else:
+            logger.success("Sent FIN reliably")
+
+    def __send_fin_reliably(self):
         for i in range(SEND_RETRIES):
             if self.finack_received.is_set():
                 break
             self.socket.send_all(bytes(FinPacket()))
             try:
-                packet = PacketFactory.read_from_stream(self.socket)
+                packet = self.socket.read_packet()
                 packet.be_handled_by(self)
             except socket.timeout:
                 logger.warning(
@@ -167,17 +219,12 @@ class SAWSocketInterface(ABC):
                     " sending again"
                 )
                 continue
-        self.socket.settimeout(old_timeout)
-        if not self.finack_received.is_set():
-            logger.warning("Could not confirm FIN was received")
-        else:
-            logger.success("Sent FIN reliably")
 
     def send_reliably(self, packet):
         for i in range(SEND_RETRIES):
             with self.state_lock:
                 if self.state.can_send():
-                    self.socket.send_all(bytes(packet))
+                    self.socket.send_parts(packet.parts())
                 else:
                     raise ProtocolError(
                         f"Cannot send packet while in state {self.state}"
@@ -193,10 +240,12 @@ class SAWSocketInterface(ABC):
     def send(self, buffer):
         logger.debug(f"Sending buffer of length {len(buffer)}")
 
+        # Los paquetes apuntan al buffer, se copia si es mutable para que
+        # no cambie durante las retransmisiones
+        buffer = stable_buffer(buffer)
         packets = InfoPacket.split(
             self.MSS, buffer, initial_number=self.current_info_number
         )
-        logger.debug(f"Fragmented buffer into {len(packets)} packets")
 
         for packet in packets:
             logger.debug(f"Sending packet Nº {packet.number}")
@@ -217,7 +266,12 @@ class SAWSocketInterface(ABC):
                     )
                     return info_body_bytes
                 except socket.timeout:
-                    if not self.block and time.time() - start > self.timeout:
+                    if not self.block and self.timeout is None:
+                        raise
+                    if (
+                        self.timeout is not None
+                        and time.time() - start > self.timeout
+                    ):
                         raise
             else:
                 raise EndOfStream(
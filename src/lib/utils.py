@@ -1,32 +1,223 @@
-import queue
+from collections import deque
 import socket
 import threading
+import time
 
 
+# Stream de bytes entre threads. Los lectores se bloquean en una
+# condition que se señaliza cuando llegan datos, y los timeouts son el
+# tiempo total de la lectura (no por chunk).
+# Los chunks se guardan como memoryview y se consumen moviendo un offset
+# sobre el primero, así que leer de a pocos bytes no copia el resto.
+# Después de close(), cuando no queda nada por leer las lecturas lanzan
+# EOFError en vez de esperar
 class MTByteStream:
-    def __init__(self):
-        self.stream = queue.SimpleQueue()
-        self.extra = b""
+    # on_read se llama (sin locks tomados) cada vez que se sacan bytes
+    # del stream
+    def __init__(self, on_read=None):
+        self.chunks = deque()
+        # Bytes ya leídos del primer chunk
+        self.offset = 0
+        self.size = 0
         self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        # Los lectores se atienden de a uno para no mezclar los datos
+        self.read_lock = threading.Lock()
+        self.on_read = on_read
+        # Se incrementa con interrupt() para despertar a los lectores
+        self.interrupts = 0
+        self.closed = False
 
+    # Espera hasta tener buff_size bytes o hasta que pase el timeout, en
+    # cuyo caso devuelve lo que haya (o lanza socket.timeout si no hay
+    # nada). Lo que va llegando se saca del stream mientras se espera
     def get_bytes(self, buff_size, timeout=None, block=True):
+        # Única copia de los datos: de los chunks al resultado
+        return b"".join(self.__read(buff_size, timeout, block))
+
+    # Como get_bytes(), pero copia los datos en buffer (hasta llenarlo) y
+    # devuelve la cantidad de bytes leídos
+    def readinto(self, buffer, timeout=None, block=True):
+        view = memoryview(buffer).cast("B")
+        written = 0
+        for piece in self.__read(len(view), timeout, block):
+            view[written : written + len(piece)] = piece
+            written += len(piece)
+        return written
+
+    # Devuelve hasta size bytes sin sacarlos del stream ni esperar
+    def peek(self, size):
+        pieces = []
         with self.lock:
-            data = self.extra[:buff_size]
-            self.extra = self.extra[buff_size:]
-            try:
-                while len(data) < buff_size:
-                    data += self.stream.get(block=block, timeout=timeout)
-
-                self.extra += data[buff_size:]
-                return data[:buff_size]
-            except queue.Empty as e:
-                if len(data) == 0:
-                    raise socket.timeout from e
-                return data
+            offset = self.offset
+            for chunk in self.chunks:
+                if size <= 0:
+                    break
+                piece = chunk[offset : offset + size]
+                pieces.append(piece)
+                size -= len(piece)
+                offset = 0
+            return b"".join(pieces)
+
+    # Devuelve el siguiente chunk tal como se agregó con put_bytes() (o lo
+    # que quedó de él después de un get_bytes()), sin copiarlo ni juntarlo
+    # con los siguientes
+    def get_chunk(self, timeout=None, block=True):
+        deadline = _deadline(timeout, block)
+        with self.read_lock:
+            with self.lock:
+                if not self.__wait(deadline, self.interrupts):
+                    self.__raise_empty()
+                chunk = self.chunks.popleft()[self.offset :]
+                self.offset = 0
+                self.size -= len(chunk)
+            self.__consumed()
+        return chunk
 
     def put_bytes(self, data):
-        self.stream.put(data)
+        # Se cuentan bytes aunque el buffer tenga items más grandes
+        data = memoryview(data).cast("B")
+        if not data:
+            return
+        with self.condition:
+            self.chunks.append(data)
+            self.size += len(data)
+            self.condition.notify()
+
+    # Despierta a los lectores que estén esperando datos, que vuelven como
+    # si se hubiera cumplido el timeout. Sirve para que un thread bloqueado
+    # leyendo se entere enseguida de un cambio de estado (p. ej. un cierre)
+    def interrupt(self):
+        with self.condition:
+            self.interrupts += 1
+            self.condition.notify_all()
+
+    # No llegan más datos: se despierta a los lectores, que se llevan lo
+    # que quede y después reciben EOFError
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def buffered(self):
+        with self.lock:
+            return self.size
 
     def empty(self):
+        return self.buffered() == 0
+
+    # Saca hasta size bytes a medida que llegan y los devuelve como slices
+    # de los chunks
+    def __read(self, size, timeout, block):
+        pieces = []
+        # Si ya está todo y no hay otro lector a mitad de una lectura, se
+        # saca sin esperar ni tomar el read_lock
         with self.lock:
-            return len(self.extra) == 0 and self.stream.empty()
+            ready = self.size >= size and not self.read_lock.locked()
+            if ready:
+                self.__take(size, pieces)
+        if ready:
+            self.__consumed()
+            return pieces
+
+        deadline = _deadline(timeout, block)
+        missing = size
+        with self.read_lock:
+            interrupts = self.interrupts
+            while missing > 0:
+                with self.lock:
+                    if not self.__wait(deadline, interrupts):
+                        break
+                    missing = self.__take(missing, pieces)
+                self.__consumed()
+        if missing == size and size > 0:
+            with self.lock:
+                self.__raise_empty()
+        return pieces
+
+    # Espera (con la condition tomada) a que haya datos, hasta el deadline
+    # o hasta un interrupt() posterior a la lectura de interrupts
+    def __wait(self, deadline, interrupts):
+        if self.size > 0:
+            return True
+        self.condition.wait_for(
+            lambda: self.size > 0
+            or self.closed
+            or self.interrupts != interrupts,
+            _remaining(deadline),
+        )
+        return self.size > 0
+
+    # Para una lectura que no consiguió nada. Se llama con el lock tomado
+    def __raise_empty(self):
+        if self.closed:
+            raise EOFError("Stream was closed")
+        raise socket.timeout("No data received")
+
+    # Agrega a pieces hasta size bytes como slices de los chunks (sin
+    # copiarlos) y devuelve cuántos faltaron. Se llama con el lock tomado
+    def __take(self, size, pieces):
+        while size > 0 and self.chunks:
+            chunk = self.chunks[0]
+            end = self.offset + size
+            if end < len(chunk):
+                pieces.append(chunk[self.offset : end])
+                self.offset = end
+                self.size -= size
+                return 0
+            pieces.append(chunk[self.offset :])
+            taken = len(chunk) - self.offset
+            size -= taken
+            self.size -= taken
+            self.chunks.popleft()
+            self.offset = 0
+        return size
+
+    def __consumed(self):
+        if self.on_read:
+            self.on_read()
+
+
+def _deadline(timeout, block=True):
+    if not block:
+        timeout = 0
+    return None if timeout is None else time.monotonic() + timeout
+
+
+# Tiempo que falta para el deadline (None si no hay), para pasarle a
+# Condition.wait_for()
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+# Lee los campos de un datagrama ya recibido entero con la misma interfaz
+# que un stream (recv_exact), pero sin locks ni copias: devuelve memoryview
+class DatagramReader:
+    def __init__(self, datagram):
+        self.view = memoryview(datagram)
+        self.offset = 0
+
+    def recv_exact(self, size):
+        chunk = self.view[self.offset : self.offset + size]
+        if len(chunk) < size:
+            raise ValueError(
+                f"Truncated datagram (expected {size} more bytes, got"
+                f" {len(chunk)})"
+            )
+        self.offset += size
+        return chunk
+
+
+# Los paquetes de un send() apuntan al buffer hasta que se reconocen, así
+# que se copia solo si puede cambiar mientras tanto. Los bytes y las
+# vistas de solo lectura (como la de un mmap con ACCESS_READ) se usan
+# tal cual
+def stable_buffer(buffer):
+    if isinstance(buffer, bytes):
+        return buffer
+    view = memoryview(buffer)
+    if view.readonly:
+        return view
+    return bytes(view)
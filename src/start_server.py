@@ -1,37 +1,94 @@
+import itertools
+import mmap
+import multiprocessing
 import os
-import time
+import queue
 import threading
+from lib.engine.endpoint import Engine
+from lib.ftp import compression
+from lib.engine.event_loop import EventLoop
+from lib.engine.sr_connection import SRProtocol
 from lib.ftp.args_server import args_server
+from lib.ftp.partial_file import PartialFile, file_version
+from lib.ftp.server_stats import ServerStats
+from lib.ftp.worker_pool import POOL_SIZE, WorkerPool
 from lib.rdt_listener.rdt_listener import RDTListener
 import signal
 import sys
 from loguru import logger
 
-threads = []
-
 MIN_SIZE = 60000
+# Tipos de pedido: subida y descarga enteras, subida que sigue desde lo
+# que el servidor ya tiene (ver PartialFile) y descarga de un rango. Los
+# dos últimos piden además un codec de compresión (ver compression), y
+# la subida lleva la versión del archivo (ver file_version())
+UPLOAD = 0
+DOWNLOAD = 1
+RESUME_UPLOAD = 5
+RANGE_DOWNLOAD = 6
+# Tipos de respuesta
 CONFIRM_DOWNLOAD = 2
 CONFIRM_UPLOAD = 3
 ERROR_HEADER = 4
+# Seguido del offset desde el que se sigue la subida y del codec
+RESUME_OFFSET = 7
+# Seguido del tamaño del archivo, de su versión, del largo del rango que
+# se manda y del codec
+CONFIRM_RANGE = 8
+
+# Archivos desde este tamaño se descargan desde un mmap (ver
+# send_mapped()). Para los chicos no vale la pena mapearlos
+MMAP_MIN_SIZE = 1024 * 1024
+# Sufijo de los archivos en los que se reciben las subidas enteras
+UPLOAD_SUFFIX = ".upload"
 
 UNKNOWN_TYPE_ERROR = 0
 FILE_NOT_FOUND_ERROR = 1
+INVALID_RANGE_ERROR = 2
 ENDIANESS = "little"
 
+# Conexiones aceptadas que pueden esperar un thread libre del pool (de
+# POOL_SIZE threads, que hacen el handshake y la transferencia). Con la
+# cola llena las nuevas se rechazan
+POOL_QUEUE = 64
+# Segundos que un thread del pool espera datos de su conexión antes de
+# cortarla (un cliente que desapareció no lo retiene para siempre)
+CONNECTION_TIMEOUT = 60
+# Lo que se espera al parar a que terminen las transferencias en curso.
+# Las que quedan se cortan al cerrar el listener
+SHUTDOWN_TIMEOUT = 30
+# Conexiones con cookie válida que esperan un accept() en el listener
+BACKLOG = 50
+# Cada cuántos segundos el event loop revisa si se pidió parar el worker
+STOP_CHECK_INTERVAL = 1
+# Formato de los logs con --workers (el de loguru más el worker)
+WORKER_LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green>"
+    " | <level>{level: <8}</level> | worker {extra[worker]}"
+    " | <cyan>{name}</cyan>:<cyan>{function}</cyan>"
+    " - <level>{message}</level>"
+)
+
 stop_event = threading.Event()
+stats = ServerStats()
+# Numeran los archivos temporales de las subidas de este proceso
+upload_ids = itertools.count()
 
 
+# start_server() termina las conexiones en curso antes de volver
 def exit_gracefully(sig, frame):
     signal.signal(signal.SIGINT, original_sigint)
 
-    logger.debug("joining threads")
-    for t in threads:
-        t.join()
-
     logger.info("exiting gracefully")
     stop_event.set()
 
 
+# Archivo temporal, único por subida, en el que se recibe filepath hasta
+# reemplazarlo (ver send_mapped())
+def upload_path(filepath):
+    return f"{filepath}.{os.getpid()}-{next(upload_ids)}{UPLOAD_SUFFIX}"
+
+
 def upload_to_server(socket, path, filename, length):
     logger.info(f"server receiving {filename}")
 
@@ -39,11 +96,75 @@ def upload_to_server(socket, path, filename, length):
         os.makedirs(path)
 
     counter = 0
-    with open(os.path.join(path, filename), "wb") as file:
-        while counter < length:
-            data = socket.recv(MIN_SIZE)
-            file.write(data)
-            counter += len(data)
+    filepath = os.path.join(path, filename)
+    temporary = upload_path(filepath)
+    try:
+        with open(temporary, "wb") as file:
+            while counter < length:
+                data = socket.recv(MIN_SIZE)
+                file.write(data)
+                counter += len(data)
+        os.replace(temporary, filepath)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    stats.add("bytes_received", counter)
+    stats.add("uploads")
+
+    logger.info(f"server finished receiving {filename}")
+    socket.send((CONFIRM_UPLOAD).to_bytes(1, byteorder=ENDIANESS))
+
+    socket.close()
+
+
+def send_error(socket, error):
+    stats.add("errors")
+    error_header_byte = (ERROR_HEADER).to_bytes(1, byteorder=ENDIANESS)
+    error_byte = (error).to_bytes(1, byteorder=ENDIANESS)
+    socket.send(error_header_byte + error_byte)
+
+
+# Sube el archivo a partir de lo que quedó de una subida anterior que se
+# cortó: se le responde al cliente el offset desde el que tiene que
+# mandar
+def resume_upload_to_server(socket, path, filename, length, version, codec):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    partial = PartialFile(os.path.join(path, filename), length, version)
+    offset = partial.open()
+    if offset:
+        logger.info(f"server resuming {filename} from byte {offset}")
+        stats.add("resumed")
+    else:
+        logger.info(f"server receiving {filename}")
+    codec = compression.negotiate(codec)
+    resume_byte = (RESUME_OFFSET).to_bytes(1, byteorder=ENDIANESS)
+    socket.send(
+        resume_byte
+        + (offset).to_bytes(8, byteorder=ENDIANESS)
+        + (codec).to_bytes(1, byteorder=ENDIANESS)
+    )
+
+    try:
+        if codec != compression.NONE:
+            stats.add("compressed")
+            compression.receive_compressed(
+                socket, codec, partial.write, length - offset
+            )
+            if not partial.complete():
+                raise EOFError(f"{filename} is shorter than announced")
+            stats.add("bytes_received", length - offset)
+        else:
+            while not partial.complete():
+                data = socket.recv(MIN_SIZE)
+                partial.write(data)
+                stats.add("bytes_received", len(data))
+        partial.finish()
+    finally:
+        # Si se cortó, lo recibido queda para retomarla
+        partial.close()
+    stats.add("uploads")
 
     logger.info(f"server finished receiving {filename}")
     socket.send((CONFIRM_UPLOAD).to_bytes(1, byteorder=ENDIANESS))
@@ -57,11 +178,7 @@ def download_from_server(socket, path, filename):
         length = os.path.getsize(os.path.join(path, filename))
     except Exception:
         logger.error("file not found")
-
-        error_header_byte = (ERROR_HEADER).to_bytes(1, byteorder=ENDIANESS)
-        error_byte = (FILE_NOT_FOUND_ERROR).to_bytes(1, byteorder=ENDIANESS)
-        socket.send(error_header_byte + error_byte)
-
+        send_error(socket, FILE_NOT_FOUND_ERROR)
         socket.close()
         return
 
@@ -72,94 +189,587 @@ def download_from_server(socket, path, filename):
     socket.send(confirm_byte + length_byte)
     logger.debug(f"file length: {str(length)}")
 
-    counter = 0
-    with open(os.path.join(path, filename), "rb") as file:
-        while counter < length:
-            data = file.read(MIN_SIZE)
-            socket.send(data)
-            counter += len(data)
+    send_file(socket, os.path.join(path, filename), 0, length)
+    stats.add("bytes_sent", length)
+    stats.add("downloads")
+
+    logger.info(f"server finished sending {filename}")
+
+
+# Manda length bytes del archivo desde offset (con length 0, hasta el
+# final). Antes del rango se manda el tamaño del archivo, así el cliente
+# puede ver si cambió desde la parte que ya tiene
+def download_range_from_server(
+    socket, path, filename, offset, length, codec, level
+):
+    try:
+        stat = os.stat(os.path.join(path, filename))
+    except Exception:
+        logger.error("file not found")
+        send_error(socket, FILE_NOT_FOUND_ERROR)
+        socket.close()
+        return
+    size = stat.st_size
+    if offset > size:
+        logger.error(f"invalid range: offset {offset}, file size {size}")
+        send_error(socket, INVALID_RANGE_ERROR)
+        socket.close()
+        return
+    if length == 0 or length > size - offset:
+        length = size - offset
+
+    logger.info(f"server sending {filename} [{offset}, {offset + length})")
+
+    codec = compression.negotiate(codec)
+    confirm_byte = (CONFIRM_RANGE).to_bytes(1, byteorder=ENDIANESS)
+    size_bytes = (size).to_bytes(8, byteorder=ENDIANESS)
+    version_bytes = file_version(stat).to_bytes(8, byteorder=ENDIANESS)
+    length_bytes = (length).to_bytes(8, byteorder=ENDIANESS)
+    codec_byte = (codec).to_bytes(1, byteorder=ENDIANESS)
+    socket.send(
+        confirm_byte + size_bytes + version_bytes + length_bytes + codec_byte
+    )
+
+    filepath = os.path.join(path, filename)
+    if codec == compression.NONE:
+        send_file(socket, filepath, offset, length)
+    else:
+        stats.add("compressed")
+        chunks = compression.read_chunks(filepath, offset, length)
+        for frame in compression.compressed_frames(chunks, codec, level):
+            socket.send(frame)
+        socket.close()
+    stats.add("bytes_sent", length)
+    stats.add("downloads")
 
     logger.info(f"server finished sending {filename}")
 
+
+# Manda length bytes del archivo desde offset y cierra el socket
+def send_file(socket, filepath, offset, length):
+    if length >= MMAP_MIN_SIZE:
+        send_mapped(socket, filepath, offset, length)
+        return
+    with open(filepath, "rb") as file:
+        file.seek(offset)
+        while length > 0:
+            data = file.read(min(MIN_SIZE, length))
+            if not data:
+                # El archivo se achicó mientras se mandaba
+                raise EOFError(f"{filepath} is shorter than expected")
+            socket.send(data)
+            length -= len(data)
     socket.close()
 
 
+# Manda el archivo desde un mmap de solo lectura: los paquetes son vistas
+# del mapeo, así que no se lee a buffers intermedios ni se copia para las
+# retransmisiones, y las descargas simultáneas del mismo archivo comparten
+# el page cache. Si el archivo se achicara con el mapeo abierto, leerlo
+# mataría al proceso con SIGBUS: por eso las subidas nunca escriben sobre
+# el archivo, lo reemplazan al terminar (ver upload_to_server() y
+# PartialFile) y el mapeo sigue viendo el anterior. El mapeo se cierra
+# después de cerrar el socket, que espera a que se reconozca todo
+def send_mapped(socket, filepath, offset, length):
+    # El offset de un mmap tiene que estar alineado
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with open(filepath, "rb") as file:
+        mapping = mmap.mmap(
+            file.fileno(),
+            offset + length - start,
+            access=mmap.ACCESS_READ,
+            offset=start,
+        )
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mapping)
+    try:
+        socket.send(view[offset - start :])
+        socket.close()
+    finally:
+        view.release()
+        try:
+            mapping.close()
+        except BufferError:
+            # Quedan paquetes sin reconocer (la conexión se cortó): el
+            # mapeo se libera cuando se descartan
+            logger.warning(f"{filepath} still mapped after the transfer")
+
+
+def read_u64(socket):
+    return int.from_bytes(socket.recv_exact(8), byteorder=ENDIANESS)
+
+
+# Codec pedido y su nivel, que se limita a los válidos antes de confirmar
+# (si no, el compresor fallaría recién después de la confirmación)
+def read_codec(socket):
+    codec, level = socket.recv_exact(2)
+    logger.debug(f"codec: {codec}, level: {level}")
+    return codec, min(level, compression.MAX_LEVEL)
+
+
+def read_filename(socket):
+    filename_length = int.from_bytes(socket.recv_exact(2), byteorder=ENDIANESS)
+    logger.debug(f"filename length: {str(filename_length)}")
+
+    filename = socket.recv_exact(filename_length).decode()
+    logger.debug(f"filename: {filename}")
+    return filename
+
+
 def check_type(socket, path):
     type_byte = socket.recv_exact(1)
     type = int.from_bytes(type_byte, byteorder=ENDIANESS)
     logger.debug(f"header type: {str(type)}")
 
-    if type == 0:
-        length = int.from_bytes(socket.recv_exact(8), byteorder=ENDIANESS)
+    if type in (UPLOAD, RESUME_UPLOAD):
+        length = read_u64(socket)
         logger.debug(f"file length: {str(length)}")
 
-        filename_length = int.from_bytes(
-            socket.recv_exact(2), byteorder=ENDIANESS
-        )
-        logger.debug(f"filename length: {str(filename_length)}")
+        if type == UPLOAD:
+            filename = read_filename(socket)
+            upload_to_server(socket, path, filename, length)
+        else:
+            version = read_u64(socket)
+            codec, _ = read_codec(socket)
+            filename = read_filename(socket)
+            resume_upload_to_server(
+                socket, path, filename, length, version, codec
+            )
 
-        filename = socket.recv_exact(filename_length).decode()
-        logger.debug(f"filename: {filename}")
+    elif type == DOWNLOAD:
+        filename = read_filename(socket)
 
-        upload_to_server(socket, path, filename, length)
+        download_from_server(socket, path, filename)
+
+    elif type == RANGE_DOWNLOAD:
+        offset = read_u64(socket)
+        length = read_u64(socket)
+        logger.debug(f"range offset: {offset}, length: {length}")
+        codec, level = read_codec(socket)
+        filename = read_filename(socket)
 
-    elif type == 1:
-        filename_length = int.from_bytes(
-            socket.recv_exact(2), byteorder=ENDIANESS
+        download_range_from_server(
+            socket, path, filename, offset, length, codec, level
         )
+
+    else:
+        send_error(socket, UNKNOWN_TYPE_ERROR)
+
+
+# El mismo protocolo que check_type(), upload_to_server() y
+# download_from_server() pero para el Engine: en vez de bloquearse
+# leyendo del socket va armando el header con lo que llega. No comprime:
+# hacerlo en el thread del event loop demoraría a todas las conexiones,
+# así que a cualquier codec pedido responde NONE
+class FileServerProtocol(SRProtocol):
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.buffer = bytearray()
+        self.file = None
+        # Archivo en el que se recibe una subida entera (ver upload_path())
+        self.temporary = None
+        self.filename = None
+        self.type = None
+        self.offset = 0
+        self.length = 0
+        self.version = 0
+        self.remaining = 0
+        self.uploading = False
+        self.writing_paused = False
+        self.sending = False
+        # Bytes que faltan del campo del header actual y quién lo procesa
+        self.need = 1
+        self.handler = self.__read_type
+
+    def connection_made(self, connection):
+        self.connection = connection
+
+    def data_received(self, data):
+        if self.uploading:
+            self.__write_file(data)
+            return
+        self.buffer += data
+        while self.handler and len(self.buffer) >= self.need:
+            field = bytes(self.buffer[: self.need])
+            del self.buffer[: self.need]
+            handler, self.handler = self.handler, None
+            handler(field)
+        if self.uploading and self.buffer:
+            rest, self.buffer = self.buffer, bytearray()
+            self.__write_file(rest)
+
+    def pause_writing(self):
+        self.writing_paused = True
+
+    def resume_writing(self):
+        self.writing_paused = False
+        self.__send_file()
+
+    def connection_lost(self, exc):
+        if self.file:
+            self.file.close()
+            self.file = None
+            stats.add("errors")
+            logger.error(f"connection lost while transferring {self.filename}")
+        if self.temporary:
+            os.remove(self.temporary)
+            self.temporary = None
+        if exc:
+            logger.error(f"connection lost: {exc}")
+
+    def __expect(self, size, handler):
+        self.need = size
+        self.handler = handler
+
+    def __read_type(self, field):
+        self.type = int.from_bytes(field, byteorder=ENDIANESS)
+        logger.debug(f"header type: {str(self.type)}")
+        if self.type in (UPLOAD, RESUME_UPLOAD):
+            self.__expect(8, self.__read_length)
+        elif self.type == DOWNLOAD:
+            self.__expect(2, self.__read_filename_length)
+        elif self.type == RANGE_DOWNLOAD:
+            self.__expect(8, self.__read_offset)
+        else:
+            self.__send_error(UNKNOWN_TYPE_ERROR)
+
+    def __read_offset(self, field):
+        self.offset = int.from_bytes(field, byteorder=ENDIANESS)
+        self.__expect(8, self.__read_length)
+
+    def __read_length(self, field):
+        self.length = int.from_bytes(field, byteorder=ENDIANESS)
+        logger.debug(f"length: {str(self.length)}")
+        if self.type == UPLOAD:
+            self.__expect(2, self.__read_filename_length)
+        elif self.type == RESUME_UPLOAD:
+            self.__expect(8, self.__read_version)
+        else:
+            self.__expect(2, self.__read_codec)
+
+    def __read_version(self, field):
+        self.version = int.from_bytes(field, byteorder=ENDIANESS)
+        self.__expect(2, self.__read_codec)
+
+    def __read_codec(self, field):
+        logger.debug(f"codec: {field[0]}, level: {field[1]}")
+        self.__expect(2, self.__read_filename_length)
+
+    def __read_filename_length(self, field):
+        filename_length = int.from_bytes(field, byteorder=ENDIANESS)
         logger.debug(f"filename length: {str(filename_length)}")
+        self.__expect(filename_length, self.__read_filename)
 
-        filename = socket.recv_exact(filename_length).decode()
-        logger.debug(f"filename: {filename}")
+    def __read_filename(self, field):
+        self.filename = field.decode()
+        logger.debug(f"filename: {self.filename}")
+        if self.type in (UPLOAD, RESUME_UPLOAD):
+            self.__start_upload()
+        else:
+            self.__start_download()
+
+    # Ver resume_upload_to_server()
+    def __start_upload(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        filepath = os.path.join(self.path, self.filename)
+        if self.type == UPLOAD:
+            logger.info(f"server receiving {self.filename}")
+            self.temporary = upload_path(filepath)
+            self.file = open(self.temporary, "wb")
+            self.remaining = self.length
+        else:
+            self.file = PartialFile(filepath, self.length, self.version)
+            offset = self.file.open()
+            if offset:
+                logger.info(f"server resuming {self.filename} from {offset}")
+                stats.add("resumed")
+            else:
+                logger.info(f"server receiving {self.filename}")
+            self.remaining = self.length - offset
+            resume_byte = (RESUME_OFFSET).to_bytes(1, byteorder=ENDIANESS)
+            self.connection.write(
+                resume_byte
+                + (offset).to_bytes(8, byteorder=ENDIANESS)
+                + (compression.NONE).to_bytes(1, byteorder=ENDIANESS)
+            )
+        self.uploading = True
+        if self.remaining == 0:
+            self.__finish_upload()
+
+    def __write_file(self, data):
+        self.file.write(data)
+        self.remaining -= len(data)
+        stats.add("bytes_received", len(data))
+        if self.remaining <= 0:
+            self.__finish_upload()
+
+    def __finish_upload(self):
+        self.uploading = False
+        if self.type == RESUME_UPLOAD:
+            self.file.finish()
+        else:
+            self.file.close()
+            os.replace(self.temporary, os.path.join(self.path, self.filename))
+            self.temporary = None
+        self.file = None
+        stats.add("uploads")
+        logger.info(f"server finished receiving {self.filename}")
+        self.connection.write(
+            (CONFIRM_UPLOAD).to_bytes(1, byteorder=ENDIANESS)
+        )
+        self.connection.close()
+
+    # Ver download_range_from_server()
+    def __start_download(self):
+        try:
+            self.file = open(os.path.join(self.path, self.filename), "rb")
+            stat = os.fstat(self.file.fileno())
+            size = stat.st_size
+        except Exception:
+            logger.error("file not found")
+            self.__send_error(FILE_NOT_FOUND_ERROR)
+            return
+
+        logger.info(f"server sending {self.filename}")
+        if self.type == DOWNLOAD:
+            self.remaining = size
+            confirm_byte = (CONFIRM_DOWNLOAD).to_bytes(1, byteorder=ENDIANESS)
+            self.connection.write(
+                confirm_byte + (size).to_bytes(8, byteorder=ENDIANESS)
+            )
+        else:
+            if self.offset > size:
+                logger.error(f"invalid range: offset {self.offset}")
+                self.file.close()
+                self.file = None
+                self.__send_error(INVALID_RANGE_ERROR)
+                return
+            self.remaining = size - self.offset
+            if self.length:
+                self.remaining = min(self.length, self.remaining)
+            self.file.seek(self.offset)
+            confirm_byte = (CONFIRM_RANGE).to_bytes(1, byteorder=ENDIANESS)
+            self.connection.write(
+                confirm_byte
+                + (size).to_bytes(8, byteorder=ENDIANESS)
+                + file_version(stat).to_bytes(8, byteorder=ENDIANESS)
+                + (self.remaining).to_bytes(8, byteorder=ENDIANESS)
+                + (compression.NONE).to_bytes(1, byteorder=ENDIANESS)
+            )
+        logger.debug(f"length: {str(self.remaining)}")
+        self.__send_file()
+
+    # Manda el archivo hasta que la conexión pide que se pare
+    # (pause_writing) y sigue en resume_writing
+    def __send_file(self):
+        if self.sending or self.file is None:
+            return
+        self.sending = True
+        while self.remaining > 0 and not self.writing_paused:
+            data = self.file.read(min(MIN_SIZE, self.remaining))
+            if not data:
+                break
+            self.connection.write(data)
+            self.remaining -= len(data)
+            stats.add("bytes_sent", len(data))
+        self.sending = False
+        if self.remaining > 0 and self.writing_paused:
+            return
+        self.file.close()
+        self.file = None
+        if self.remaining > 0:
+            # El archivo se achicó mientras se mandaba: el cliente recibe
+            # menos de lo anunciado y no es una descarga terminada
+            stats.add("errors")
+            logger.error(f"{self.filename} is shorter than announced")
+        else:
+            stats.add("downloads")
+            logger.info(f"server finished sending {self.filename}")
+        self.connection.close()
 
-        download_from_server(socket, path, filename)
+    def __send_error(self, error):
+        stats.add("errors")
+        error_header_byte = (ERROR_HEADER).to_bytes(1, byteorder=ENDIANESS)
+        error_byte = (error).to_bytes(1, byteorder=ENDIANESS)
+        self.connection.write(error_header_byte + error_byte)
+        self.connection.close()
+
+
+def start_event_server(host, port, storage, reuse_port=False, worker=False):
+    loop = EventLoop()
+    engine = Engine(loop)
+    engine.listen(
+        (host, int(port)), lambda: FileServerProtocol(storage), reuse_port
+    )
+    # El handler corre en este mismo thread, entre callbacks del loop. Un
+    # worker ignora el Ctrl+C (ver start_worker())
+    if not worker:
+        signal.signal(signal.SIGINT, lambda sig, frame: loop.stop())
+    # Con --workers el que avisa que hay que parar es el proceso principal
+    check_stop(loop)
+    logger.info("the server is ready to receive")
+
+    loop.run_forever()
+
+    logger.info(f"Server stopped ({stats})")
+    engine.close()
+    loop.close()
 
+
+def check_stop(loop):
+    if stop_event.is_set():
+        loop.stop()
     else:
-        error_header_byte = (ERROR_HEADER).to_bytes(1, byteorder=ENDIANESS)
-        error_byte = (UNKNOWN_TYPE_ERROR).to_bytes(1, byteorder=ENDIANESS)
-        socket.send(error_header_byte + error_byte)
+        loop.call_later(STOP_CHECK_INTERVAL, check_stop, loop)
 
 
-def start_server(host, port, storage, method):
-    serverSocket = RDTListener(method)
+# Handshake y transferencia de una conexión, en un thread del pool
+def serve_connection(listener, stream, storage):
+    try:
+        connection_socket = listener.handshake(stream)
+    except Exception as e:
+        logger.warning(f"handshake failed: {e}")
+        stats.add("handshake_errors")
+        return
+    connection_socket.settimeout(CONNECTION_TIMEOUT)
+    try:
+        check_type(connection_socket, storage)
+    except Exception:
+        # Si no, la conexión sigue en el listener hasta que se la desaloja
+        try:
+            connection_socket.close()
+        except Exception as e:
+            logger.warning(f"could not close the connection: {e}")
+        raise
+
+
+# accept() se bloquea sin timeout: lo despierta este thread cuando se pide
+# parar (con --workers el stop lo setea otro proceso)
+def interrupt_on_stop(listener):
+    stop_event.wait()
+    listener.interrupt_accept()
+
+
+def start_server(
+    host,
+    port,
+    storage,
+    method,
+    reuse_port=False,
+    pool_size=POOL_SIZE,
+    pool_queue=POOL_QUEUE,
+):
+    serverSocket = RDTListener(method, reuse_port=reuse_port)
     serverSocket.bind((host, int(port)))
-    serverSocket.listen(50)
-    serverSocket.settimeout(1)
+    serverSocket.listen(BACKLOG)
+    pool = WorkerPool(pool_size, pool_queue)
+    waker = threading.Thread(
+        target=interrupt_on_stop, args=(serverSocket,), daemon=True
+    )
+    waker.start()
     logger.info("the server is ready to receive")
 
     while not stop_event.is_set():
-        connectionSocket = serverSocket.accept()
-
-        if connectionSocket:
-            t = threading.Thread(
-                target=check_type, args=(connectionSocket, storage)
-            )
-            threads.append(t)
-            t.start()
-        else:
-            # non blocking listener
-            time.sleep(0.1)
-
-    logger.info("Server stopped")
+        # Solo saca la conexión de la cola, el handshake lo hace el pool
+        stream = serverSocket.accept_stream()
+        if stream is None:
+            continue
+        stats.add("connections")
+        if not pool.submit(serve_connection, serverSocket, stream, storage):
+            logger.warning("worker pool is full, rejecting connection")
+            stats.add("rejected")
+            stream.close()
+
+    waker.join()
+    if not pool.shutdown(SHUTDOWN_TIMEOUT):
+        logger.warning("stopping with transfers in progress")
+    logger.info(f"Server stopped ({stats})")
+    logger.info(f"Worker pool: {pool}")
     serverSocket.close()
-    for t in threads:
-        t.join()
     return
 
 
+# Un proceso de --workers: atiende su parte de las conexiones (el kernel
+# reparte las direcciones entre los sockets con SO_REUSEPORT) hasta que
+# el principal setea stop, y le manda sus estadísticas. El reparto es por
+# dirección y no por connection ID, así que si un cliente cambia de
+# dirección (NAT) sus datagramas pueden llegarle a otro worker, que no
+# conoce la conexión y los descarta
+def start_worker(
+    worker, host, port, storage, method, engine, pool, stop, results
+):
+    global stop_event
+    stop_event = stop
+    # El Ctrl+C le llega a todo el grupo de procesos, pero solo lo maneja
+    # el principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger.configure(extra={"worker": worker})
+
+    if engine == "events":
+        start_event_server(host, port, storage, reuse_port=True, worker=True)
+    else:
+        start_server(
+            host, port, storage, method, reuse_port=True, pool_size=pool
+        )
+    results.put((worker, stats.snapshot()))
+
+
+def start_workers(host, port, storage, method, engine, pool, workers):
+    # fork para que los workers hereden el sink de loguru (con enqueue
+    # los logs de todos los procesos los escribe el principal)
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=start_worker,
+            args=(i, host, port, storage, method, engine, pool, stop, results),
+            name=f"worker-{i}",
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"started {workers} workers")
+
+    signal.signal(signal.SIGINT, lambda sig, frame: stop.set())
+    for process in processes:
+        process.join()
+
+    totals = ServerStats()
+    for _ in range(sum(p.exitcode == 0 for p in processes)):
+        try:
+            worker, counters = results.get(timeout=1)
+        except queue.Empty:
+            break
+        logger.info(f"worker {worker} stats: {counters}")
+        totals.merge(counters)
+    logger.info(f"total stats ({workers} workers): {totals}")
+
+
 if __name__ == "__main__":
     method = "selective_repeat"
 
     args = args_server()
 
-    logger.remove()
+    level = "INFO"
     if args.quiet:
-        logger.add(sys.stdout, level="ERROR")
+        level = "ERROR"
     elif args.verbose:
-        logger.add(sys.stdout, level="DEBUG")
-        logger.debug("in verbose mode")
+        level = "DEBUG"
+
+    logger.remove()
+    if args.workers > 1:
+        logger.configure(extra={"worker": "main"})
+        logger.add(
+            sys.stdout, level=level, format=WORKER_LOG_FORMAT, enqueue=True
+        )
     else:
-        logger.add(sys.stdout, level="INFO")
+        logger.add(sys.stdout, level=level)
+    logger.debug("in verbose mode")
 
     logger.debug("arguments read")
 
@@ -167,6 +777,22 @@ if __name__ == "__main__":
     PORT = args.port
     STORAGE = args.storage
 
+    if args.workers > 1:
+        start_workers(
+            HOST,
+            PORT,
+            STORAGE,
+            method,
+            args.engine,
+            args.pool,
+            args.workers,
+        )
+        sys.exit(0)
+
+    if args.engine == "events":
+        start_event_server(HOST, PORT, STORAGE)
+        sys.exit(0)
+
     original_sigint = signal.getsignal(signal.SIGINT)
     signal.signal(signal.SIGINT, exit_gracefully)
-    start_server(HOST, PORT, STORAGE, method)
+    start_server(HOST, PORT, STORAGE, method, pool_size=args.pool)
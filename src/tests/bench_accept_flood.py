@@ -0,0 +1,192 @@
+"""
+Benchmark de accept() con un flood de primeros datagramas falsos.
+
+Otro proceso manda --rate datagramas por segundo a un RDTListener, cada
+uno con un connection ID nuevo (--flood: DATA como el primer paquete
+de una conexión, ECHO con cookies inventadas o HELLO de alguien que nunca
+devuelve la cookie), mientras --clients SRSocket se conectan de a
+--concurrency a la vez. Se mide cuántos accept() por segundo completa el
+listener, la latencia de connect() y el pico de conexiones con estado en
+el listener (que con el handshake con cookie no debería pasar de las de
+los clientes reales).
+
+Uso (desde src/): python3 -m tests.bench_accept_flood --flood data echo
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from lib.mux_demux.cookie import COOKIE_SIZE
+from lib.mux_demux.header import DATA, ECHO, HELLO, encode_header
+from lib.rdt_listener.rdt_listener import RDTListener, SELECTIVE_REPEAT
+from lib.selective_repeat.packet import Connect
+from lib.selective_repeat.sr_socket import SRSocket
+
+ADDR = ("127.0.0.1", 58000)
+# Connection IDs distintos que usa el flood (se repiten en ciclo)
+FLOOD_IDS = 2**16
+# Datagramas del flood entre cada chequeo de si hay que terminar
+FLOOD_BATCH = 1024
+# Tipo de los datagramas de cada --flood
+FLOODS = {"none": None, "data": DATA, "echo": ECHO, "hello": HELLO}
+
+
+def flood_datagrams(kind):
+    connect = Connect().encode()
+    if kind == DATA:
+        body = connect
+    elif kind == ECHO:
+        body = os.urandom(COOKIE_SIZE) + connect
+    else:
+        body = bytes(COOKIE_SIZE)
+    return [
+        encode_header(int.from_bytes(os.urandom(4), "big"), kind) + body
+        for _ in range(FLOOD_IDS)
+    ]
+
+
+def flood(kind, rate, stop_event, sent):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.setblocking(False)
+    datagrams = flood_datagrams(kind)
+    count = 0
+    start = time.monotonic()
+    for first in itertools.cycle(range(0, FLOOD_IDS, FLOOD_BATCH)):
+        if stop_event.is_set():
+            break
+        # Espera para no pasarse de rate datagramas por segundo
+        time.sleep(max(0, start + count / rate - time.monotonic()))
+        for datagram in datagrams[first : first + FLOOD_BATCH]:
+            try:
+                sender.sendto(datagram, ADDR)
+                count += 1
+            except BlockingIOError:
+                pass
+    sent.value = count
+    sender.close()
+
+
+def serve(listener, clients, stats):
+    sockets = []
+    closers = []
+    start = time.monotonic()
+    while len(sockets) + stats["errors"] < clients:
+        try:
+            server_socket = listener.accept()
+        except Exception as e:
+            logger.warning(f"Handshake failed: {e}")
+            stats["errors"] += 1
+            continue
+        if server_socket is None:
+            continue
+        sockets.append(server_socket)
+        closer = threading.Thread(target=server_socket.close)
+        closer.start()
+        closers.append(closer)
+    stats["accepted"] = len(sockets)
+    stats["elapsed"] = time.monotonic() - start
+    for closer in closers:
+        closer.join()
+
+
+def connect():
+    start = time.monotonic()
+    client = SRSocket()
+    client.connect(ADDR)
+    return client, time.monotonic() - start
+
+
+def run(flood_name, rate, clients, concurrency, backlog):
+    kind = FLOODS[flood_name]
+    listener = RDTListener(SELECTIVE_REPEAT)
+    listener.bind(ADDR)
+    listener.listen(backlog)
+    listener.settimeout(1)
+    streams = listener.mux_demux_listener.bytestreams
+    stats = {"errors": 0, "accepted": 0, "elapsed": 0}
+
+    stop_event = multiprocessing.Event()
+    sent = multiprocessing.Value("q", 0)
+    flooder = None
+    if kind is not None:
+        flooder = multiprocessing.Process(
+            target=flood, args=(kind, rate, stop_event, sent)
+        )
+        flooder.start()
+        # Que el flood ya esté corriendo cuando llegan los clientes
+        time.sleep(0.5)
+
+    server = threading.Thread(target=serve, args=(listener, clients, stats))
+    server.start()
+    peak_state = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        connected = executor.map(lambda _: connect(), range(clients))
+        while server.is_alive() and stats["elapsed"] == 0:
+            peak_state = max(peak_state, len(streams))
+            time.sleep(0.01)
+        connected = list(connected)
+        # Los cierres no cuentan en el tiempo de los accept()
+        list(executor.map(lambda client: client[0].close(), connected))
+    server.join()
+    latencies = [latency for _, latency in connected]
+    stop_event.set()
+    if flooder is not None:
+        flooder.join()
+    listener.close()
+    return {
+        "flood": flood_name,
+        "flood_datagrams": sent.value,
+        "accepted": stats["accepted"],
+        "errors": stats["errors"],
+        "accepts_per_s": stats["accepted"] / stats["elapsed"],
+        "connect_p50_ms": statistics.median(latencies) * 1000,
+        "connect_max_ms": max(latencies) * 1000,
+        "peak_listener_state": peak_state,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--flood",
+        choices=FLOODS,
+        nargs="+",
+        default=["none", "data", "echo", "hello"],
+    )
+    parser.add_argument("--rate", type=int, default=50000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--backlog", type=int, default=16)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    for flood_name in args.flood:
+        results = run(
+            flood_name,
+            args.rate,
+            args.clients,
+            args.concurrency,
+            args.backlog,
+        )
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            print(f"{key}: {value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
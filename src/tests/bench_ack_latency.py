@@ -0,0 +1,136 @@
+"""
+Benchmark de la latencia de los ACK de una transferencia chica que corre
+junto a una grande en el mismo RDTListener.
+
+Un cliente descarga --big MB del servidor (la ventana de la descarga
+llena la cola de salida del listener) y mientras tanto otro cliente, por
+una sola conexión, manda mensajes de --small KB y espera la respuesta de
+un byte de cada uno. Los ACK y las respuestas del cliente chico salen por
+la misma cola que los INFO de la descarga, así que el tiempo de cada ida
+y vuelta, su RTT estimado y los reenvíos por timeout muestran cuánto los
+demora. Se mide también el throughput de la descarga, para ver que no
+empeora.
+
+Uso (desde src/): python3 -m tests.bench_ack_latency --big 500 --small 4
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from lib.rdt_listener.rdt_listener import RDTListener, SELECTIVE_REPEAT
+from lib.selective_repeat.sr_socket import SRSocket
+
+ADDR = ("127.0.0.1", 58100)
+KB = 1024
+MB = 1024 * KB
+DOWNLOAD = b"D"
+PING = b"P"
+# Fin de los mensajes del cliente chico
+DONE = b"X"
+
+
+def handle(socket, big, small):
+    command = socket.recv_exact(1)
+    if command == DOWNLOAD:
+        socket.send(bytes(big))
+    else:
+        while command == PING:
+            socket.recv_exact(small)
+            socket.send(b"\x01")
+            command = socket.recv_exact(1)
+    socket.close()
+
+
+def serve(listener, big, small):
+    handlers = []
+    while len(handlers) < 2:
+        socket = listener.accept()
+        if socket is None:
+            continue
+        handler = threading.Thread(target=handle, args=(socket, big, small))
+        handler.start()
+        handlers.append(handler)
+    for handler in handlers:
+        handler.join()
+
+
+def download(big, started, stats):
+    socket = SRSocket()
+    socket.connect(ADDR)
+    start = time.monotonic()
+    socket.send(DOWNLOAD)
+    socket.recv_exact(1, timeout=60)
+    started.set()
+    socket.recv_exact(big - 1, timeout=60)
+    stats["download_MBps"] = big / (time.monotonic() - start) / MB
+    socket.close()
+
+
+def ping_pong(small, downloader):
+    socket = SRSocket()
+    socket.connect(ADDR)
+    message = PING + bytes(small)
+    round_trips = []
+    while downloader.is_alive():
+        start = time.monotonic()
+        socket.send(message)
+        socket.recv_exact(1, timeout=60)
+        round_trips.append(time.monotonic() - start)
+    socket.send(DONE)
+    socket.close()
+    return round_trips, socket
+
+
+def run(big, small):
+    listener = RDTListener(SELECTIVE_REPEAT)
+    listener.bind(ADDR)
+    listener.listen(2)
+    listener.settimeout(1)
+    server = threading.Thread(target=serve, args=(listener, big, small))
+    server.start()
+
+    stats = {}
+    started = threading.Event()
+    downloader = threading.Thread(target=download, args=(big, started, stats))
+    downloader.start()
+    started.wait()
+    round_trips, socket = ping_pong(small, downloader)
+    downloader.join()
+    server.join()
+    listener.close()
+
+    round_trips.sort()
+    return {
+        "round_trips": len(round_trips),
+        "round_trip_p50_ms": statistics.median(round_trips) * 1000,
+        "round_trip_p99_ms": round_trips[len(round_trips) * 99 // 100] * 1000,
+        "small_srtt_ms": socket.srtt() * 1000,
+        "small_timeout_retransmits": socket.timeout_retransmits,
+        "download_MBps": stats["download_MBps"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--big", type=int, default=500, help="MB")
+    parser.add_argument("--small", type=int, default=4, help="KB")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = run(args.big * MB, args.small * KB)
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark de muchas transferencias concurrentes desde asyncio.
+
+Los clientes suben --size KB cada uno a un AsyncRDTListener (que corre en
+su propio thread y loop) y esperan un byte de confirmación. Con --mode
+async cada cliente es un AsyncSRSocket en el loop principal, con --mode
+threads es un SRSocket bloqueante en run_in_executor (un thread por
+transferencia, lo que se hacía antes). Se mide el pico de threads, el
+tiempo total y el throughput agregado.
+
+Uso (desde src/): python3 -m tests.bench_async_sr --clients 1000
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from lib.rdt_listener.async_rdt_listener import AsyncRDTListener
+from lib.selective_repeat.async_sr_socket import AsyncSRSocket
+from lib.selective_repeat.sr_socket import SRSocket
+from tests.bench_sr_transfer import ThreadSampler
+
+ADDR = ("127.0.0.1", 57800)
+KB = 1024
+
+
+async def serve(clients, size, ready):
+    listener = AsyncRDTListener()
+    await listener.bind(ADDR)
+    listener.listen(clients)
+    ready.set()
+
+    async def handle(socket):
+        await socket.recv_exact(size)
+        await socket.send(b"\x01")
+        await socket.close()
+
+    handlers = []
+    while len(handlers) < clients:
+        socket = await listener.accept()
+        handlers.append(asyncio.create_task(handle(socket)))
+    await asyncio.gather(*handlers)
+    await listener.close()
+
+
+async def async_upload(data):
+    socket = AsyncSRSocket()
+    await socket.connect(ADDR)
+    await socket.send(data)
+    await socket.recv_exact(1)
+    await socket.close()
+
+
+def threaded_upload(data):
+    socket = SRSocket()
+    socket.connect(ADDR)
+    socket.send(data)
+    socket.recv_exact(1)
+    socket.close()
+
+
+async def run_clients(mode, clients, size):
+    data = bytes(size)
+    if mode == "async":
+        await asyncio.gather(*(async_upload(data) for _ in range(clients)))
+        return
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(executor, threaded_upload, data)
+                for _ in range(clients)
+            )
+        )
+
+
+def run(mode, clients, size):
+    ready = threading.Event()
+    server = threading.Thread(
+        target=asyncio.run, args=(serve(clients, size, ready),)
+    )
+    server.start()
+    ready.wait()
+
+    with ThreadSampler() as sampler:
+        start = time.monotonic()
+        asyncio.run(run_clients(mode, clients, size))
+        elapsed = time.monotonic() - start
+    server.join()
+    return {
+        "mode": mode,
+        "peak_threads": sampler.peak,
+        "elapsed_s": elapsed,
+        "throughput_MBps": clients * size / elapsed / KB / KB,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--mode", choices=("async", "threads", "both"), default="both"
+    )
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=64, help="KB")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    modes = ("async", "threads") if args.mode == "both" else [args.mode]
+    for mode in modes:
+        results = run(mode, args.clients, args.size * KB)
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            print(f"{key}: {value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
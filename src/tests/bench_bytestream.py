@@ -0,0 +1,83 @@
+"""
+Microbenchmark de MTByteStream leyendo de a pocos bytes chunks grandes.
+
+Se agregan --chunks chunks de cada tamaño y se leen de a --read bytes
+(como los headers de 1, 2 y 4 bytes sobre datagramas de 62 KB). Compara
+el stream anterior (bytes que se recortan y concatenan en cada lectura)
+con el actual (memoryview con offset). Si el costo es lineal, los ns por
+byte leído no dependen del tamaño del chunk.
+
+Uso (desde src/): python3 -m tests.bench_bytestream --read 4
+"""
+
+import argparse
+import queue
+import socket
+import threading
+import time
+
+from lib.utils import MTByteStream
+
+KB = 1024
+
+
+# Como era MTByteStream.get_bytes() antes de guardar offsets: cada lectura
+# copia lo que queda del chunk
+class LegacyByteStream:
+    def __init__(self):
+        self.stream = queue.SimpleQueue()
+        self.extra = b""
+        self.lock = threading.Lock()
+
+    def get_bytes(self, buff_size, timeout=None, block=True):
+        with self.lock:
+            data = self.extra[:buff_size]
+            self.extra = self.extra[buff_size:]
+            try:
+                while len(data) < buff_size:
+                    data += self.stream.get(block=block, timeout=timeout)
+
+                self.extra += data[buff_size:]
+                return data[:buff_size]
+            except queue.Empty as e:
+                if len(data) == 0:
+                    raise socket.timeout from e
+                return data
+
+    def put_bytes(self, data):
+        self.stream.put(data)
+
+
+STREAMS = {"legacy": LegacyByteStream, "current": MTByteStream}
+
+
+def ns_per_byte(stream_class, chunk_size, chunks, read_size):
+    stream = stream_class()
+    chunk = bytes(chunk_size)
+    for _ in range(chunks):
+        stream.put_bytes(chunk)
+
+    total = chunk_size * chunks
+    start = time.perf_counter_ns()
+    for _ in range(total // read_size):
+        stream.get_bytes(read_size)
+    return (time.perf_counter_ns() - start) / total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--read", type=int, default=4, help="bytes")
+    parser.add_argument("--chunks", type=int, default=4)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[8, 16, 32, 62], help="KB"
+    )
+    args = parser.parse_args()
+
+    for name, stream_class in STREAMS.items():
+        for size in args.sizes:
+            cost = ns_per_byte(stream_class, size * KB, args.chunks, args.read)
+            print(f"{name}: chunk_kb: {size} ns_per_byte: {cost:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark de la compresión de las transferencias (lib/ftp/compression).
+
+Manda --size MB de un log sintético (o de --file) por un enlace simulado
+de --link MB/s: cada send() espera lo que tardaría el frame en salir. Se
+compara el envío sin comprimir con cada codec, comprimiendo en serie
+(comprimir un chunk y después mandarlo) y con compressed_frames(), donde
+la compresión corre en otro thread y se superpone con el envío. Con el
+pipeline el tiempo tiende al mayor de los dos (comprimir o mandar lo
+comprimido) en vez de a su suma.
+
+Uso (desde src/): python3 -m tests.bench_compression --size 50 --link 10
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from loguru import logger
+
+from lib.ftp import compression
+from lib.ftp.compression import CHUNK_SIZE, FRAME
+
+MB = 1024 * 1024
+WORDS = [b"GET", b"POST", b"/api/v1/items", b"200", b"404", b"INFO", b"WARN"]
+
+
+# Socket que tarda en mandar lo que tardaría un enlace de bandwidth
+# bytes por segundo
+class LinkSocket:
+    def __init__(self, bandwidth):
+        self.bandwidth = bandwidth
+        self.sent = 0
+
+    def send(self, data):
+        time.sleep(len(data) / self.bandwidth)
+        self.sent += len(data)
+
+
+def synthetic_log(size):
+    random.seed(1)
+    lines = []
+    total = 0
+    while total < size:
+        line = b" ".join(random.choice(WORDS) for _ in range(8))
+        line += b" %d\n" % random.randint(0, 99999)
+        lines.append(line)
+        total += len(line)
+    return b"".join(lines)[:size]
+
+
+def chunks_of(data):
+    return (data[i : i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+
+
+def raw(data, link):
+    for chunk in chunks_of(data):
+        link.send(chunk)
+
+
+def serial(data, link, codec, level):
+    encoder = compression.compressor(codec, level)
+    for chunk in chunks_of(data):
+        compressed = encoder.compress(chunk)
+        if compressed:
+            link.send(FRAME.pack(len(compressed)) + compressed)
+    compressed = encoder.flush()
+    link.send(FRAME.pack(len(compressed)) + compressed + FRAME.pack(0))
+
+
+def pipelined(data, link, codec, level):
+    for frame in compression.compressed_frames(chunks_of(data), codec, level):
+        link.send(frame)
+
+
+def measure(name, send, data, bandwidth, *args):
+    link = LinkSocket(bandwidth)
+    start = time.monotonic()
+    send(data, link, *args)
+    elapsed = time.monotonic() - start
+    return {
+        "mode": name,
+        "elapsed_s": elapsed,
+        "ratio": link.sent / len(data),
+        "throughput_MBps": len(data) / elapsed / MB,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=50, help="MB")
+    parser.add_argument("--file", help="file to send instead of a log")
+    parser.add_argument("--link", type=float, default=10, help="MB/s")
+    parser.add_argument(
+        "--codecs", nargs="+", default=["zlib", "lzma"], help="zlib, lzma"
+    )
+    parser.add_argument("--level", type=int, default=compression.DEFAULT_LEVEL)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    if args.file:
+        with open(args.file, "rb") as file:
+            data = file.read()
+    else:
+        data = synthetic_log(args.size * MB)
+    bandwidth = args.link * MB
+
+    print(f"cpus: {os.cpu_count()}")
+    runs = [measure("raw", raw, data, bandwidth)]
+    for name in args.codecs:
+        codec = compression.CODECS[name]
+        if not compression.available(codec):
+            print(f"{name}: not available\n")
+            continue
+        for mode, send in (("serial", serial), ("pipelined", pipelined)):
+            runs.append(
+                measure(
+                    f"{name}-{mode}", send, data, bandwidth, codec, args.level
+                )
+            )
+    for results in runs:
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            print(f"{key}: {value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark de la latencia de connect() con una ráfaga de clientes detrás
+de clientes lentos.
+
+Primero --slow clientes completan el handshake con cookie pero nunca
+mandan el CONNECT, y después --clients SRSocket se conectan todos a la
+vez. Con --mode inline el servidor acepta como lo hacía start_server
+(accept() hace el handshake, con polling y un thread por conexión), así
+cada cliente lento frena los accept() hasta su timeout. Con pool el loop
+solo saca las conexiones de la cola (accept_stream(), sin timeout) y el
+handshake lo hace un WorkerPool. Se miden la latencia de connect() y las
+métricas del pool.
+
+Uso (desde src/): python3 -m tests.bench_connect_burst --slow 2 --clients 50
+"""
+
+import argparse
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from lib.ftp.worker_pool import WorkerPool
+from lib.mux_demux.cookie import COOKIE_SIZE
+from lib.mux_demux.header import (
+    ECHO,
+    HELLO,
+    encode_header,
+    extract_packet,
+    new_connection_id,
+)
+from lib.rdt_listener.rdt_listener import RDTListener, SELECTIVE_REPEAT
+from lib.selective_repeat.sr_socket import SRSocket
+
+ADDR = ("127.0.0.1", 58300)
+
+
+# Un cliente que llega a la cola de accept() (devuelve la cookie) pero no
+# manda nada más
+def slow_client():
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    connection_id = new_connection_id()
+    sender.sendto(
+        encode_header(connection_id, HELLO) + bytes(COOKIE_SIZE), ADDR
+    )
+    _, _, cookie = extract_packet(sender.recvfrom(100)[0])
+    sender.sendto(encode_header(connection_id, ECHO) + cookie, ADDR)
+    return sender
+
+
+# El loop de start_server antes del pool
+def serve_inline(listener, stop_event, stats):
+    listener.settimeout(1)
+    handlers = []
+    while not stop_event.is_set():
+        try:
+            server_socket = listener.accept()
+        except Exception as e:
+            logger.warning(f"Handshake failed: {e}")
+            stats["handshake_errors"] += 1
+            continue
+        if server_socket is None:
+            time.sleep(0.1)
+            continue
+        handler = threading.Thread(target=server_socket.close)
+        handler.start()
+        handlers.append(handler)
+    for handler in handlers:
+        handler.join()
+
+
+def serve_pool(listener, stop_event, stats, pool_size, pool_queue):
+    pool = WorkerPool(pool_size, pool_queue)
+
+    def serve(stream):
+        try:
+            listener.handshake(stream).close()
+        except Exception as e:
+            logger.warning(f"Handshake failed: {e}")
+            stats["handshake_errors"] += 1
+
+    while not stop_event.is_set():
+        stream = listener.accept_stream()
+        if stream is not None and not pool.submit(serve, stream):
+            stream.close()
+    pool.shutdown()
+    stats.update(pool.stats())
+
+
+def connect():
+    start = time.monotonic()
+    client = SRSocket()
+    try:
+        client.connect(ADDR)
+    except Exception as e:
+        logger.warning(f"Connect failed: {e}")
+        return None, time.monotonic() - start
+    return client, time.monotonic() - start
+
+
+def run(mode, slow, clients, pool_size, pool_queue):
+    listener = RDTListener(SELECTIVE_REPEAT)
+    listener.bind(ADDR)
+    listener.listen(slow + clients)
+    stop_event = threading.Event()
+    stats = {"handshake_errors": 0}
+    if mode == "inline":
+        server = threading.Thread(
+            target=serve_inline, args=(listener, stop_event, stats)
+        )
+    else:
+        server = threading.Thread(
+            target=serve_pool,
+            args=(listener, stop_event, stats, pool_size, pool_queue),
+        )
+    server.start()
+
+    slow_sockets = [slow_client() for _ in range(slow)]
+    # Que los lentos lleguen primero a la cola
+    time.sleep(0.1)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        connected = list(executor.map(lambda _: connect(), range(clients)))
+    elapsed = time.monotonic() - start
+    for client, _ in connected:
+        if client is not None:
+            client.close()
+
+    stop_event.set()
+    listener.interrupt_accept()
+    server.join()
+    listener.close(linger=0)
+    for slow_socket in slow_sockets:
+        slow_socket.close()
+
+    latencies = sorted(latency for _, latency in connected)
+    return {
+        "mode": mode,
+        "connected": sum(client is not None for client, _ in connected),
+        "burst_s": elapsed,
+        "connect_p50_ms": statistics.median(latencies) * 1000,
+        "connect_p99_ms": latencies[len(latencies) * 99 // 100] * 1000,
+        "connect_max_ms": latencies[-1] * 1000,
+        **stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--mode", choices=("inline", "pool"), nargs="+", default=["pool"]
+    )
+    parser.add_argument("--slow", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--pool", type=int, default=32)
+    parser.add_argument("--pool-queue", type=int, default=64)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    for mode in args.mode:
+        results = run(
+            mode, args.slow, args.clients, args.pool, args.pool_queue
+        )
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            print(f"{key}: {value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
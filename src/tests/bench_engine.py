@@ -0,0 +1,160 @@
+"""
+Benchmark de muchas subidas concurrentes al servidor con threads
+(RDTListener + un thread por conexión) y con el Engine (un event loop).
+
+Los clientes son SRConnection de otro Engine (un solo thread para todos),
+para que los threads del proceso sean los del servidor. Se mide el pico
+de threads vivos, el tiempo total y el throughput agregado.
+
+Uso (desde src/): python3 -m tests.bench_engine --clients 200 --size 64
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from lib.engine.endpoint import Engine
+from lib.engine.event_loop import EventLoop
+from lib.engine.sr_connection import SRProtocol
+from lib.rdt_listener.rdt_listener import RDTListener, SELECTIVE_REPEAT
+from tests.bench_sr_transfer import ThreadSampler
+
+ADDR = ("127.0.0.1", 57700)
+KB = 1024
+
+
+# Cliente: manda los datos, cierra y avisa cuando terminó la conexión
+class Upload(SRProtocol):
+    def __init__(self, data, done):
+        self.data = data
+        self.done = done
+        self.exc = None
+
+    def connection_made(self, connection):
+        connection.write(self.data)
+        connection.close()
+
+    def connection_lost(self, exc):
+        self.exc = exc
+        self.done(self)
+
+
+# Servidor del Engine: cuenta lo recibido
+class Sink(SRProtocol):
+    received = 0
+
+    def data_received(self, data):
+        Sink.received += len(data)
+
+
+def threads_server(clients, size, stop_event):
+    listener = RDTListener(SELECTIVE_REPEAT)
+    listener.bind(ADDR)
+    listener.listen(clients)
+    listener.settimeout(0.1)
+    handlers = []
+
+    def handle(socket):
+        socket.recv_exact(size)
+        socket.close()
+
+    while len(handlers) < clients and not stop_event.is_set():
+        socket = listener.accept()
+        if socket is None:
+            continue
+        handler = threading.Thread(target=handle, args=(socket,))
+        handler.start()
+        handlers.append(handler)
+    for handler in handlers:
+        handler.join()
+    listener.close()
+
+
+def run_clients(clients, size):
+    loop = EventLoop()
+    engine = Engine(loop)
+    finished = []
+    all_done = threading.Event()
+
+    def done(protocol):
+        finished.append(protocol)
+        if len(finished) == clients:
+            all_done.set()
+
+    def connect_all():
+        for _ in range(clients):
+            engine.connect(ADDR, Upload(bytes(size), done))
+
+    thread = loop.start(name="ClientLoop")
+    loop.call_soon_threadsafe(connect_all)
+    all_done.wait()
+    loop.stop()
+    thread.join()
+    loop.close()
+    return sum(protocol.exc is not None for protocol in finished)
+
+
+def run(server, clients, size):
+    stop_event = threading.Event()
+    if server == "threads":
+        server_thread = threading.Thread(
+            target=threads_server, args=(clients, size, stop_event)
+        )
+        server_thread.start()
+    else:
+        loop = EventLoop()
+        engine = Engine(loop)
+        engine.listen(ADDR, Sink)
+        server_thread = loop.start(name="ServerLoop")
+    time.sleep(0.2)
+
+    with ThreadSampler() as sampler:
+        start = time.monotonic()
+        errors = run_clients(clients, size)
+        elapsed = time.monotonic() - start
+
+    if server == "threads":
+        stop_event.set()
+        server_thread.join()
+    else:
+        loop.call_soon_threadsafe(engine.close)
+        loop.stop()
+        server_thread.join()
+        loop.close()
+    return {
+        "server": server,
+        "peak_threads": sampler.peak,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_MBps": clients * size / elapsed / KB / KB,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--server", choices=("threads", "events", "both"), default="both"
+    )
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--size", type=int, default=64, help="KB")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    servers = ("threads", "events") if args.server == "both" else [args.server]
+    for server in servers:
+        results = run(server, args.clients, args.size * KB)
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            print(f"{key}: {value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark de latencia de intercambios chicos pedido/respuesta sobre
+loopback.
+
+El cliente se conecta, manda --exchanges mensajes de --message bytes y
+espera cada vez que el servidor le devuelva el mismo mensaje. Mide el
+tiempo de conexión, la latencia de cada intercambio (mediana, p99 y
+máximo) y lo que tarda el close() del cliente.
+
+Uso (desde src/): python3 -m tests.bench_latency --method selective_repeat
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from lib.rdt_listener.rdt_listener import (
+    RDTListener,
+    SELECTIVE_REPEAT,
+    STOP_AND_WAIT,
+)
+from lib.selective_repeat.sr_socket import SRSocket
+from lib.stop_and_wait.saw_socket import SAWSocket
+
+ADDR = ("127.0.0.1", 57400)
+SOCKETS = {SELECTIVE_REPEAT: SRSocket, STOP_AND_WAIT: SAWSocket}
+
+
+def echo(socket, message_size, exchanges):
+    for _ in range(exchanges):
+        socket.send(socket.recv_exact(message_size))
+    socket.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(method, message_size, exchanges):
+    listener = RDTListener(method)
+    listener.bind(ADDR)
+    listener.listen(1)
+
+    server = None
+
+    def serve():
+        nonlocal server
+        server = listener.accept()
+        echo(server, message_size, exchanges)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+
+    message = bytes(range(256)) * (message_size // 256 + 1)
+    message = message[:message_size]
+    client = SOCKETS[method]()
+
+    start = time.perf_counter()
+    client.connect(ADDR)
+    connect = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(exchanges):
+        start = time.perf_counter()
+        client.send(message)
+        if client.recv_exact(message_size) != message:
+            raise Exception("Received a different message")
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    client.close()
+    close = time.perf_counter() - start
+
+    thread.join()
+    listener.close()
+    return {
+        "connect_ms": connect * 1000,
+        "exchange_median_ms": statistics.median(latencies) * 1000,
+        "exchange_p99_ms": percentile(latencies, 0.99) * 1000,
+        "exchange_max_ms": max(latencies) * 1000,
+        "close_ms": close * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--method", default=SELECTIVE_REPEAT, choices=list(SOCKETS)
+    )
+    parser.add_argument("--message", type=int, default=64, help="bytes")
+    parser.add_argument("--exchanges", type=int, default=200)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = run(args.method, args.message, args.exchanges)
+    for key, value in results.items():
+        print(f"{key}: {value:.3f}")
+
+
+if __name__ == "__main__":
+    main()
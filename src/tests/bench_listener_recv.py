@@ -0,0 +1,114 @@
+"""
+Benchmark del thread que recibe los datagramas en MuxDemuxListener.
+
+Varios clientes UDP hacen el handshake con cookie y mandan --datagrams
+datagramas de --payload bytes cada uno (como si fueran muchas subidas a la
+vez) y se mide el tiempo de CPU
+del recv_thread del listener por datagrama entregado a los bytestreams,
+y cuántos datagramas por segundo llegan a entregarse.
+
+Uso (desde src/): python3 -m tests.bench_listener_recv --clients 8
+"""
+
+import argparse
+import socket
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from lib.mux_demux.mux_demux_listener import MuxDemuxListener
+from lib.mux_demux.cookie import COOKIE_SIZE
+from lib.mux_demux.header import (
+    ECHO,
+    HELLO,
+    encode_header,
+    extract_packet,
+    new_connection_id,
+)
+from tests.bench_sr_transfer import ThreadSampler
+
+ADDR = ("127.0.0.1", 57500)
+
+
+def client(datagrams, payload):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    connection_id = new_connection_id()
+    sender.sendto(
+        encode_header(connection_id, HELLO) + bytes(COOKIE_SIZE), ADDR
+    )
+    _, _, cookie = extract_packet(sender.recvfrom(100)[0])
+    sender.sendto(encode_header(connection_id, ECHO) + cookie, ADDR)
+    datagram = encode_header(connection_id) + bytes(payload)
+    for _ in range(datagrams):
+        sender.sendto(datagram, ADDR)
+        # Deja que el receptor lea, para no medir solo descartes del kernel
+        time.sleep(0)
+    return sender
+
+
+def delivered(listener):
+    return sum(
+        len(stream.chunks) for stream in list(listener.bytestreams.values())
+    )
+
+
+def run(clients, datagrams, payload):
+    listener = MuxDemuxListener()
+    listener.bind(ADDR)
+    listener.listen(clients)
+
+    with ThreadSampler() as sampler:
+        sampler.watch("recv_thread", listener.recv_thread_handle)
+        start = time.monotonic()
+        senders = []
+        threads = [
+            threading.Thread(
+                target=lambda: senders.append(client(datagrams, payload))
+            )
+            for _ in range(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Lo que quedó en el buffer del kernel
+        time.sleep(0.5)
+        elapsed = time.monotonic() - start - 0.5
+        count = delivered(listener)
+        time.sleep(0.1)
+    cpu = sampler.cpu("recv_thread")
+
+    for sender in senders:
+        sender.close()
+    listener.bytestreams.clear()
+    listener.close()
+    return {
+        "sent": clients * datagrams,
+        "delivered": count,
+        "delivered_per_s": count / elapsed,
+        "recv_cpu_us_per_datagram": cpu / count * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--datagrams", type=int, default=20000)
+    parser.add_argument("--payload", type=int, default=1024, help="bytes")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = run(args.clients, args.datagrams, args.payload)
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
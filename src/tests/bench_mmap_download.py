@@ -0,0 +1,130 @@
+"""
+Benchmark de las descargas de start_server.py leyendo el archivo de a
+MIN_SIZE bytes o desde un mmap.
+
+--downloads clientes descargan a la vez el mismo archivo de --size MB con
+download_from_server(), una vez por cada --mode (read fuerza la lectura
+con file.read, mmap el mapeo). Con --loss el listener pierde datagramas y
+hay retransmisiones. Se mide el throughput agregado y el tiempo de CPU
+por MB de los threads del servidor que llaman a send().
+
+Uso (desde src/): python3 -m tests.bench_mmap_download --size 200 --downloads 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from loguru import logger
+
+import start_server
+from lib.rdt_listener.rdt_listener import RDTListener, SELECTIVE_REPEAT
+from lib.selective_repeat.sr_socket import SRSocket
+
+ADDR = ("127.0.0.1", 58400)
+MB = 1024 * 1024
+FILENAME = "file.bin"
+# Como download.py: tipo de pedido y largo del nombre
+DOWNLOAD = b"\x01"
+# Tipo y largo de la respuesta del servidor
+RESPONSE_HEADER = 9
+
+
+def serve(listener, path, downloads, cpu):
+    def handle(socket):
+        start = time.thread_time()
+        start_server.check_type(socket, path)
+        cpu.append(time.thread_time() - start)
+
+    handlers = []
+    while len(handlers) < downloads:
+        socket = listener.accept()
+        if socket is None:
+            continue
+        handler = threading.Thread(target=handle, args=(socket,))
+        handler.start()
+        handlers.append(handler)
+    for handler in handlers:
+        handler.join()
+
+
+def download(size):
+    client = SRSocket()
+    client.connect(ADDR)
+    name = FILENAME.encode()
+    client.send(DOWNLOAD + len(name).to_bytes(2, "little") + name)
+    client.recv_exact(RESPONSE_HEADER, timeout=60)
+    received = 0
+    while received < size:
+        received += len(client.recv(MB))
+    client.close()
+
+
+def run(mode, path, size_mb, downloads, loss):
+    listener = RDTListener(SELECTIVE_REPEAT, loss)
+    listener.bind(ADDR)
+    listener.listen(downloads)
+    listener.settimeout(1)
+    cpu = []
+    server = threading.Thread(
+        target=serve, args=(listener, path, downloads, cpu)
+    )
+    server.start()
+
+    clients = [
+        threading.Thread(target=download, args=(size_mb * MB,))
+        for _ in range(downloads)
+    ]
+    start = time.monotonic()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - start
+    server.join()
+    listener.close()
+    total_mb = size_mb * downloads
+    return {
+        "mode": mode,
+        "downloads": downloads,
+        "throughput_mb_s": total_mb / elapsed,
+        "server_cpu_ms_per_mb": sum(cpu) * 1000 / total_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--mode", choices=("read", "mmap"), nargs="+", default=["read", "mmap"]
+    )
+    parser.add_argument("--size", type=int, default=200, help="MB")
+    parser.add_argument("--downloads", type=int, default=4)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    mmap_min_size = start_server.MMAP_MIN_SIZE
+    with tempfile.TemporaryDirectory() as path:
+        with open(os.path.join(path, FILENAME), "wb") as file:
+            file.write(os.urandom(args.size * MB))
+        for mode in args.mode:
+            # read: ningún archivo llega al mínimo para el mmap
+            start_server.MMAP_MIN_SIZE = (
+                float("inf") if mode == "read" else mmap_min_size
+            )
+            results = run(mode, path, args.size, args.downloads, args.loss)
+            for key, value in results.items():
+                if isinstance(value, float):
+                    value = f"{value:.2f}"
+                print(f"{key}: {value}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
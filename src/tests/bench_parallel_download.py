@@ -0,0 +1,107 @@
+"""
+Benchmark de download.py con --parallel.
+
+Levanta start_server.py como otro proceso (con --workers procesos) y baja
+un archivo de --size MB con cada cantidad de conexiones de --parallel.
+Con más de una, el archivo se parte en rangos que bajan procesos
+distintos del cliente, y del lado del servidor el kernel reparte las
+conexiones entre los workers. Mide el tiempo y el throughput de cada
+descarga y verifica que el archivo bajado sea igual al original. Solo
+escala si hay núcleos libres para los procesos de ambos lados.
+
+Uso (desde src/): python3 -m tests.bench_parallel_download --parallel 1 4
+"""
+
+import argparse
+import filecmp
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+from download import BYTES_READ, ENDIANESS, download
+
+ADDR = ("127.0.0.1", 58500)
+MB = 1024 * 1024
+FILENAME = "file.bin"
+
+
+def run(storage, destination, parallel, size):
+    start = time.monotonic()
+    download(
+        ADDR[0],
+        ADDR[1],
+        destination,
+        FILENAME,
+        ENDIANESS,
+        BYTES_READ,
+        parallel=parallel,
+    )
+    elapsed = time.monotonic() - start
+    downloaded = os.path.join(destination, FILENAME)
+    equal = os.path.exists(downloaded) and filecmp.cmp(
+        downloaded, os.path.join(storage, FILENAME), shallow=False
+    )
+    if os.path.exists(downloaded):
+        os.remove(downloaded)
+    return {
+        "parallel": parallel,
+        "equal": equal,
+        "elapsed_s": elapsed,
+        "throughput_MBps": size / elapsed / MB,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--size", type=int, default=200, help="MB")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    print(f"cpus: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as storage:
+        with open(os.path.join(storage, FILENAME), "wb") as file:
+            file.write(os.urandom(args.size * MB))
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "start_server.py",
+                "-H",
+                ADDR[0],
+                "-p",
+                str(ADDR[1]),
+                "-s",
+                storage,
+                "-q",
+                "--workers",
+                str(args.workers),
+            ]
+        )
+        time.sleep(1)
+        try:
+            with tempfile.TemporaryDirectory() as destination:
+                for parallel in args.parallel:
+                    results = run(
+                        storage, destination, parallel, args.size * MB
+                    )
+                    for key, value in results.items():
+                        if isinstance(value, float):
+                            value = f"{value:.2f}"
+                        print(f"{key}: {value}")
+                    print()
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
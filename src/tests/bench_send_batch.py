@@ -0,0 +1,185 @@
+"""
+Benchmark del envío en lote (sendmmsg) de los INFO de una transferencia.
+
+Transfiere --size MB por loopback, del cliente al listener (--direction
+up, envía el SRSocket del cliente) o del listener al cliente (down, envía
+el send_thread del listener), una vez por cada --batch: la cantidad máxima
+de datagramas por llamada al sistema (1 es el envío de a uno con
+sendmsg()). Cuenta las llamadas al sistema de envío y los datagramas del
+socket que envía los datos, y mide el tiempo de CPU de los threads que
+envían (en loopback incluye la entrega al socket que recibe, que el kernel
+hace en la misma llamada).
+
+Uso (desde src/): python3 -m tests.bench_send_batch --size 200 --batch 1 32
+"""
+
+import argparse
+import collections
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from lib.mux_demux import batch_sender
+from lib.mux_demux.buggy_udp import BuggyUDPSocket
+from lib.rdt_listener.rdt_listener import RDTListener, SELECTIVE_REPEAT
+from lib.selective_repeat.sr_socket import SRSocket
+
+ADDR = ("127.0.0.1", 58200)
+MB = 1024 * 1024
+
+
+# Cuenta, por file descriptor, las llamadas a sendmsg() y sendmmsg() y
+# los datagramas que envían
+class SyscallCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.datagrams = collections.Counter()
+
+    def install(self):
+        sendmsg = BuggyUDPSocket.sendmsg
+        sendmmsg = batch_sender._sendmmsg
+
+        def counted_sendmsg(udp_socket, buffers, addr):
+            self.count(udp_socket.fileno(), 1)
+            return sendmsg(udp_socket, buffers, addr)
+
+        def counted_sendmmsg(fd, headers, count, flags):
+            sent = sendmmsg(fd, headers, count, flags)
+            self.count(fd, max(sent, 0))
+            return sent
+
+        BuggyUDPSocket.sendmsg = counted_sendmsg
+        if sendmmsg is not None:
+            batch_sender._sendmmsg = counted_sendmmsg
+
+    def count(self, fd, datagrams):
+        with self.lock:
+            self.calls[fd] += 1
+            self.datagrams[fd] += datagrams
+
+
+# El listener tiene que aceptar mientras el cliente se conecta
+def connect(listener, client, **socket_args):
+    accepted = []
+    accepter = threading.Thread(
+        target=lambda: accepted.append(listener.accept(**socket_args))
+    )
+    accepter.start()
+    client.connect(ADDR)
+    accepter.join()
+    return accepted[0]
+
+
+# Tiempo de CPU del thread que envía, medido por él mismo al terminar
+def timed_send(socket, data, stats):
+    start = time.thread_time()
+    socket.send(data)
+    stats["cpu"] = time.thread_time() - start
+
+
+def thread_cpu(thread):
+    return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+
+
+def upload(size, batch):
+    listener = RDTListener(SELECTIVE_REPEAT)
+    listener.bind(ADDR)
+    listener.listen(1)
+    client = SRSocket(send_batch=batch)
+    server = connect(listener, client)
+    fd = client.socket.send_socket.fileno()
+
+    stats = {}
+    sender = threading.Thread(
+        target=timed_send, args=(client, bytes(size), stats)
+    )
+    start = time.monotonic()
+    sender.start()
+    server.recv_exact(size, timeout=60)
+    elapsed = time.monotonic() - start
+    sender.join()
+    client.close()
+    server.close()
+    listener.close()
+    return fd, elapsed, stats["cpu"]
+
+
+# Del lado del listener los datagramas los envía el send_thread, así que
+# se suma su CPU a la del thread que llama a send()
+def download(size, batch):
+    listener = RDTListener(SELECTIVE_REPEAT)
+    listener.bind(ADDR)
+    listener.listen(1)
+    mux_demux_listener = listener.mux_demux_listener
+    mux_demux_listener.send_batch = batch
+    client = SRSocket()
+    server = connect(listener, client, send_batch=batch)
+    fd = mux_demux_listener.accept_socket.fileno()
+    send_thread = mux_demux_listener.send_thread_handle
+
+    stats = {}
+    sender = threading.Thread(
+        target=timed_send, args=(server, bytes(size), stats)
+    )
+    send_thread_cpu = thread_cpu(send_thread)
+    start = time.monotonic()
+    sender.start()
+    client.recv_exact(size, timeout=60)
+    elapsed = time.monotonic() - start
+    sender.join()
+    cpu = stats["cpu"] + thread_cpu(send_thread) - send_thread_cpu
+    client.close()
+    server.close()
+    listener.close()
+    return fd, elapsed, cpu
+
+
+def run(direction, size_mb, batch, counter):
+    counter.calls.clear()
+    counter.datagrams.clear()
+    transfer = upload if direction == "up" else download
+    fd, elapsed, cpu = transfer(size_mb * MB, batch)
+    return {
+        "direction": direction,
+        "batch": batch,
+        "sendmmsg": batch_sender.has_sendmmsg(),
+        "throughput_mb_s": size_mb / elapsed,
+        "syscalls_per_mb": counter.calls[fd] / size_mb,
+        "datagrams_per_syscall": counter.datagrams[fd] / counter.calls[fd],
+        "sender_cpu_ms_per_mb": cpu * 1000 / size_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200, help="MB")
+    parser.add_argument(
+        "--direction",
+        choices=("up", "down"),
+        nargs="+",
+        default=["up", "down"],
+    )
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    counter = SyscallCounter()
+    counter.install()
+    for direction in args.direction:
+        for batch in args.batch:
+            results = run(direction, args.size, batch, counter)
+            for key, value in results.items():
+                if isinstance(value, float):
+                    value = f"{value:.2f}"
+                print(f"{key}: {value}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
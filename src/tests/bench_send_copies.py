@@ -0,0 +1,149 @@
+"""
+Microbenchmark del camino de envío de INFO: fragmentar un buffer, codificar
+cada paquete y mandarlo por un MuxDemuxStream (UDP sobre loopback).
+
+Compara la forma anterior (slices de bytes, concatenar header y body y
+anteponer la palabra mágica) con la actual (memoryview, header con
+struct y sendmsg). Los bytes copiados se estiman con tracemalloc: para
+cada paso se suma lo que crece el pico de memoria reservada.
+
+Uso (desde src/): python3 -m tests.bench_send_copies --size 64
+"""
+
+import argparse
+import socket
+import sys
+import time
+import tracemalloc
+
+from loguru import logger
+
+from lib.mux_demux.buggy_udp import BuggyUDPSocket
+from lib.mux_demux.mux_demux_stream import MuxDemuxStream
+from lib.selective_repeat.constants import MAX_SIZE
+from lib.selective_repeat.packet import Info
+from lib.stop_and_wait.packet import InfoPacket
+from lib.utils import MTByteStream
+
+MB = 1024 * 1024
+# Palabra mágica que se mandaba antes del header con connection ID
+LEGACY_MAGIC_WORD = "ROSTOV"
+
+
+# Como se enviaba antes: lista con una copia de cada fragmento, encode()
+# concatenando y la palabra mágica agregada con otra copia
+def legacy_fragments(buffer, mtu):
+    return iter(
+        [
+            (i, buffer[offset : offset + mtu])
+            for i, offset in enumerate(range(0, len(buffer), mtu))
+        ]
+    )
+
+
+def legacy_send(stream, fragment):
+    number, body = fragment
+    data = b"2"
+    data += len(body).to_bytes(2, byteorder="big")
+    data += number.to_bytes(4, byteorder="big")
+    data += body
+    stream.send_socket.sendto(
+        str.encode(LEGACY_MAGIC_WORD) + data, stream.send_addr
+    )
+
+
+def sr_fragments(buffer, mtu):
+    return Info.from_buffer(buffer, mtu)
+
+
+def sr_send(stream, packet):
+    stream.send_buffers(packet.encode_parts())
+
+
+def saw_fragments(buffer, mtu):
+    return InfoPacket.split(mtu, buffer)
+
+
+def saw_send(stream, packet):
+    stream.send_buffers(packet.parts())
+
+
+PATHS = {
+    "legacy": (legacy_fragments, legacy_send),
+    "sr": (sr_fragments, sr_send),
+    "saw": (saw_fragments, saw_send),
+}
+
+
+def new_stream():
+    # Nadie lee del receptor: el kernel descarta lo que no entra
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    stream = MuxDemuxStream()
+    stream.from_listener(
+        MTByteStream(), BuggyUDPSocket(), receiver.getsockname()
+    )
+    return stream, receiver
+
+
+# Suma del crecimiento del pico de memoria en cada paso (fragmentar y
+# enviar cada paquete)
+def copied_bytes(path, buffer, mtu):
+    fragments, send = PATHS[path]
+    stream, receiver = new_stream()
+    total = 0
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        packets = fragments(buffer, mtu)
+        while True:
+            tracemalloc.reset_peak()
+            try:
+                packet = next(packets)
+                send(stream, packet)
+            except StopIteration:
+                break
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                total += peak - before
+                before = current
+    finally:
+        tracemalloc.stop()
+        receiver.close()
+    return total
+
+
+def elapsed(path, buffer, mtu):
+    fragments, send = PATHS[path]
+    stream, receiver = new_stream()
+    start = time.perf_counter()
+    for packet in fragments(buffer, mtu):
+        send(stream, packet)
+    result = time.perf_counter() - start
+    receiver.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=64, help="MB a enviar")
+    parser.add_argument("--max-size", type=int, default=MAX_SIZE)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    buffer = bytes(args.size * MB)
+    for path in PATHS:
+        copied = copied_bytes(path, buffer, args.max_size) / args.size
+        seconds = elapsed(path, buffer, args.max_size)
+        print(
+            f"{path}: copied_bytes_per_mb: {copied:.0f}"
+            f" ({copied / MB:.2f} MB/MB) send_mb_s: {args.size / seconds:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
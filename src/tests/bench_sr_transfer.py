@@ -0,0 +1,182 @@
+"""
+Benchmark de una transferencia con selective repeat sobre loopback.
+
+Mide el pico de threads vivos en el proceso, el tiempo de CPU por MB y el
+throughput de una transferencia cliente -> servidor.
+
+Uso (desde src/): python3 -m tests.bench_sr_transfer --size 20 --loss 0.01
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from lib.rdt_listener.rdt_listener import RDTListener, SELECTIVE_REPEAT
+from lib.selective_repeat.congestion import CONGESTION_CONTROLS
+from lib.selective_repeat.constants import (
+    ACK_DELAY,
+    ACK_EVERY,
+    CONGESTION_CONTROL,
+    MAX_SIZE,
+    RECV_BUFFER_SIZE,
+)
+from lib.selective_repeat.sr_socket import SRSocket
+
+ADDR = ("127.0.0.1", 57300)
+MB = 1024 * 1024
+
+
+# Registra el pico de threads vivos y el tiempo de CPU de los threads
+# que se le indiquen con watch() (hasta que terminan)
+class ThreadSampler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.watched = {}
+
+    def watch(self, name, thread):
+        self.watched[name] = [thread, 0]
+
+    def cpu(self, name):
+        return self.watched[name][1]
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+            for watched in self.watched.values():
+                try:
+                    clock = time.pthread_getcpuclockid(watched[0].ident)
+                    watched[1] = time.clock_gettime(clock)
+                except ProcessLookupError:
+                    continue
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def client(data, loss, socket_args, stats):
+    socket = SRSocket(**socket_args)
+    socket.connect(ADDR, buggyness_factor=loss)
+    socket.send(data)
+    socket.close()
+    stats["client_srtt_s"] = socket.srtt()
+    stats["client_rto_s"] = socket.rto()
+    stats["client_fast_retransmits"] = socket.fast_retransmits
+    stats["client_timeout_retransmits"] = socket.timeout_retransmits
+
+
+# Lee de a 1 MB esperando read_delay segundos entre lecturas (para
+# simular una aplicación lenta) y registra el pico de bytes guardados
+def receive(socket, size, read_delay, stats):
+    received = 0
+    peak = 0
+    while received < size:
+        peak = max(peak, socket.acker.buffered())
+        received += len(socket.recv_exact(min(MB, size - received)))
+        time.sleep(read_delay)
+    stats["receiver_peak_buffered_mb"] = peak / MB
+    stats["receiver_dropped"] = socket.acker.infos_dropped
+    return received
+
+
+def run(size_mb, loss, read_delay=0, **socket_args):
+    data = bytes(size_mb * MB)
+    listener = RDTListener(SELECTIVE_REPEAT, loss)
+    listener.bind(ADDR)
+    listener.listen(1)
+    listener_args = {"recv_buffer_size": socket_args.pop("recv_buffer_size")}
+
+    with ThreadSampler() as sampler:
+        start = time.monotonic()
+        cpu_start = time.process_time()
+
+        stats = {}
+        thread = threading.Thread(
+            target=client,
+            args=(data, loss, socket_args, stats),
+        )
+        thread.start()
+        socket = listener.accept(**listener_args)
+        sampler.watch("receiver", socket.packet_thread_handler)
+        received = receive(socket, len(data), read_delay, stats)
+        # Hasta acá sin contar el cierre de la conexión
+        transfer = time.monotonic() - start
+        stats["receiver_infos"] = socket.acker.infos_received
+        stats["receiver_acks"] = socket.acker.acks_sent
+        thread.join()
+        socket.close()
+
+        elapsed = time.monotonic() - start
+        cpu = time.process_time() - cpu_start
+    stats["receiver_cpu_s"] = sampler.cpu("receiver")
+
+    listener.close()
+    return {
+        "received_mb": received / MB,
+        "elapsed_s": elapsed,
+        "throughput_mb_s": size_mb / elapsed,
+        "transfer_s": transfer,
+        "transfer_mb_s": size_mb / transfer,
+        "cpu_s_per_mb": cpu / size_mb,
+        "peak_threads": sampler.peak,
+        **stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20, help="MB a enviar")
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument(
+        "--cc", default=CONGESTION_CONTROL, choices=CONGESTION_CONTROLS
+    )
+    parser.add_argument("--max-size", type=int, default=MAX_SIZE)
+    parser.add_argument("--ack-every", type=int, default=ACK_EVERY)
+    parser.add_argument("--ack-delay", type=float, default=ACK_DELAY)
+    parser.add_argument(
+        "--no-fast-retransmit", dest="fast_retransmit", action="store_false"
+    )
+    parser.add_argument(
+        "--recv-buffer", type=int, default=RECV_BUFFER_SIZE, help="bytes"
+    )
+    parser.add_argument(
+        "--read-delay",
+        type=float,
+        default=0,
+        help="segundos entre lecturas de 1 MB del receptor",
+    )
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = run(
+        args.size,
+        args.loss,
+        congestion_control=args.cc,
+        ack_every=args.ack_every,
+        ack_delay=args.ack_delay,
+        max_size=args.max_size,
+        fast_retransmit=args.fast_retransmit,
+        recv_buffer_size=args.recv_buffer,
+        read_delay=args.read_delay,
+    )
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:.4f}"
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
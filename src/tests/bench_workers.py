@@ -0,0 +1,162 @@
+"""
+Benchmark de start_server.py con --workers (SO_REUSEPORT).
+
+Levanta el servidor como otro proceso con cada cantidad de workers de
+--workers y hace --clients subidas concurrentes de --size KB (clientes del
+Engine, repartidos en --client-procs procesos para que el cliente no sea
+el cuello de botella). Mide el tiempo total y el throughput agregado para
+ver cómo escala con los procesos.
+
+Uso (desde src/): python3 -m tests.bench_workers --workers 1 2 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from loguru import logger
+
+from lib.engine.endpoint import Engine
+from lib.engine.event_loop import EventLoop
+from lib.engine.sr_connection import SRProtocol
+
+ADDR = ("127.0.0.1", 57900)
+KB = 1024
+ENDIANESS = "little"
+
+
+# Sube un archivo con el mismo header que upload.py y espera la
+# confirmación del servidor
+class Upload(SRProtocol):
+    def __init__(self, name, data, done):
+        self.name = name.encode()
+        self.data = data
+        self.done = done
+        self.confirmed = False
+
+    def connection_made(self, connection):
+        self.connection = connection
+        header = (
+            (0).to_bytes(1, byteorder=ENDIANESS)
+            + len(self.data).to_bytes(8, byteorder=ENDIANESS)
+            + len(self.name).to_bytes(2, byteorder=ENDIANESS)
+            + self.name
+        )
+        connection.write(header + self.data)
+
+    def data_received(self, data):
+        self.confirmed = True
+        self.connection.close()
+
+    def connection_lost(self, exc):
+        self.done(self)
+
+
+def upload_all(first, clients, size):
+    loop = EventLoop()
+    engine = Engine(loop)
+    finished = []
+    all_done = threading.Event()
+    data = os.urandom(size)
+
+    def done(protocol):
+        finished.append(protocol)
+        if len(finished) == clients:
+            all_done.set()
+
+    def connect_all():
+        for i in range(clients):
+            engine.connect(ADDR, Upload(f"file{first + i}", data, done))
+
+    thread = loop.start(name="ClientLoop")
+    loop.call_soon_threadsafe(connect_all)
+    all_done.wait()
+    loop.stop()
+    thread.join()
+    loop.close()
+    return sum(not protocol.confirmed for protocol in finished)
+
+
+def run(workers, engine, clients, size, client_procs):
+    with tempfile.TemporaryDirectory() as storage:
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "start_server.py",
+                "-H",
+                ADDR[0],
+                "-p",
+                str(ADDR[1]),
+                "-s",
+                storage,
+                "-q",
+                "--engine",
+                engine,
+                "--workers",
+                str(workers),
+            ]
+        )
+        time.sleep(1)
+        per_proc = clients // client_procs
+        with multiprocessing.Pool(client_procs) as pool:
+            start = time.monotonic()
+            errors = sum(
+                pool.starmap(
+                    upload_all,
+                    [
+                        (i * per_proc, per_proc, size)
+                        for i in range(client_procs)
+                    ],
+                )
+            )
+            elapsed = time.monotonic() - start
+        clients = per_proc * client_procs
+        server.send_signal(signal.SIGINT)
+        server.wait()
+    return {
+        "workers": workers,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_MBps": clients * size / elapsed / KB / KB,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--engine", choices=("threads", "events"), default="events"
+    )
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--size", type=int, default=1024, help="KB")
+    parser.add_argument("--client-procs", type=int, default=1)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    print(f"cpus: {os.cpu_count()}")
+    for workers in args.workers:
+        results = run(
+            workers,
+            args.engine,
+            args.clients,
+            args.size * KB,
+            args.client_procs,
+        )
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            print(f"{key}: {value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from threading import Thread
+
+from lib.rdt_listener.async_rdt_listener import AsyncRDTListener
+from lib.rdt_listener.rdt_listener import RDTListener
+from lib.selective_repeat.async_sr_socket import AsyncSRSocket
+from lib.selective_repeat.sr_socket import SRSocket
+
+PORT = 57650
+
+
+async def echo_once(listener, size):
+    socket = await listener.accept()
+    data = await socket.recv_exact(size, timeout=10)
+    await socket.send(data)
+    await socket.close()
+
+
+async def async_client(port, data):
+    client = AsyncSRSocket()
+    await client.connect(("127.0.0.1", port))
+    await client.send(data)
+    output = await client.recv_exact(len(data), timeout=10)
+    await client.close()
+    return output
+
+
+def test_async_socket_should_echo_with_async_listener():
+    data = b"pls_work" * 20000
+
+    async def main():
+        listener = AsyncRDTListener()
+        await listener.bind(("127.0.0.1", PORT))
+        listener.listen(10)
+        server = asyncio.create_task(echo_once(listener, len(data)))
+        output = await async_client(PORT, data)
+        await server
+        await listener.close()
+        return output
+
+    assert asyncio.run(main()) == data
+
+
+def test_async_socket_should_talk_to_threaded_listener():
+    data = bytes(range(256)) * 1000
+    listener = RDTListener("selective_repeat")
+    listener.bind(("127.0.0.1", PORT + 1))
+    listener.listen(1)
+
+    def serve():
+        socket = listener.accept()
+        socket.send(socket.recv_exact(len(data)))
+        socket.close()
+
+    thread = Thread(target=serve)
+    thread.start()
+    output = asyncio.run(async_client(PORT + 1, data))
+    thread.join()
+    listener.close()
+
+    assert output == data
+
+
+def test_async_listener_should_accept_threaded_socket():
+    data = b"hola" * 1000
+    outputs = []
+
+    def client():
+        socket = SRSocket()
+        socket.connect(("127.0.0.1", PORT + 2))
+        socket.send(data)
+        outputs.append(socket.recv_exact(len(data), timeout=10))
+        socket.close()
+
+    async def main():
+        listener = AsyncRDTListener()
+        await listener.bind(("127.0.0.1", PORT + 2))
+        listener.listen(1)
+        thread = Thread(target=client)
+        thread.start()
+        await echo_once(listener, len(data))
+        await listener.close()
+        await asyncio.to_thread(thread.join)
+
+    asyncio.run(main())
+    assert outputs == [data]
+
+
+def test_async_listener_close_should_not_wait_past_linger():
+    async def main():
+        listener = AsyncRDTListener()
+        await listener.bind(("127.0.0.1", PORT + 3))
+        listener.listen(1)
+        client = AsyncSRSocket()
+        await client.connect(("127.0.0.1", PORT + 3))
+        # La conexión aceptada queda abierta
+        await listener.accept(timeout=5)
+        start = time.monotonic()
+        await listener.close(linger=0.5)
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) < 2
@@ -0,0 +1,50 @@
+import socket
+from lib.mux_demux.batch_receiver import BatchReceiver, BufferPool
+
+
+def fill(pool, data):
+    buffer = pool.reserve()
+    buffer[: len(data)] = data
+    return pool.commit(len(data))
+
+
+def test_pool_should_not_overwrite_handed_out_views():
+    pool = BufferPool(buffer_size=4, slab_size=8, max_slabs=1)
+    views = [fill(pool, bytes([i]) * 4) for i in range(4)]
+
+    assert [bytes(view) for view in views] == [
+        bytes([i]) * 4 for i in range(4)
+    ]
+    # Cada slab tiene lugar para 2 datagramas y se siguen usando los 2
+    # primeros
+    assert pool.slabs_allocated == 2
+    assert views[0].readonly
+
+
+def test_pool_should_reuse_slabs_without_views():
+    pool = BufferPool(buffer_size=4, slab_size=8, max_slabs=1)
+    for i in range(10):
+        assert bytes(fill(pool, bytes([i]) * 4)) == bytes([i]) * 4
+
+    assert pool.slabs_allocated == 1
+
+
+def test_batch_receiver_should_drain_readable_datagrams():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver = BatchReceiver(server, buffer_size=100, max_batch=3)
+    for i in range(5):
+        client.sendto(bytes([i]) * (i + 1), server.getsockname())
+
+    first = receiver.recv_batch(timeout=1)
+    second = receiver.recv_batch(timeout=1)
+    data = [bytes(datagram) for datagram, _ in first + second]
+
+    assert len(first) == 3
+    assert data == [bytes([i]) * (i + 1) for i in range(5)]
+    assert first[0][1][1] == client.getsockname()[1]
+    assert receiver.recv_batch(timeout=0) == []
+    receiver.close()
+    server.close()
+    client.close()
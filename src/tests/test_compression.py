@@ -0,0 +1,120 @@
+import io
+import os
+
+import pytest
+
+from lib.ftp import compression
+from lib.ftp.compression import (
+    LZMA,
+    NONE,
+    ZLIB,
+    compressed_frames,
+    receive_compressed,
+)
+
+
+# Lo que recibe receive_compressed() de un socket: lee de un buffer
+class BytesSocket:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def recv_exact(self, size):
+        return self.stream.read(size)
+
+
+def chunks_of(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("codec", [ZLIB, LZMA])
+def test_frames_should_decompress_to_the_original_data(codec):
+    if not compression.available(codec):
+        pytest.skip("codec not available")
+    data = b"line of a log file\n" * 50000 + os.urandom(1000)
+
+    sent = b"".join(compressed_frames(chunks_of(data, 4096), codec))
+    received = bytearray()
+    receive_compressed(BytesSocket(sent), codec, received.extend, len(data))
+
+    assert received == data
+    assert len(sent) < len(data) / 10
+
+
+def test_truncated_stream_should_raise():
+    sent = b"".join(compressed_frames([b"a" * 100000], ZLIB))
+    # Se saca el último frame con datos y se deja el final
+    frames = []
+    rest = sent
+    while rest:
+        (size,) = compression.FRAME.unpack(rest[:4])
+        frames.append(rest[: 4 + size])
+        rest = rest[4 + size :]
+    truncated = b"".join(frames[:-2]) + frames[-1]
+
+    with pytest.raises(EOFError):
+        receive_compressed(
+            BytesSocket(truncated), ZLIB, lambda data: None, 100000
+        )
+
+
+@pytest.mark.parametrize("codec", [ZLIB, LZMA])
+def test_should_stop_at_the_announced_length(codec, monkeypatch):
+    if not compression.available(codec):
+        pytest.skip("codec not available")
+    monkeypatch.setattr(compression, "CHUNK_SIZE", 4096)
+    # Un solo frame chico que se descomprime a 10 MB
+    sent = b"".join(compressed_frames([bytes(10 * 1024 * 1024)], codec))
+    written = []
+
+    with pytest.raises(ValueError):
+        receive_compressed(
+            BytesSocket(sent), codec, lambda data: written.append(data), 50000
+        )
+    assert sum(map(len, written)) <= 50000
+    assert max(map(len, written)) <= 4096
+
+
+@pytest.mark.parametrize("codec", [ZLIB, LZMA])
+def test_frames_should_not_exceed_max_frame(codec):
+    if not compression.available(codec):
+        pytest.skip("codec not available")
+    # Incompresible y de a un chunk grande: lzma lo devuelve en el flush
+    data = os.urandom(3 * compression.MAX_FRAME)
+
+    sent = b"".join(compressed_frames([data], codec))
+    rest = sent
+    while rest:
+        (size,) = compression.FRAME.unpack(rest[:4])
+        assert size <= compression.MAX_FRAME
+        rest = rest[4 + size :]
+    received = bytearray()
+    receive_compressed(BytesSocket(sent), codec, received.extend, len(data))
+    assert received == data
+
+
+def test_frame_larger_than_max_frame_should_raise():
+    size = compression.MAX_FRAME + 1
+    sent = compression.FRAME.pack(size) + bytes(size)
+
+    with pytest.raises(ValueError):
+        receive_compressed(BytesSocket(sent), ZLIB, lambda data: None, size)
+
+
+def test_closing_the_frames_early_should_stop_the_compressor():
+    frames = compressed_frames(
+        (os.urandom(1024) for _ in range(1000)), ZLIB, level=1
+    )
+    next(frames)
+    frames.close()
+
+
+def test_auto_should_compress_only_compressible_files(tmp_path):
+    text = tmp_path / "log.txt"
+    text.write_bytes(b"GET /index.html 200\n" * 100000)
+    noise = tmp_path / "noise.bin"
+    noise.write_bytes(os.urandom(1024 * 1024))
+
+    assert compression.choose("log.txt", str(text)) == ZLIB
+    assert compression.choose("noise.bin", str(noise)) == NONE
+    assert compression.choose("backup.tar.gz") == NONE
+    assert compression.choose("server.log") == ZLIB
@@ -0,0 +1,245 @@
+import io
+import socket
+import time
+from threading import Event, Thread
+
+from lib.engine.endpoint import Engine
+from lib.engine.event_loop import EventLoop
+from lib.engine.sr_connection import SRConnection, SRProtocol
+from lib.mux_demux.header import encode_header
+from lib.selective_repeat.constants import INITIAL_PACKET_NUMBER
+from lib.selective_repeat.packet import Connect, Info
+from lib.selective_repeat.sr_socket import SRSocket
+import start_server
+from start_server import FileServerProtocol
+
+PORT = 57600
+
+
+class Echo(SRProtocol):
+    def connection_made(self, connection):
+        self.connection = connection
+
+    def data_received(self, data):
+        self.connection.write(data)
+
+    def eof_received(self):
+        self.connection.close()
+
+
+class Collect(SRProtocol):
+    def __init__(self, data):
+        self.data = data
+        self.received = bytearray()
+        self.finished = Event()
+
+    def connection_made(self, connection):
+        self.connection = connection
+        connection.write(self.data)
+
+    def data_received(self, data):
+        self.received += data
+        if len(self.received) == len(self.data):
+            self.connection.close()
+
+    def connection_lost(self, exc):
+        self.exc = exc
+        self.finished.set()
+
+
+def test_event_loop_should_run_timers_in_order():
+    loop = EventLoop()
+    calls = []
+    loop.call_later(0.02, calls.append, 2)
+    loop.call_later(0.01, calls.append, 1)
+    loop.call_later(0.01, calls.append, 0).cancel()
+    loop.call_later(0.03, loop.stop)
+    loop.run_forever()
+    loop.close()
+
+    assert calls == [1, 2]
+
+
+def test_write_should_copy_only_mutable_buffers():
+    loop = EventLoop()
+    connection = SRConnection(loop, lambda *args: None, SRProtocol(), True)
+    data = b"abcdef"
+    mutable = bytearray(b"xy")
+
+    connection.write(memoryview(data))
+    connection.write(mutable)
+    mutable[:] = b"zz"
+
+    # Los bytes (de solo lectura) se encolan sin copiar
+    assert connection.send_queue[0].obj is data
+    assert bytes(connection.send_queue[1]) == b"xy"
+    assert connection.get_write_buffer_size() == 8
+    loop.close()
+
+
+def test_connection_should_end_when_peer_disappears():
+    loop = EventLoop()
+    protocol = Collect(b"")
+    sent = []
+    connection = SRConnection(
+        loop, sent.append, protocol, False, idle_timeout=0.2
+    )
+    connection.accept(Connect())
+    # El primer INFO del cliente y después nada más
+    connection.datagram_received(Info(INITIAL_PACKET_NUMBER).encode())
+    thread = loop.start()
+
+    finished = protocol.finished.wait(timeout=2)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+    assert finished
+    assert isinstance(protocol.exc, TimeoutError)
+    assert connection.is_finished()
+
+
+def test_connection_should_report_only_packets_that_advance_it():
+    loop = EventLoop()
+    connection = SRConnection(loop, lambda *args: None, SRProtocol(), False)
+    connection.accept(Connect())
+
+    first = Info(INITIAL_PACKET_NUMBER).encode()
+    assert connection.datagram_received(first)
+    # Repetido: no avanza
+    assert not connection.datagram_received(first)
+    assert connection.datagram_received(
+        Info(INITIAL_PACKET_NUMBER + 1, b"hola").encode()
+    )
+    loop.close()
+
+
+def test_engine_should_not_migrate_on_a_replayed_packet():
+    loop = EventLoop()
+    engine = Engine(loop)
+    engine.listen(("127.0.0.1", PORT + 3), Echo)
+    thread = loop.start()
+
+    client = SRSocket()
+    client.connect(("127.0.0.1", PORT + 3))
+    client.send(b"hola")
+    assert client.recv_exact(4, timeout=5) == b"hola"
+    (endpoint,) = engine.endpoints
+    connection_id = client.socket.connection_id
+    addr = endpoint.addresses[connection_id]
+
+    # El primer INFO del cliente, repetido desde otra dirección
+    other = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    other.sendto(
+        encode_header(connection_id) + Info(INITIAL_PACKET_NUMBER).encode(),
+        ("127.0.0.1", PORT + 3),
+    )
+    time.sleep(0.2)
+    assert endpoint.addresses[connection_id] == addr
+
+    client.send(b"chau")
+    output = client.recv_exact(4, timeout=5)
+    client.close()
+    other.close()
+
+    loop.call_soon_threadsafe(engine.close)
+    loop.stop()
+    thread.join()
+    loop.close()
+    assert output == b"chau"
+
+
+class Written:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+
+def test_file_server_should_not_finish_a_download_that_came_up_short():
+    before = start_server.stats.snapshot()
+    protocol = FileServerProtocol(".")
+    protocol.connection = Written()
+    protocol.filename = "archivo"
+    protocol.file = io.BytesIO(b"hola")
+    protocol.remaining = 8
+
+    # Pausado no lee nada ni termina
+    protocol.pause_writing()
+    protocol._FileServerProtocol__send_file()
+    assert not protocol.connection.closed
+
+    protocol.resume_writing()
+    after = start_server.stats.snapshot()
+    assert bytes(protocol.connection.data) == b"hola"
+    assert protocol.connection.closed
+    assert after["errors"] == before["errors"] + 1
+    assert after["downloads"] == before["downloads"]
+
+
+def test_engine_should_echo_to_sr_socket():
+    data = b"pls_work" * 20000
+    loop = EventLoop()
+    engine = Engine(loop)
+    engine.listen(("127.0.0.1", PORT), Echo)
+    thread = loop.start()
+
+    client = SRSocket()
+    client.connect(("127.0.0.1", PORT))
+    client.send(data)
+    output = client.recv_exact(len(data), timeout=5)
+    client.close()
+
+    loop.call_soon_threadsafe(engine.close)
+    loop.stop()
+    thread.join()
+    loop.close()
+    assert output == data
+
+
+def test_engine_client_should_talk_to_engine_server():
+    data = bytes(range(256)) * 2000
+    loop = EventLoop()
+    engine = Engine(loop)
+    engine.listen(("127.0.0.1", PORT + 1), Echo)
+    protocol = Collect(data)
+    thread = Thread(target=loop.run_forever)
+    thread.start()
+
+    loop.call_soon_threadsafe(
+        engine.connect, ("127.0.0.1", PORT + 1), protocol
+    )
+    finished = protocol.finished.wait(timeout=30)
+
+    loop.call_soon_threadsafe(engine.close)
+    loop.stop()
+    thread.join()
+    loop.close()
+    assert finished
+    assert protocol.exc is None
+    assert bytes(protocol.received) == data
+
+
+def test_engine_listeners_should_share_port_with_reuse_port():
+    loop = EventLoop()
+    engines = [Engine(loop) for _ in range(2)]
+    for engine in engines:
+        engine.listen(("127.0.0.1", PORT + 2), Echo, reuse_port=True)
+    thread = loop.start()
+
+    client = SRSocket()
+    client.connect(("127.0.0.1", PORT + 2))
+    client.send(b"hola")
+    output = client.recv_exact(4, timeout=5)
+    client.close()
+
+    for engine in engines:
+        loop.call_soon_threadsafe(engine.close)
+    loop.stop()
+    thread.join()
+    loop.close()
+    assert output == b"hola"
@@ -0,0 +1,369 @@
+import queue
+import socket
+import threading
+import time
+
+import pytest
+
+from lib.mux_demux import batch_sender
+from lib.mux_demux.cookie import COOKIE_SIZE, CookieClient, CookieIssuer
+from lib.mux_demux.header import (
+    COOKIE,
+    DATA,
+    ECHO,
+    HEADER,
+    HELLO,
+    encode_header,
+    extract_packet,
+)
+from lib.mux_demux import mux_demux_listener
+from lib.mux_demux.mux_demux_listener import MuxDemuxListener
+from lib.mux_demux.mux_demux_stream import MuxDemuxStream
+from lib.mux_demux.peer_path import PeerPath
+from lib.mux_demux.send_scheduler import SendScheduler
+
+PORT = 57660
+ADDR = ("127.0.0.1", 1234)
+
+
+def test_should_extract_kind_connection_id_and_payload():
+    kind, connection_id, payload = extract_packet(
+        encode_header(1234, ECHO) + b"hola"
+    )
+
+    assert kind == ECHO
+    assert connection_id == 1234
+    assert bytes(payload) == b"hola"
+
+
+def test_should_reject_other_versions_and_short_datagrams():
+    with pytest.raises(ValueError):
+        extract_packet(HEADER.pack(0x10, 1234) + b"hola")
+    with pytest.raises(ValueError):
+        extract_packet(b"\x20")
+
+
+def test_peer_path_should_only_move_to_confirmed_datagrams():
+    old, new = ADDR, ("127.0.0.1", 1235)
+    path = PeerPath(old)
+    path.received_from(old)
+    path.received_from(new)
+    path.confirm(2)
+    assert path.addr == new
+
+    # Un paquete viejo repetido desde la dirección anterior no avanza la
+    # conexión: no se confirma y no vuelve atrás
+    path.received_from(old)
+    path.received_from(new)
+    path.confirm(4)
+    assert path.addr == new
+    path.received_from(new)
+    path.confirm(5)
+    assert path.addr == new
+    assert not path.candidates
+
+
+def test_cookie_should_only_be_valid_for_its_id_and_address():
+    issuer = CookieIssuer()
+    reply, payload = issuer.handle_unknown(HELLO, 7, bytes(COOKIE_SIZE), ADDR)
+    kind, connection_id, cookie = extract_packet(reply)
+
+    assert payload is None
+    assert (kind, connection_id) == (COOKIE, 7)
+    assert issuer.check(7, ADDR, cookie)
+    assert not issuer.check(8, ADDR, cookie)
+    assert not issuer.check(7, ("127.0.0.1", 1235), cookie)
+    assert not issuer.check(7, ADDR, bytes(COOKIE_SIZE))
+
+
+def test_cookie_client_should_hold_datagrams_until_cookie():
+    client = CookieClient(7)
+    issuer = CookieIssuer()
+
+    (hello,) = client.wrap((b"hola",))
+    reply, _ = issuer.handle_unknown(*extract_packet(b"".join(hello)), ADDR)
+    kind, _, cookie = extract_packet(reply)
+    _, pending = client.received(kind, cookie)
+    (echo,) = pending
+    _, payload = issuer.handle_unknown(*extract_packet(b"".join(echo)), ADDR)
+    data, _ = client.received(DATA, b"ok")
+
+    assert bytes(payload) == b"hola"
+    assert data == b"ok"
+    assert client.wrap((b"chau",)) == ((encode_header(7), b"chau"),)
+
+
+def info(size):
+    return (encode_header(0), b"2", bytes(size))
+
+
+def test_scheduler_should_send_control_first_and_share_info():
+    # Un INFO por ronda
+    scheduler = SendScheduler(quantum=len(b"".join(info(100))))
+    for _ in range(3):
+        scheduler.put(info(100), 1)
+    scheduler.put(info(100), 2)
+    scheduler.put(info(100), 2)
+    ack = (encode_header(0), b"3")
+    scheduler.put(ack, 2)
+
+    order = [scheduler.get(timeout=0) for _ in range(6)]
+
+    assert order[0] == (ack, 2)
+    assert [connection_id for _, connection_id in order[1:]] == [
+        1,
+        2,
+        1,
+        2,
+        1,
+    ]
+    with pytest.raises(queue.Empty):
+        scheduler.get(timeout=0)
+
+
+def test_scheduler_should_discard_closed_connections():
+    scheduler = SendScheduler()
+    scheduler.put(info(10), 1)
+    scheduler.put(info(10), 2)
+    scheduler.discard(1)
+
+    assert scheduler.get(timeout=0)[1] == 2
+    with pytest.raises(queue.Empty):
+        scheduler.get(timeout=0)
+
+
+@pytest.mark.parametrize("batched", [True, False])
+def test_sendmmsg_should_send_each_datagram_to_its_address(
+    monkeypatch, batched
+):
+    if not batched:
+        monkeypatch.setattr(batch_sender, "_sendmmsg", None)
+    receivers = []
+    for _ in range(2):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(1)
+        receivers.append(receiver)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    body = memoryview(bytes(range(256)) * 4)
+    # Más que MAX_BATCH, así se hacen varias llamadas
+    messages = [
+        ((b"%03d" % i, body[i:]), receivers[i % 2].getsockname())
+        for i in range(batch_sender.MAX_BATCH + 10)
+    ]
+
+    batch_sender.sendmmsg(sender, messages)
+
+    for i, (buffers, _) in enumerate(messages):
+        data = receivers[i % 2].recv(2048)
+        assert data == b"".join(buffers)
+    for udp_socket in (sender, *receivers):
+        udp_socket.close()
+
+
+def test_sendmmsg_should_resolve_host_names():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = ("localhost", receiver.getsockname()[1])
+
+    batch_sender.sendmmsg(sender, [((b"a",), addr), ((b"b",), addr)])
+
+    assert receiver.recv(10) == b"a"
+    assert receiver.recv(10) == b"b"
+    sender.close()
+    receiver.close()
+
+
+def test_stream_should_resolve_host_name_on_connect():
+    stream = MuxDemuxStream()
+    stream.connect(("localhost", PORT))
+    assert stream.send_addr == ("127.0.0.1", PORT)
+    stream.close()
+
+
+def test_stream_should_drop_foreign_datagrams():
+    server = new_client()
+    server.bind(("127.0.0.1", PORT + 9))
+    stream = MuxDemuxStream()
+    stream.connect(("127.0.0.1", PORT + 9))
+    stream.settimeout(5)
+
+    stream.send(b"hola")
+    _, addr = server.recvfrom(100)
+    server.sendto(b"\x00", addr)
+    server.sendto(encode_header(stream.connection_id ^ 1) + b"otro", addr)
+    # El connection ID correcto desde otro socket
+    other = new_client()
+    other.sendto(encode_header(stream.connection_id) + b"otro", addr)
+    server.sendto(encode_header(stream.connection_id) + b"chau", addr)
+
+    assert stream.recv_exact(4) == b"chau"
+    assert stream.recv_thread_handle.is_alive()
+    stream.close()
+    server.close()
+    other.close()
+
+
+def handshake(udp_socket, connection_id, data, port=PORT):
+    udp_socket.sendto(
+        encode_header(connection_id, HELLO) + bytes(COOKIE_SIZE),
+        ("127.0.0.1", port),
+    )
+    _, _, cookie = extract_packet(udp_socket.recvfrom(100)[0])
+    udp_socket.sendto(
+        encode_header(connection_id, ECHO) + cookie + data,
+        ("127.0.0.1", port),
+    )
+
+
+def new_client():
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(5)
+    return client
+
+
+def test_listener_should_not_allocate_without_cookie():
+    listener = MuxDemuxListener()
+    listener.bind(("127.0.0.1", PORT + 1))
+    listener.listen(1)
+    listener.setblocking(False)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(5)
+
+    client.sendto(encode_header(7) + b"hola", ("127.0.0.1", PORT + 1))
+    client.sendto(
+        encode_header(8, ECHO) + bytes(COOKIE_SIZE) + b"hola",
+        ("127.0.0.1", PORT + 1),
+    )
+    client.sendto(
+        encode_header(9, HELLO) + bytes(COOKIE_SIZE), ("127.0.0.1", PORT + 1)
+    )
+    # Solo se responde el HELLO, después de procesar los anteriores
+    client.recvfrom(100)
+
+    assert listener.accept() is None
+    assert listener.bytestreams == {}
+    listener.close()
+    client.close()
+
+
+def test_listener_should_follow_client_address_change():
+    listener = MuxDemuxListener()
+    listener.bind(("127.0.0.1", PORT))
+    listener.listen(1)
+    listener.settimeout(5)
+    first = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    first.settimeout(5)
+    second = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    second.settimeout(5)
+
+    handshake(first, 7, b"hola")
+    stream = listener.accept()
+    stream.settimeout(5)
+    assert bytes(stream.recv_datagram()) == b"hola"
+
+    # Mismo connection ID desde otro puerto. Recién se le responde ahí
+    # cuando la conexión de arriba confirma que el datagrama la hizo
+    # avanzar
+    second.sendto(encode_header(7) + b"chau", ("127.0.0.1", PORT))
+    assert bytes(stream.recv_datagram()) == b"chau"
+    stream.confirm_path()
+    # Un paquete viejo repetido desde el puerto anterior, que no se
+    # confirma, no la hace volver
+    first.sendto(encode_header(7) + b"hola", ("127.0.0.1", PORT))
+    assert bytes(stream.recv_datagram()) == b"hola"
+    stream.send(b"ok")
+    data, _ = second.recvfrom(100)
+
+    stream.close()
+    listener.close()
+    first.close()
+    second.close()
+    assert data == encode_header(7) + b"ok"
+
+
+def test_listener_should_reap_idle_connections():
+    listener = MuxDemuxListener(idle_timeout=0.1)
+    listener.bind(("127.0.0.1", PORT + 2))
+    listener.listen(1)
+    listener.settimeout(5)
+    client = new_client()
+
+    handshake(client, 7, b"hola", PORT + 2)
+    stream = listener.accept()
+    stream.settimeout(5)
+    assert stream.recv_exact(4) == b"hola"
+    # Despierta al lector al desalojarla, sin esperar el timeout, y el
+    # stream queda terminado
+    start = time.monotonic()
+    with pytest.raises(EOFError):
+        stream.recv_exact(4)
+    elapsed = time.monotonic() - start
+
+    listener.close()
+    client.close()
+    assert elapsed < 3
+    assert listener.bytestreams == {}
+
+
+def test_listener_should_evict_least_recent_when_full(monkeypatch):
+    monkeypatch.setattr(mux_demux_listener, "EVICT_MIN_IDLE", 0)
+    listener = MuxDemuxListener(max_connections=2)
+    listener.bind(("127.0.0.1", PORT + 3))
+    listener.listen(3)
+    listener.settimeout(5)
+    clients = [new_client() for _ in range(3)]
+
+    handshake(clients[0], 1, b"a", PORT + 3)
+    handshake(clients[1], 2, b"b", PORT + 3)
+    streams = [listener.accept(), listener.accept()]
+    clients[0].sendto(encode_header(1) + b"c", ("127.0.0.1", PORT + 3))
+    streams[0].settimeout(5)
+    assert streams[0].recv_exact(2) == b"ac"
+    handshake(clients[2], 3, b"d", PORT + 3)
+    streams.append(listener.accept())
+
+    assert sorted(listener.bytestreams) == [1, 3]
+    for stream in streams:
+        stream.close()
+    listener.close()
+    for client in clients:
+        client.close()
+
+
+def test_listener_close_should_not_wait_for_open_connections():
+    listener = MuxDemuxListener()
+    listener.bind(("127.0.0.1", PORT + 4))
+    listener.listen(1)
+    listener.settimeout(5)
+    client = new_client()
+    handshake(client, 7, b"hola", PORT + 4)
+    assert listener.accept() is not None
+
+    start = time.monotonic()
+    listener.close(linger=0.1)
+    elapsed = time.monotonic() - start
+
+    client.close()
+    assert elapsed < 3
+    assert listener.bytestreams == {}
+
+
+def test_blocking_accept_should_return_none_when_interrupted():
+    listener = MuxDemuxListener()
+    listener.bind(("127.0.0.1", PORT + 5))
+    listener.listen(1)
+    accepted = []
+    accepter = threading.Thread(
+        target=lambda: accepted.append(listener.accept())
+    )
+    accepter.start()
+
+    listener.interrupt_accept()
+    accepter.join(2)
+
+    assert not accepter.is_alive()
+    assert accepted == [None]
+    listener.close()
@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+from lib.ftp import partial_file
+from lib.ftp.partial_file import PartialFile
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    monkeypatch.setattr(partial_file, "SYNC_INTERVAL", 4)
+    return str(tmp_path / "file.bin")
+
+
+def test_should_resume_from_last_synced_offset(path):
+    partial = PartialFile(path, 12)
+    assert partial.open() == 0
+    partial.write(b"abcd")
+    partial.write(b"ef")
+    # Cortado sin close(): lo que no se sincronizó se descarta
+
+    resumed = PartialFile(path, 12)
+    assert PartialFile.saved_offset(path) == 4
+    assert resumed.open() == 4
+    resumed.write(b"efghijkl")
+    assert resumed.complete()
+    resumed.finish()
+
+    with open(path, "rb") as file:
+        assert file.read() == b"abcdefghijkl"
+    assert not os.path.exists(path + partial_file.PART_SUFFIX)
+    assert not os.path.exists(path + partial_file.JOURNAL_SUFFIX)
+
+
+class ShortWrites:
+    def __init__(self, file):
+        self.file = file
+
+    # Escribe como mucho 3 bytes por llamada
+    def write(self, data):
+        return self.file.write(data[:3])
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_should_write_everything_on_short_writes(path):
+    partial = PartialFile(path, 12)
+    partial.open()
+    partial.file = ShortWrites(partial.file)
+    partial.write(b"abcdefgh")
+    partial.write(b"ijkl")
+    assert partial.offset == 12
+    partial.finish()
+
+    with open(path, "rb") as file:
+        assert file.read() == b"abcdefghijkl"
+
+
+def test_should_restart_if_size_changed(path):
+    partial = PartialFile(path, 12)
+    partial.open()
+    partial.write(b"abcdef")
+    partial.close()
+
+    assert PartialFile(path, 12).open() == 6
+    assert PartialFile(path, 20).open() == 0
+
+
+def test_should_restart_if_version_changed(path):
+    partial = PartialFile(path, 12, version=1)
+    partial.open()
+    partial.write(b"abcdef")
+    partial.close()
+
+    assert PartialFile(path, 12, version=1).open() == 6
+    assert PartialFile(path, 12, version=2).open() == 0
+
+
+def test_superseded_transfer_should_not_write(path):
+    old = PartialFile(path, 12)
+    old.open()
+    old.write(b"abcd")
+
+    new = PartialFile(path, 12)
+    assert new.open() == 4
+    with pytest.raises(Exception):
+        old.write(b"xxxx")
+    old.close()
+    new.write(b"efghijkl")
+    new.finish()
+
+    with open(path, "rb") as file:
+        assert file.read() == b"abcdefghijkl"
+    assert not os.path.exists(path + partial_file.JOURNAL_SUFFIX)
+
+
+def test_superseded_transfer_should_not_finish(path):
+    old = PartialFile(path, 4)
+    old.open()
+    old.write(b"abcd")
+
+    new = PartialFile(path, 8)
+    assert new.open() == 0
+    new.write(b"efgh")
+    with pytest.raises(Exception):
+        old.finish()
+    old.close()
+
+    assert not os.path.exists(path)
+    assert os.path.exists(path + partial_file.JOURNAL_SUFFIX)
+    new.write(b"ijkl")
+    new.finish()
+    with open(path, "rb") as file:
+        assert file.read() == b"efghijkl"
+
+
+def test_discard_should_remove_the_part_and_the_journal(path):
+    partial = PartialFile(path, 12)
+    partial.open()
+    partial.write(b"abcdef")
+    partial.close()
+
+    PartialFile.discard(path)
+    assert PartialFile.saved_offset(path) == 0
+    assert not os.path.exists(path + partial_file.PART_SUFFIX)
+    assert not os.path.exists(path + partial_file.JOURNAL_SUFFIX)
+    PartialFile.discard(path)
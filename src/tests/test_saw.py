@@ -5,6 +5,7 @@ import threading
 from loguru import logger
 import pytest
 from lib.stop_and_wait.saw_socket import SAWSocket
+from lib.stop_and_wait.packet import InfoPacket
 
 LISTEN_ADDR = ("127.0.0.1", 1234)
 
@@ -46,6 +47,41 @@ def __client(port, data):
     client.close()
 
 
+def __late_client(port, data):
+    client = SAWSocket()
+    client.connect(("127.0.0.1", port))
+    time.sleep(0.5)
+    client.send(data)
+    client.close()
+
+
+def test_should_drop_info_with_bad_length():
+    port = 57121 + 3
+    data = b"hola"
+    listener = RDTListener(STOP_AND_WAIT)
+    listener.bind(("127.0.0.1", port))
+    listener.listen(1)
+
+    thread = threading.Thread(
+        target=__late_client, args=(port, data), daemon=True
+    )
+    thread.start()
+    stream = listener.accept()
+
+    # Llega un INFO cuyo header anuncia más body del que trae, antes que
+    # los datos del cliente
+    stream.socket.socket.bytestream.put_bytes(
+        bytes(InfoPacket(0, b"hola"))[:-1]
+    )
+
+    # Si el packet handler cortó la conexión, no llega nada
+    stream.settimeout(5)
+    assert stream.recv_exact(len(data)) == data
+    thread.join()
+    stream.close()
+    listener.close()
+
+
 @pytest.mark.slow
 def test_should_receive_data_big_buggy():
     port = 57121 + 2
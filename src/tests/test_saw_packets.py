@@ -1,4 +1,5 @@
 from unittest.mock import Mock
+import pytest
 from lib.stop_and_wait.packet import (
     AckPacket,
     InfoPacket,
@@ -85,3 +86,30 @@ def test_create_connect_packet():
 def test_create_connack_packet():
     packet = ConnackPacket()
     assert packet.type == CONNACK
+
+
+def test_split_info_packets_without_copying():
+    buffer = bytes(range(10))
+    packets = list(InfoPacket.split(4, buffer, initial_number=2**16 - 1))
+    assert [p.number for p in packets] == [2**16 - 1, 0, 1]
+    assert [p.length for p in packets] == [4, 4, 2]
+    assert all(p.body.obj is buffer for p in packets)
+    assert b"".join(packets[0].parts()) == bytes(packets[0])
+    assert bytes(packets[0])[7:] == buffer[:4]
+
+
+def test_should_decode_info_packet_from_datagram():
+    datagram = bytes(InfoPacket(4523, b"hello"))
+    packet = PacketFactory.from_datagram(datagram)
+    assert type(packet) == InfoPacket
+    assert packet.number == 4523
+    assert packet.body == b"hello"
+    assert packet.body.obj is datagram
+    assert type(PacketFactory.from_datagram(bytes(AckPacket(7)))) == AckPacket
+
+
+def test_should_reject_truncated_info_header():
+    with pytest.raises(ValueError):
+        PacketFactory.from_datagram(memoryview(INFO + b"\x00"))
+    with pytest.raises(ValueError):
+        PacketFactory.from_datagram(bytes(InfoPacket(4, b"hello"))[:5])
@@ -0,0 +1,81 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from lib.scheduler import TimerHandle, TimerScheduler, get_scheduler
+
+
+def test_should_run_timers_in_order():
+    scheduler = TimerScheduler()
+    fired = []
+    done = threading.Event()
+
+    scheduler.call_later(0.2, lambda: (fired.append(2), done.set()))
+    scheduler.call_later(0.1, fired.append, 1)
+    scheduler.call_later(0.0, fired.append, 0)
+
+    assert done.wait(2)
+    assert fired == [0, 1, 2]
+
+
+def test_cancelled_timer_should_not_run():
+    scheduler = TimerScheduler()
+    fired = []
+    done = threading.Event()
+
+    timer = scheduler.call_later(0.05, fired.append, "cancelled")
+    scheduler.call_later(0.1, done.set)
+    timer.cancel()
+
+    assert done.wait(2)
+    assert fired == []
+    assert scheduler.pending() == 0
+
+
+def test_cancelled_handle_should_not_be_taken():
+    handle = TimerHandle(0, print, ("hola",))
+    assert handle.take() == (print, ("hola",))
+    assert handle.take() is None
+
+    handle = TimerHandle(0, print, ())
+    handle.cancel()
+    assert handle.take() is None
+
+
+def test_should_use_a_single_thread():
+    scheduler = TimerScheduler()
+    threads = set()
+    done = threading.Event()
+
+    for i in range(100):
+        scheduler.call_later(
+            0.01, lambda: threads.add(threading.current_thread().name)
+        )
+    scheduler.call_later(0.05, done.set)
+
+    assert done.wait(2)
+    assert threads == {scheduler.name}
+
+
+def fire_in_child(results):
+    done = threading.Event()
+    get_scheduler().call_later(0.01, done.set)
+    results.put(done.wait(2))
+
+
+@pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="needs fork",
+)
+def test_default_scheduler_should_run_timers_after_fork():
+    done = threading.Event()
+    get_scheduler().call_later(0, done.set)
+    assert done.wait(2)
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    child = context.Process(target=fire_in_child, args=(results,))
+    child.start()
+    assert results.get(timeout=5)
+    child.join()
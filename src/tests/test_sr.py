@@ -1,11 +1,14 @@
 from time import sleep
 import pytest
 from loguru import logger
+from lib.selective_repeat.packet import INFO
 from lib.selective_repeat.sr_socket import SRSocket, EndOfStream
 from lib.rdt_listener.rdt_listener import RDTListener
 from threading import Thread, Lock
 import filecmp
+import multiprocessing
 import os
+import time
 
 port_lock = Lock()
 port = 57120
@@ -46,6 +49,85 @@ def test_should_receive_data():
     assert output == data
 
 
+def __late_client(port, data):
+    client = SRSocket()
+    client.connect(("127.0.0.1", port))
+    sleep(0.5)
+    client.send(data)
+    client.close()
+
+
+def test_should_drop_truncated_datagrams():
+    port = __get_port()
+    data = b"hola"
+    listener = RDTListener("selective_repeat")
+    listener.bind(("127.0.0.1", port))
+    listener.listen(1)
+
+    thread = Thread(
+        target=__late_client,
+        args=(port, data),
+        name=f"Thread-test-port-{port}",
+        daemon=True,
+    )
+    thread.start()
+    socket = listener.accept()
+
+    # El próximo datagrama que lee el packet handler es un INFO cortado
+    recv_datagram = socket.socket.recv_datagram
+    received = []
+
+    def truncated_first():
+        if not received:
+            received.append(True)
+            return INFO + b"\x00\x00"
+        return recv_datagram()
+
+    socket.socket.recv_datagram = truncated_first
+
+    # Si el packet handler murió, no llega nada (y no se puede cerrar)
+    assert socket.recv_exact(len(data), timeout=5) == data
+    assert received
+    thread.join()
+    socket.close()
+    listener.close()
+
+
+def __vanishing_client(port, data):
+    client = SRSocket()
+    client.connect(("127.0.0.1", port))
+    client.send(data)
+    # Lo mata el test, sin que cierre la conexión
+    sleep(60)
+
+
+def test_recv_should_fail_after_the_listener_reaps_the_connection():
+    port = __get_port()
+    data = b"hola"
+    listener = RDTListener("selective_repeat", idle_timeout=1)
+    listener.bind(("127.0.0.1", port))
+    listener.listen(1)
+
+    client = multiprocessing.get_context("fork").Process(
+        target=__vanishing_client, args=(port, data)
+    )
+    client.start()
+    socket = listener.accept()
+    assert socket.recv_exact(len(data), timeout=5) == data
+    client.kill()
+    client.join()
+
+    start = time.monotonic()
+    # Sin el desalojo el recv() espera hasta el timeout
+    with pytest.raises(EndOfStream):
+        socket.recv(len(data), timeout=5)
+    elapsed = time.monotonic() - start
+    socket.close()
+    listener.close()
+
+    assert elapsed < 5
+
+
 def test_should_receive_data_big():
     port = __get_port()
     data = b"pls_work" * 10000
@@ -1,15 +1,21 @@
 from unittest.mock import Mock
+import pytest
 from lib.selective_repeat.packet import (
     Packet,
     Ack,
     Info,
     Connack,
     Connect,
+    Sack,
     CONNECT,
     CONNACK,
     INFO,
     ACK,
+    SACK,
+    check_ack_policy,
 )
+from lib.selective_repeat.constants import ACK_NUMBERS
+from lib.selective_repeat.sr_socket import SRSocket
 
 
 def test_should_create_connect_packet():
@@ -84,3 +90,132 @@ def test_create_connect_packet():
 def test_create_connack_packet():
     packet = Connack()
     assert packet.type == CONNACK
+
+
+def test_should_create_sack_packet():
+    mock = Mock()
+    mock.recv_exact.side_effect = [
+        SACK,
+        int(41).to_bytes(4, byteorder="big"),
+        int(2).to_bytes(1, byteorder="big"),
+        b"".join(n.to_bytes(4, byteorder="big") for n in (43, 45, 50, 50)),
+        int(8192).to_bytes(4, byteorder="big"),
+    ]
+    packet = Packet.read_from_stream(mock)
+    assert packet.type == SACK
+    assert type(packet) == Sack
+    assert packet.cumulative() == 41
+    assert packet.ranges() == [(43, 45), (50, 50)]
+    assert packet.window() == 8192
+
+
+def test_sack_packet_encoding():
+    packet = Sack(41, [(43, 45), (50, 50)], window=1000)
+    encoded = packet.encode()
+    assert encoded[:1] == SACK
+    assert len(encoded) == 1 + 4 + 1 + 2 * 8 + 4
+
+    mock = Mock()
+    mock.recv_exact.side_effect = [
+        encoded[:1],
+        encoded[1:5],
+        encoded[5:6],
+        encoded[6:22],
+        encoded[22:],
+    ]
+    decoded = Packet.read_from_stream(mock)
+    assert decoded.cumulative() == 41
+    assert decoded.ranges() == [(43, 45), (50, 50)]
+    assert decoded.window() == 1000
+
+
+def test_sack_packet_should_wrap_cumulative_number():
+    packet = Sack(-1)
+    assert packet.cumulative() == ACK_NUMBERS - 1
+    assert packet.ranges() == []
+    assert packet.window() == Sack.MAX_WINDOW
+
+
+def test_connect_packet_should_carry_ack_policy():
+    encoded = Connect(ack_every=8, ack_delay=0.025).encode()
+    mock = Mock()
+    mock.recv_exact.side_effect = [encoded[:1], encoded[1:2], encoded[2:]]
+    packet = Packet.read_from_stream(mock)
+    assert packet.type == CONNECT
+    assert packet.ack_every() == 8
+    assert packet.ack_delay() == 0.025
+    assert packet.ack().type == CONNACK
+
+
+@pytest.mark.parametrize(
+    "ack_every, ack_delay", [(0, 0.01), (256, 0.01), (2, -0.01), (2, 65.536)]
+)
+def test_ack_policy_out_of_the_fields_should_raise(ack_every, ack_delay):
+    with pytest.raises(ValueError):
+        check_ack_policy(ack_every, ack_delay)
+    with pytest.raises(ValueError):
+        SRSocket(ack_every=ack_every, ack_delay=ack_delay)
+
+
+def test_ack_policy_limits_should_be_encodable():
+    check_ack_policy(255, 65.535)
+    assert len(Connect(255, 65.535).encode()) == 4
+
+
+def test_info_from_buffer_should_not_copy_the_buffer():
+    buffer = bytes(range(10))
+    packets = Info.from_buffer(buffer, mtu=4)
+    assert not isinstance(packets, list)
+
+    packets = list(packets)
+    assert [p.number() for p in packets] == [0, 1, 2]
+    assert [bytes(p.body()) for p in packets] == [
+        buffer[0:4],
+        buffer[4:8],
+        buffer[8:10],
+    ]
+    assert all(p.body().obj is buffer for p in packets)
+
+
+def test_info_encode_parts_should_match_encode():
+    packet = Info(7, memoryview(b"hello"))
+    header, body = packet.encode_parts()
+    assert header == INFO + (5).to_bytes(2, "big") + (7).to_bytes(4, "big")
+    assert body.obj == b"hello"
+    assert packet.encode() == header + b"hello"
+
+
+def test_should_decode_info_from_datagram_without_copying():
+    datagram = Info(9, b"payload").encode()
+    packet = Packet.from_datagram(datagram)
+    assert type(packet) == Info
+    assert packet.number() == 9
+    assert isinstance(packet.body(), memoryview)
+    assert packet.body().obj is datagram
+    assert packet.body() == b"payload"
+
+
+def test_should_decode_control_packets_from_datagram():
+    sack = Packet.from_datagram(Sack(3, [(5, 6)], window=100).encode())
+    assert (sack.cumulative(), sack.ranges(), sack.window()) == (
+        3,
+        [(5, 6)],
+        100,
+    )
+    assert Packet.from_datagram(Connect(4, 0.02).encode()).ack_every() == 4
+    assert Packet.from_datagram(Ack(12).encode()).number() == 12
+
+
+def test_should_reject_truncated_datagrams():
+    datagram = Info(9, b"payload").encode()
+    with pytest.raises(ValueError):
+        Packet.from_datagram(datagram[:-1])
+    with pytest.raises(ValueError):
+        Packet.from_datagram(Sack(3, [(5, 6)]).encode()[:-2])
+
+
+def test_should_reject_truncated_info_header():
+    with pytest.raises(ValueError):
+        Packet.from_datagram(memoryview(INFO + b"\x00"))
+    with pytest.raises(ValueError):
+        Packet.from_datagram(Info(9, b"payload").encode()[:5])
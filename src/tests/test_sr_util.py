@@ -0,0 +1,304 @@
+from unittest.mock import Mock
+import time
+import pytest
+from lib.selective_repeat.congestion import (
+    CONGESTION_CONTROLS,
+    Reno,
+    new_congestion_control,
+)
+from lib.selective_repeat.constants import (
+    ACK_RETRIES,
+    MIN_CWND,
+    ZERO_WINDOW_PROBE_INTERVAL,
+)
+from lib.selective_repeat.packet import Info, Packet
+from lib.selective_repeat.util import (
+    AckNumberProvider,
+    AckRegister,
+    BlockAcker,
+    RTTEstimator,
+)
+from lib.utils import MTByteStream
+
+
+class BytesReader:
+    def __init__(self, data):
+        self.data = data
+
+    def recv_exact(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+class ManualScheduler:
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback, *args):
+        timer = Mock()
+        self.timers.append((timer, callback, args))
+        return timer
+
+    def run_all(self):
+        timers, self.timers = self.timers, []
+        for timer, callback, args in timers:
+            if not timer.cancel.called:
+                callback(*args)
+
+
+def test_rtt_estimator_should_use_initial_rto_without_samples():
+    estimator = RTTEstimator(initial_rto=1.5)
+    assert estimator.srtt() is None
+    assert estimator.rto() == 1.5
+
+
+def test_rtt_estimator_first_sample():
+    estimator = RTTEstimator(min_rto=0, max_rto=60)
+    estimator.sample(0.4)
+    assert estimator.srtt() == 0.4
+    # RTO = SRTT + 4 * RTTVAR, con RTTVAR = R / 2
+    assert abs(estimator.rto() - 1.2) < 1e-9
+
+
+def test_rtt_estimator_should_converge_to_low_rtt():
+    estimator = RTTEstimator(initial_rto=1.5, min_rto=0.1)
+    for _ in range(50):
+        estimator.sample(0.001)
+    assert estimator.rto() == 0.1
+    assert abs(estimator.srtt() - 0.001) < 1e-6
+
+
+def test_rtt_estimator_backoff_is_exponential_and_bounded():
+    estimator = RTTEstimator(initial_rto=0.5, max_rto=3, max_backoff=60)
+    assert estimator.timeout(0) == 0.5
+    assert estimator.timeout(1) == 1
+    assert estimator.timeout(2) == 2
+    # max_rto solo acota la estimación
+    assert estimator.timeout(3) == 4
+    assert estimator.timeout(10) == 60
+
+
+def test_rtt_estimator_default_backoff_should_reach_a_minute():
+    estimator = RTTEstimator()
+    assert estimator.timeout(ACK_RETRIES) >= 60
+
+
+def test_number_provider_should_respect_window_size():
+    provider = AckNumberProvider(window_size=3)
+    assert [provider.get(timeout=0) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(TimeoutError):
+        provider.get(timeout=0)
+
+    # Reconocer un paquete que no es el más viejo no mueve la window
+    assert provider.push(1)
+    with pytest.raises(TimeoutError):
+        provider.get(timeout=0)
+
+    assert provider.push(0)
+    assert [provider.get(timeout=0) for _ in range(2)] == [3, 4]
+
+
+def test_number_provider_should_ignore_acks_out_of_window():
+    provider = AckNumberProvider(window_size=3)
+    provider.get(timeout=0)
+    assert not provider.push(2)
+    assert provider.push(0)
+    assert not provider.push(0)
+
+
+def test_number_provider_should_respect_congestion_window():
+    provider = AckNumberProvider(window_size=100, congestion_control=Reno(2))
+    provider.get(timeout=0)
+    provider.get(timeout=0)
+    with pytest.raises(TimeoutError):
+        provider.get(timeout=0)
+
+    # Slow start: cada ACK agranda la ventana en un paquete
+    provider.push(0)
+    assert provider.get(timeout=0) == 2
+    assert provider.get(timeout=0) == 3
+
+
+def test_number_provider_should_react_once_per_window():
+    reno = Reno(8)
+    provider = AckNumberProvider(window_size=100, congestion_control=reno)
+    for _ in range(8):
+        provider.get(timeout=0)
+
+    provider.lost(0)
+    provider.lost(3)
+    assert reno.ssthresh == 4
+    assert reno.cwnd == MIN_CWND
+
+
+@pytest.mark.parametrize("name", list(CONGESTION_CONTROLS))
+def test_congestion_controls_should_grow_and_shrink(name):
+    cc = new_congestion_control(name)
+    initial = cc.window()
+    for _ in range(100):
+        cc.on_ack(1, 0.01)
+    assert cc.window() >= initial
+
+    cc.on_timeout()
+    assert cc.window() <= initial
+
+
+def test_unknown_congestion_control_should_be_rejected():
+    with pytest.raises(ValueError):
+        new_congestion_control("vegas")
+
+
+def test_number_provider_unacked_covered_by_sack():
+    provider = AckNumberProvider(window_size=10)
+    for _ in range(8):
+        provider.get(timeout=0)
+    provider.push(5)
+
+    assert provider.unacked_covered_by(1, [(4, 6)]) == [0, 1, 4, 6]
+    # Rangos ya reconocidos o fuera de la window se ignoran
+    assert provider.unacked_covered_by(-1, [(9, 12)]) == []
+
+
+def test_block_acker_should_send_sack_ranges():
+    sent = []
+    upstream = MTByteStream()
+    acker = BlockAcker(sent.append, upstream)
+
+    for number in (0, 2, 3, 6, 5):
+        acker.received(Info(number, bytes([number])))
+
+    sack = Packet.read_from_stream(BytesReader(sent[-1]))
+    assert sack.cumulative() == 0
+    assert sack.ranges() == [(5, 6), (2, 3)]
+
+    acker.received(Info(1, b"\x01"))
+    assert upstream.get_bytes(4) == bytes([0, 1, 2, 3])
+
+
+def test_block_acker_should_delay_in_order_acks():
+    sent = []
+    scheduler = ManualScheduler()
+    acker = BlockAcker(
+        sent.append, MTByteStream(), ack_every=3, scheduler=scheduler
+    )
+
+    # El primer paquete se reconoce inmediatamente
+    acker.received(Info(0, b"a"))
+    assert len(sent) == 1
+
+    acker.received(Info(1, b"b"))
+    acker.received(Info(2, b"c"))
+    assert len(sent) == 1
+    acker.received(Info(3, b"d"))
+    assert len(sent) == 2
+    assert Packet.read_from_stream(BytesReader(sent[-1])).cumulative() == 3
+
+    # Si no llegan ack_every paquetes, se reconocen al vencer el timer
+    acker.received(Info(4, b"e"))
+    assert len(sent) == 2
+    scheduler.run_all()
+    assert len(sent) == 3
+    assert Packet.read_from_stream(BytesReader(sent[-1])).cumulative() == 4
+
+
+def test_block_acker_should_ack_gaps_immediately():
+    sent = []
+    acker = BlockAcker(
+        sent.append, MTByteStream(), ack_every=10, scheduler=ManualScheduler()
+    )
+    acker.received(Info(0, b"a"))
+    acker.received(Info(2, b"c"))
+    assert len(sent) == 2
+    # Llenar el hueco también se reconoce en el momento
+    acker.received(Info(1, b"b"))
+    assert len(sent) == 3
+    # Y los repetidos
+    acker.received(Info(1, b"b"))
+    assert len(sent) == 4
+
+
+def test_ack_register_should_detect_lost_after_dupthresh():
+    register = AckRegister()
+    for number in range(5):
+        register.add_pending(Info(number, b"x"))
+    register.acknowledge_many([1, 2])
+    delivered = max(p.sent_at for p in register.acknowledge_many([3]))
+
+    # Solo 0 tiene DUPTHRESH paquetes posteriores reconocidos; 4 se envió
+    # después del último reconocido
+    lost = register.detect_lost(delivered, 3, max_age=60)
+    assert [p.packet.number() for p in lost] == [0]
+
+
+def test_ack_register_should_detect_lost_by_time():
+    register = AckRegister()
+    for number in range(3):
+        register.add_pending(Info(number, b"x"))
+    delivered = max(p.sent_at for p in register.acknowledge_many([2]))
+
+    assert register.detect_lost(delivered, 2, max_age=60) == []
+    lost = register.detect_lost(delivered, 2, max_age=0)
+    assert [p.packet.number() for p in lost] == [0, 1]
+
+
+def test_number_provider_should_respect_peer_window():
+    provider = AckNumberProvider(window_size=100)
+    provider.set_peer_window(-1, 2)
+    assert [provider.get(timeout=0) for _ in range(2)] == [0, 1]
+    with pytest.raises(TimeoutError):
+        provider.get(timeout=0)
+
+    # Un SACK viejo no achica la ventana
+    provider.set_peer_window(-1, 0)
+    provider.set_peer_window(1, 1)
+    assert provider.get(timeout=0) == 2
+
+
+def test_number_provider_should_probe_closed_peer_window():
+    provider = AckNumberProvider(window_size=100)
+    provider.set_peer_window(-1, 0)
+
+    start = time.monotonic()
+    assert provider.get(timeout=2 * ZERO_WINDOW_PROBE_INTERVAL) == 0
+    assert time.monotonic() - start >= ZERO_WINDOW_PROBE_INTERVAL
+
+
+def test_block_acker_should_advertise_and_cap_buffered_bytes():
+    sent = []
+    upstream = MTByteStream()
+    acker = BlockAcker(sent.append, upstream, ack_every=1, recv_buffer_size=10)
+
+    acker.received(Info(0, b"abcd"))
+    acker.received(Info(2, b"efgh"))
+    # La ventana se cuenta desde el último recibido en orden, el bloque
+    # fuera de orden cae dentro de ella
+    assert Packet.read_from_stream(BytesReader(sent[-1])).window() == 6
+    assert acker.buffered() == 8
+
+    # No entra: se descarta pero se reconoce igual
+    acker.received(Info(1, b"ijkl"))
+    assert acker.infos_dropped == 1
+    assert Packet.read_from_stream(BytesReader(sent[-1])).cumulative() == 0
+
+    # Al leer la aplicación se avisa la ventana nueva
+    upstream.get_bytes(4)
+    acker.window_update()
+    assert Packet.read_from_stream(BytesReader(sent[-1])).window() == 10
+    acker.received(Info(1, b"ijkl"))
+    assert upstream.get_bytes(8) == b"ijklefgh"
+
+
+def test_block_acker_should_not_keep_views_of_the_datagram():
+    upstream = MTByteStream()
+    acker = BlockAcker(lambda _: None, upstream)
+    datagram = bytearray(b"abcdefgh")
+    view = memoryview(datagram)
+
+    acker.received(Info(0, view[:4]))
+    acker.received(Info(2, view[4:6]))
+    # Si se guardara una vista, no se podría liberar el buffer
+    view.release()
+    datagram.extend(b"ij")
+
+    acker.received(Info(1, b"xy"))
+    assert upstream.get_bytes(8) == b"abcdxyef"
@@ -0,0 +1,137 @@
+import mmap
+import socket
+import tempfile
+import threading
+import time
+import pytest
+from lib.utils import MTByteStream, stable_buffer
+
+
+def put_later(stream, delay, data):
+    timer = threading.Timer(delay, stream.put_bytes, (data,))
+    timer.start()
+    return timer
+
+
+def test_bytestream_should_wake_reader_when_data_arrives():
+    stream = MTByteStream()
+    put_later(stream, 0.05, b"abcd")
+
+    start = time.monotonic()
+    assert stream.get_bytes(4, timeout=5) == b"abcd"
+    assert time.monotonic() - start < 1
+
+
+def test_bytestream_should_join_chunks_and_keep_the_rest():
+    stream = MTByteStream()
+    stream.put_bytes(b"abc")
+    stream.put_bytes(memoryview(b"defgh"))
+
+    assert stream.get_bytes(5) == b"abcde"
+    assert stream.buffered() == 3
+    assert bytes(stream.get_chunk()) == b"fgh"
+    assert stream.empty()
+
+
+def test_bytestream_timeout_should_be_total_time_of_the_read():
+    stream = MTByteStream()
+    # Llegan datos antes del timeout, pero no alcanzan
+    put_later(stream, 0.1, b"ab")
+    put_later(stream, 0.2, b"cd")
+
+    start = time.monotonic()
+    assert stream.get_bytes(10, timeout=0.3) == b"abcd"
+    assert 0.3 <= time.monotonic() - start < 0.5
+
+
+def test_bytestream_should_raise_timeout_without_data():
+    stream = MTByteStream()
+
+    start = time.monotonic()
+    with pytest.raises(socket.timeout):
+        stream.get_chunk(timeout=0.2)
+    assert 0.2 <= time.monotonic() - start < 0.4
+    with pytest.raises(socket.timeout):
+        stream.get_bytes(1, block=False)
+
+
+def test_bytestream_interrupt_should_wake_waiting_reader():
+    stream = MTByteStream()
+    threading.Timer(0.05, stream.interrupt).start()
+
+    start = time.monotonic()
+    with pytest.raises(socket.timeout):
+        stream.get_chunk(timeout=5)
+    assert time.monotonic() - start < 1
+    # Solo afecta a quien estaba esperando
+    put_later(stream, 0.05, b"abcd")
+    assert stream.get_bytes(4, timeout=5) == b"abcd"
+
+
+def test_closed_bytestream_should_raise_after_the_buffered_data():
+    stream = MTByteStream()
+    stream.put_bytes(b"ab")
+    threading.Timer(0.05, stream.close).start()
+
+    start = time.monotonic()
+    assert stream.get_bytes(4, timeout=5) == b"ab"
+    assert time.monotonic() - start < 1
+    with pytest.raises(EOFError):
+        stream.get_bytes(1, timeout=5)
+    with pytest.raises(EOFError):
+        stream.get_chunk(timeout=5)
+
+
+def test_bytestream_readinto_should_fill_buffer_across_chunks():
+    stream = MTByteStream()
+    stream.put_bytes(b"abc")
+    stream.put_bytes(bytearray(b"defg"))
+    buffer = bytearray(5)
+
+    assert stream.readinto(buffer) == 5
+    assert buffer == b"abcde"
+    assert stream.readinto(buffer, timeout=0.1) == 2
+    assert buffer[:2] == b"fg"
+
+
+def test_bytestream_peek_should_not_consume():
+    stream = MTByteStream()
+    stream.put_bytes(b"abc")
+    stream.put_bytes(b"def")
+    stream.get_bytes(2)
+
+    assert stream.peek(3) == b"cde"
+    assert stream.peek(10) == b"cdef"
+    assert stream.get_bytes(4) == b"cdef"
+    assert stream.peek(1) == b""
+
+
+def test_bytestream_should_count_bytes_of_any_buffer():
+    stream = MTByteStream()
+    stream.put_bytes(memoryview(bytes(8)).cast("I"))
+    stream.put_bytes(b"")
+
+    assert stream.buffered() == 8
+    stream.get_bytes(3)
+    assert stream.buffered() == 5
+    assert len(stream.get_chunk()) == 5
+    assert stream.empty()
+
+
+def test_stable_buffer_should_only_copy_mutable_buffers():
+    data = b"hola"
+    mutable = bytearray(data)
+    with tempfile.TemporaryFile() as file:
+        file.write(data)
+        file.flush()
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+
+        assert stable_buffer(data) is data
+        assert stable_buffer(view).obj is mapping
+        copy = stable_buffer(mutable)
+        mutable[0] = 0
+        assert copy == data
+
+        view.release()
+        mapping.close()
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from lib.ftp.worker_pool import WorkerPool
+
+
+def test_should_reject_jobs_when_queue_is_full():
+    pool = WorkerPool(1, 1)
+    release = threading.Event()
+    started = threading.Event()
+
+    assert pool.submit(lambda: (started.set(), release.wait(2)))
+    assert started.wait(2)
+    assert pool.submit(release.wait, 2)
+    assert not pool.submit(release.wait, 2)
+
+    release.set()
+    pool.shutdown()
+    stats = pool.stats()
+    assert stats["submitted"] == 2
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+    assert stats["peak_busy"] == 1
+
+
+def test_should_finish_queued_jobs_and_count_failures_on_shutdown():
+    pool = WorkerPool(2, 10)
+    done = []
+
+    def fail():
+        raise ValueError("falla")
+
+    for i in range(5):
+        assert pool.submit(done.append, i)
+    assert pool.submit(fail)
+    pool.shutdown()
+
+    assert sorted(done) == list(range(5))
+    assert pool.stats()["completed"] == 5
+    assert pool.stats()["failed"] == 1
+
+
+def test_shutdown_should_not_wait_past_timeout():
+    pool = WorkerPool(1, 1)
+    release = threading.Event()
+    assert pool.submit(release.wait, 5)
+
+    start = time.monotonic()
+    assert not pool.shutdown(timeout=0.2)
+    assert time.monotonic() - start < 1
+    release.set()
+
+
+def test_shutdown_should_not_wait_past_timeout_with_a_full_queue():
+    pool = WorkerPool(1, 1)
+    release = threading.Event()
+    started = threading.Event()
+    assert pool.submit(lambda: (started.set(), release.wait(5)))
+    assert started.wait(2)
+    assert pool.submit(release.wait, 5)
+
+    start = time.monotonic()
+    assert not pool.shutdown(timeout=0.5)
+    assert time.monotonic() - start < 1
+
+    release.set()
+    assert pool.shutdown(timeout=2)
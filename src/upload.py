@@ -1,5 +1,7 @@
 import os
+from lib.ftp import compression
 from lib.ftp.args_client import args_client
+from lib.ftp.partial_file import file_version
 from lib.selective_repeat.sr_socket import SRSocket
 from lib.rdt_listener.rdt_listener import SELECTIVE_REPEAT, STOP_AND_WAIT
 from lib.stop_and_wait.saw_socket import SAWSocket
@@ -11,9 +13,16 @@ ENDIANESS = "little"
 BYTES_READ = 60000
 UPLOAD_SUCCESSFUL_HEADER = 3
 ERROR_HEADER = 4
+# Respuesta al pedido con el offset desde el que hay que mandar el archivo
+# y el codec con el que hay que mandarlo
+RESUME_OFFSET_HEADER = 7
 UNKNOWN_TYPE_ERROR = 0
 FILE_NOT_FOUND_ERROR = 1
-TYPE = b"\x00"
+# Subida que sigue desde lo que el servidor ya tiene de una anterior
+TYPE = b"\x05"
+# Veces que se intenta la subida. Si se corta se reconecta y se sigue
+# desde lo que le llegó al servidor
+ATTEMPTS = 3
 
 
 def upload(
@@ -24,21 +33,26 @@ def upload(
     endianess,
     bytes_read,
     method=SELECTIVE_REPEAT,
+    codec="none",
+    level=compression.DEFAULT_LEVEL,
 ):
     logger.debug("arguments read")
 
     logger.debug("getting file size")
 
     try:
-        SIZE_INT = os.path.getsize(os.path.join(filepath, filename))
+        STAT = os.stat(os.path.join(filepath, filename))
     except Exception:
         logger.error("no file found")
         return
 
     logger.debug("file size accessed successfully")
 
+    SIZE_INT = STAT.st_size
     SIZE = SIZE_INT.to_bytes(8, byteorder=endianess)
     logger.debug(f"file length: {str(SIZE_INT)}")
+    # Para que el servidor no siga una subida anterior de otro archivo
+    VERSION = file_version(STAT).to_bytes(8, byteorder=endianess)
 
     FILENAME_BYTES = filename.encode()
 
@@ -46,7 +60,39 @@ def upload(
     logger.debug(f"filename length: {str(len(FILENAME_BYTES))}")
 
     ADDR = (host, int(port))
+    CODEC = compression.select(
+        codec, filename, os.path.join(filepath, filename)
+    )
+    logger.debug(f"requested codec: {CODEC}")
+    header = (
+        TYPE
+        + SIZE
+        + VERSION
+        + bytes((CODEC, level))
+        + FILENAME_LEN
+        + FILENAME_BYTES
+    )
 
+    for attempt in range(ATTEMPTS):
+        try:
+            upload_from_offset(
+                ADDR,
+                header,
+                os.path.join(filepath, filename),
+                endianess,
+                bytes_read,
+                method,
+                level,
+            )
+            return
+        except Exception as e:
+            logger.warning(f"upload interrupted (attempt {attempt}): {e}")
+    logger.error("upload failed")
+
+
+def upload_from_offset(
+    addr, header, path, endianess, bytes_read, method, level
+):
     logger.info("creating socket")
     if method == SELECTIVE_REPEAT:
         client = SRSocket()
@@ -56,32 +102,53 @@ def upload(
         raise Exception("Invalid transport method")
 
     logger.info("conecting to server")
-    client.connect(ADDR)
-
-    logger.info("sending message")
-    logger.debug("sending header")
-    # send header
-    client.send(TYPE + SIZE + FILENAME_LEN + FILENAME_BYTES)
+    client.connect(addr)
 
-    logger.debug("sending body")
-    # send body
-    with open(os.path.join(filepath, filename), "rb") as f:
-        while file_bytes := f.read(bytes_read):
-            client.send(file_bytes)
-
-    logger.info("reading response")
-    response_byte = client.recv(1)
-    response = int.from_bytes(response_byte, byteorder=endianess)
-
-    if response == UPLOAD_SUCCESSFUL_HEADER:
-        logger.info("successfull upload")
-    elif response == ERROR_HEADER:
-        error_byte = client.recv(1)
-        error = int.from_bytes(error_byte, byteorder=endianess)
-        logger.error(f"server responeded with error {error}")
-
-    logger.info("closing socket")
-    client.close()
+    try:
+        logger.info("sending message")
+        logger.debug("sending header")
+        # send header
+        client.send(header)
+
+        response_byte = client.recv_exact(1)
+        response = int.from_bytes(response_byte, byteorder=endianess)
+        if response == RESUME_OFFSET_HEADER:
+            offset = int.from_bytes(client.recv_exact(8), byteorder=endianess)
+            if offset:
+                logger.info(f"resuming upload from byte {offset}")
+            codec = client.recv_exact(1)[0]
+            logger.debug(f"codec: {codec}")
+
+            logger.debug("sending body")
+            # send body
+            if codec != compression.NONE:
+                chunks = compression.read_chunks(
+                    path, offset, os.path.getsize(path) - offset
+                )
+                for frame in compression.compressed_frames(
+                    chunks, codec, level
+                ):
+                    client.send(frame)
+            else:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    while file_bytes := f.read(bytes_read):
+                        client.send(file_bytes)
+
+            logger.info("reading response")
+            response_byte = client.recv_exact(1)
+            response = int.from_bytes(response_byte, byteorder=endianess)
+
+        if response == UPLOAD_SUCCESSFUL_HEADER:
+            logger.info("successfull upload")
+        elif response == ERROR_HEADER:
+            error_byte = client.recv(1)
+            error = int.from_bytes(error_byte, byteorder=endianess)
+            logger.error(f"server responeded with error {error}")
+    finally:
+        # También si se cortó, para liberar la conexión
+        logger.info("closing socket")
+        client.close()
 
 
 if __name__ == "__main__":
@@ -110,6 +177,8 @@ if __name__ == "__main__":
         ENDIANESS,
         BYTES_READ,
         method="selective_repeat",
+        codec=args.compression,
+        level=args.level,
     )
     stop = time.time()
     logger.info(f"Upload time: {stop - start}")